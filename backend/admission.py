@@ -0,0 +1,220 @@
+import os
+import math
+import time
+import bisect
+import asyncio
+import threading
+import functools
+from fastapi import HTTPException
+
+# Priorities (lower runs first)
+INTERACTIVE = 0
+STANDARD = 5
+BATCH = 10
+
+# Configuration (env)
+ADMISSION_MAX_CONCURRENT = int(os.environ.get("ADMISSION_MAX_CONCURRENT", max(2, os.cpu_count() or 2)))
+# Max queued requests; beyond it new ones are rejected at once. Sync endpoints wait on a
+# threadpool thread (anyio's pool has 40), so queue + in-flight must stay below that or
+# queued requests starve every other sync endpoint of threads.
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", max(4, 32 - ADMISSION_MAX_CONCURRENT)))
+
+# Per-endpoint concurrency caps (endpoints not listed are only bound by the global limit)
+ENDPOINT_LIMITS = {
+    "analyze_ticker": 8,
+    "evaluate_pattern": 8,
+    "seasonality_trend": 8,
+    "cycle_scan": 4,
+    "term_structure": 4,
+    "risk_analysis": 2,
+    "monte_carlo": 2,
+    "screener": int(os.environ.get("ADMISSION_SCREENER_LIMIT", 1)),
+}
+
+# Max time a request may wait in the queue before it is rejected (seconds)
+LATENCY_BUDGETS = {
+    INTERACTIVE: float(os.environ.get("ADMISSION_BUDGET_INTERACTIVE", 5)),
+    STANDARD: float(os.environ.get("ADMISSION_BUDGET_STANDARD", 15)),
+    BATCH: float(os.environ.get("ADMISSION_BUDGET_BATCH", 30)),
+}
+
+EWMA_ALPHA = 0.2  # Smoothing for the service time estimate
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, endpoint, retry_after, reason):
+        super().__init__(f"{endpoint}: {reason}")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Global concurrency gate with per-endpoint caps and a priority queue.
+    A waiter runs once it is the best-ranked (priority, arrival) waiter whose
+    endpoint still has capacity, so interactive requests overtake queued batch work.
+    """
+
+    def __init__(self, max_concurrent=ADMISSION_MAX_CONCURRENT, limits=None, budgets=None,
+                 max_queue=ADMISSION_MAX_QUEUE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.limits = dict(ENDPOINT_LIMITS if limits is None else limits)
+        self.budgets = dict(LATENCY_BUDGETS if budgets is None else budgets)
+        self._cond = threading.Condition()
+        self._waiters = []       # sorted list of (priority, seq, endpoint)
+        self._seq = 0
+        self._total_inflight = 0
+        self._inflight = {}
+        self._stats = {}
+
+    def _stat(self, endpoint):
+        if endpoint not in self._stats:
+            self._stats[endpoint] = {
+                "admitted": 0,
+                "rejected": 0,
+                "wait_seconds_total": 0.0,
+                "wait_seconds_max": 0.0,
+                "avg_service_seconds": None,
+            }
+        return self._stats[endpoint]
+
+    def _has_capacity(self, endpoint):
+        if self._total_inflight >= self.max_concurrent:
+            return False
+        limit = self.limits.get(endpoint)
+        return limit is None or self._inflight.get(endpoint, 0) < limit
+
+    def _is_next(self, waiter):
+        # First waiter (in priority order) that could run now
+        for w in self._waiters:
+            if self._has_capacity(w[2]):
+                return w == waiter
+        return False
+
+    def _estimate_wait(self, endpoint, priority):
+        """Rough queue wait: work ahead of us divided by the slots that can serve it."""
+        service = self._stat(endpoint)["avg_service_seconds"]
+        if service is None:
+            return 0.0
+        ahead = sum(1 for w in self._waiters if w[0] <= priority)
+        slots = min(self.max_concurrent, self.limits.get(endpoint, self.max_concurrent))
+        return service * math.ceil(ahead / max(slots, 1))
+
+    def acquire(self, endpoint, priority=INTERACTIVE):
+        """Blocks until admitted; returns seconds waited or raises AdmissionRejected."""
+        budget = self.budgets.get(priority, LATENCY_BUDGETS[STANDARD])
+        t0 = time.time()
+        with self._cond:
+            stat = self._stat(endpoint)
+            if len(self._waiters) >= self.max_queue and not self._has_capacity(endpoint):
+                stat["rejected"] += 1
+                retry = stat["avg_service_seconds"] or 1
+                raise AdmissionRejected(endpoint, max(1, math.ceil(retry)), "queue full")
+            self._seq += 1
+            waiter = (priority, self._seq, endpoint)
+            bisect.insort(self._waiters, waiter)
+            try:
+                if not self._is_next(waiter):
+                    # Fast reject if the queue is already longer than the budget allows
+                    estimate = self._estimate_wait(endpoint, priority)
+                    if estimate > budget:
+                        stat["rejected"] += 1
+                        raise AdmissionRejected(endpoint, max(1, math.ceil(estimate)), "queue over latency budget")
+
+                while not self._is_next(waiter):
+                    remaining = budget - (time.time() - t0)
+                    if remaining <= 0:
+                        stat["rejected"] += 1
+                        retry = stat["avg_service_seconds"] or budget
+                        raise AdmissionRejected(endpoint, max(1, math.ceil(retry)), "timed out in queue")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiters.remove(waiter)
+                # Our leaving may unblock someone else
+                self._cond.notify_all()
+
+            waited = time.time() - t0
+            self._admit(endpoint, stat, waited)
+            return waited
+
+    def _admit(self, endpoint, stat, waited):
+        self._total_inflight += 1
+        self._inflight[endpoint] = self._inflight.get(endpoint, 0) + 1
+        stat["admitted"] += 1
+        stat["wait_seconds_total"] += waited
+        stat["wait_seconds_max"] = max(stat["wait_seconds_max"], waited)
+
+    def release(self, endpoint, service_seconds):
+        with self._cond:
+            self._total_inflight -= 1
+            self._inflight[endpoint] -= 1
+            stat = self._stat(endpoint)
+            prev = stat["avg_service_seconds"]
+            stat["avg_service_seconds"] = service_seconds if prev is None else (1 - EWMA_ALPHA) * prev + EWMA_ALPHA * service_seconds
+            self._cond.notify_all()
+
+    def metrics(self):
+        with self._cond:
+            queued = {}
+            for _, _, ep in self._waiters:
+                queued[ep] = queued.get(ep, 0) + 1
+            endpoints = {}
+            for ep, stat in self._stats.items():
+                row = dict(stat)
+                row["in_flight"] = self._inflight.get(ep, 0)
+                row["queued"] = queued.get(ep, 0)
+                row["limit"] = self.limits.get(ep)
+                row["avg_wait_seconds"] = stat["wait_seconds_total"] / stat["admitted"] if stat["admitted"] else 0.0
+                endpoints[ep] = row
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "in_flight": self._total_inflight,
+                "queue_depth": len(self._waiters),
+                "endpoints": endpoints
+            }
+
+
+CONTROLLER = AdmissionController()
+
+
+def admission_controlled(endpoint, priority=INTERACTIVE):
+    """Decorator for FastAPI endpoints: queue by priority, reject with 503 + Retry-After."""
+    def reject(e):
+        return HTTPException(
+            status_code=503,
+            detail=f"Server busy ({e.reason}), please retry.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    # Waiting blocks, keep it off the event loop
+                    await asyncio.to_thread(CONTROLLER.acquire, endpoint, priority)
+                except AdmissionRejected as e:
+                    raise reject(e)
+                t0 = time.time()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    CONTROLLER.release(endpoint, time.time() - t0)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                CONTROLLER.acquire(endpoint, priority)
+            except AdmissionRejected as e:
+                raise reject(e)
+            t0 = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                CONTROLLER.release(endpoint, time.time() - t0)
+        return wrapper
+    return decorator
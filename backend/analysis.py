@@ -1,11 +1,23 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
 import yfinance as yf
-import functools
 
 import requests
+import os
 
+from shared_cache import shared_cached
+from cancellation import check_cancelled
+from rolling import rolling_range_index
 
+# Cache TTLs (seconds) for the shared cache tiers
+HISTORY_CACHE_TTL = int(os.environ.get("HISTORY_CACHE_TTL", 6 * 3600))
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", 24 * 3600))
+NEWS_CACHE_TTL = int(os.environ.get("NEWS_CACHE_TTL", 1800))
+
+# Trading-day mode grid: entry on trading day 1, 3, ..., 251; hold 7-69 trading days (~10-100 calendar days)
+TRADING_DAY_STARTS = range(1, 253, 2)
+TRADING_DAY_DURATIONS = np.arange(7, 71, 2)
 
 # Create a session with custom headers to avoid 429 errors
 session = requests.Session()
@@ -13,7 +25,7 @@ session.headers.update({
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 })
 
-@functools.lru_cache(maxsize=64)
+@shared_cached("company_profile", ttl=PROFILE_CACHE_TTL, maxsize=64)
 def get_company_profile(ticker):
     """
     Fetches basic company profile information.
@@ -97,7 +109,7 @@ def get_company_profile(ticker):
         print(f"Company Profile Error for {ticker}: {e}")
         return None
 
-@functools.lru_cache(maxsize=32)
+@shared_cached("company_financials", ttl=PROFILE_CACHE_TTL, maxsize=32)
 def get_company_financials(ticker):
     """
     Fetches advanced financial data:
@@ -206,7 +218,7 @@ def get_company_financials(ticker):
         print(f"Financials Error for {ticker}: {e}")
         return None
 
-@functools.lru_cache(maxsize=32)
+@shared_cached("ticker_news", ttl=NEWS_CACHE_TTL, maxsize=32)
 def get_ticker_news(ticker, limit=10):
     """
     Fetches latest news for a ticker from Google News (German) and yfinance.
@@ -320,7 +332,7 @@ def get_ticker_news(ticker, limit=10):
     return all_news[:limit]
 
 
-@functools.lru_cache(maxsize=32)
+@shared_cached("ticker_data", ttl=HISTORY_CACHE_TTL, maxsize=32)
 def fetch_ticker_data(ticker, period="max"):
     """
     Fetches ticker data using yfinance, with a robust manual fallback to the public Chart API.
@@ -455,14 +467,9 @@ def calculate_valuation_from_df(df1, comp_ticker, period=10, rescale_period=100)
         # Calculate Diff
         df['diff'] = (df['pct_main'] * 100) - (df['pct_comp'] * 100)
         
-        # Calculate Rolling 
-        df['min_val'] = df['diff'].rolling(window=rescale_period).min()
-        df['max_val'] = df['diff'].rolling(window=rescale_period).max()
-        
-        denom = df['max_val'] - df['min_val']
-        denom = denom.replace(0, 1)
-        
-        df['rescaled'] = (df['diff'] - df['min_val']) / denom * 200 - 100
+        # Rescale into -100..100 over the rolling window (flat window -> -100)
+        df['rescaled'] = rolling_range_index(df['diff'].to_numpy(dtype=float), [rescale_period],
+                                             low=-100, high=100, flat=-100)[rescale_period]
         
         # Show last year (approx 252 trading days)
         last_year = df.iloc[-252:].copy()
@@ -599,7 +606,14 @@ def prepare_data(data_source, min_year=None):
 
 def analyze_seasonality(data_source, lookback_years=10, min_win_rate=70, search_start_date=None, search_end_date=None, 
                         filter_mode=None, filter_odd_years=False, exclude_2020=False, 
-                        filter_election=False, filter_midterm=False, filter_pre_election=False, filter_post_election=False):
+                        filter_election=False, filter_midterm=False, filter_pre_election=False, filter_post_election=False,
+                        cancel_token=None, offset_mode='calendar'):
+    """
+    Scans start dates x holding periods for seasonal windows with at least min_win_rate.
+    offset_mode 'calendar' steps calendar days (start every 3 days, 10-100 days long);
+    'trading' uses trading-day ordinals (entry on trading day N of the year, exit D
+    trading days later), see trading_day_calendar.
+    """
     # Backward compatibility: user's main.py passes lookback_years, but existing code used min_year internally.
     current_year = datetime.now().year
     min_year = current_year - lookback_years
@@ -638,204 +652,32 @@ def analyze_seasonality(data_source, lookback_years=10, min_win_rate=70, search_
          except:
             pass
 
-    # Optimization: Step by 3 days instead of 1 to approximate faster
-    dummy_dates = pd.date_range('2023-01-01', '2023-12-31', freq='3D')
-    
-    for start_date_dummy in dummy_dates:
-        start_month = start_date_dummy.month
-        start_day = start_date_dummy.day
-        
-        # ... (keep date filter logic) ...
-        
-        if search_start_date and search_end_date:
-             # Check if current date is within range
-             # Construct simple compare
-             curr_val = start_month * 100 + start_day
-             start_val = s_md[0] * 100 + s_md[1]
-             end_val = e_md[0] * 100 + e_md[1]
-             
-             if start_val <= end_val:
-                 if not (start_val <= curr_val <= end_val):
-                     continue
-             else:
-                 # Wrap around (e.g. Dec to Feb)
-                 if not (curr_val >= start_val or curr_val <= end_val):
-                     continue
-        
-        # Max duration 100 days (as requested)
-        # Optimization: Step duration by 3 days
-        for duration in range(10, 101, 3): # 10 to 100 days, step 3
-            target_end_dummy = start_date_dummy + timedelta(days=duration)
-            
-            wins_long = 0
-            wins_short = 0
-            total_years = 0
-            missed_years_long = []
-            missed_years_short = []
-            yearly_trades = []
-            yearly_trades = []
-
-            
-            for year in years:
-                # --- FILTER LOGIC ---
-                # Backward Compatibility
-                if filter_mode == 'post_election':
-                    filter_post_election = True
+    allowed_years = set(_pattern_years(
+        int(years.min()), int(years.max()),
+        filter_mode=filter_mode, filter_odd_years=filter_odd_years, exclude_2020=exclude_2020,
+        filter_election=filter_election, filter_midterm=filter_midterm,
+        filter_pre_election=filter_pre_election, filter_post_election=filter_post_election
+    ))
+    active_years = [int(y) for y in years if int(y) in allowed_years]
+    if not active_years:
+        return []
 
-                # Exclude 2020
-                if exclude_2020 and int(year) == 2020:
-                    continue
-                
-                # Odd Years Only
-                if filter_odd_years and (int(year) % 2 == 0):
-                    continue
+    dates = trading_dates.values.astype('datetime64[ns]')
+    closes = pd.to_numeric(df['Close'], errors='coerce').to_numpy(dtype=float)
+    search_range = (s_md, e_md) if search_start_date and search_end_date else None
 
-                # Election Cycle Filters
-                # Election Year (e.g. 2020, 2024) -> Remainder 0
-                if filter_election and (int(year) % 4 != 0):
-                    continue
-                # Post-Election (e.g. 2021, 2025) -> Remainder 1
-                if filter_post_election and (int(year) % 4 != 1):
-                    continue
-                # Midterm (e.g. 2022, 2026) -> Remainder 2
-                if filter_midterm and (int(year) % 4 != 2):
-                    continue
-                # Pre-Election (e.g. 2023, 2027) -> Remainder 3
-                if filter_pre_election and (int(year) % 4 != 3):
-                    continue
-                # --------------------
-
-                try:
-                    target_start = datetime(year=int(year), month=int(start_month), day=int(start_day))
-                    # Ensure pandas compatibility if needed, but searchsorted handles datetime
-                    target_start = pd.Timestamp(target_start) 
-                    target_end = target_start + timedelta(days=duration)
-                except ValueError:
-                    continue
-                
-                # Entry
-                try:
-                    start_idx_loc = trading_dates.searchsorted(target_start, side='left')
-                    if start_idx_loc >= len(trading_dates):
-                        continue
-                    actual_entry_date = trading_dates[start_idx_loc]
-                    
-                    if (actual_entry_date - target_start).days > 10:
-                        # Only skip if data is REALLY missing (more than 10 days gap)
-                        continue
-                except Exception as e:
-                    # print(f"DEBUG: Crash at Entry Logic: {e}")
-                    raise e
-                    
-                try:
-                    # Exit
-                    # Use 'left' to find the first trading date ON or AFTER the target end date.
-                    # 'right' would skip the target date itself if it exists.
-                    end_idx_loc = trading_dates.searchsorted(target_end, side='left')
-                    if end_idx_loc >= len(trading_dates):
-                        continue
-                    actual_exit_date = trading_dates[end_idx_loc]
-                    
-                    if actual_exit_date <= actual_entry_date:
-                        continue
-    
-                    start_price = df.loc[actual_entry_date]['Close']
-                    end_price = df.loc[actual_exit_date]['Close']
-                    
-                    if pd.isna(start_price) or pd.isna(end_price):
-                        continue
-                        
-                except Exception as e:
-                    # print(f"DEBUG: Crash at Exit/Price Logic: {e} | Type: {type(e)}")
-                    # print details
-                    raise e
-                
-                total_years += 1
-                
-                if end_price > start_price:
-                    wins_long += 1
-                    missed_years_short.append(int(year))
-                elif end_price < start_price:
-                    wins_short += 1
-                    missed_years_long.append(int(year))
-                else:
-                    missed_years_long.append(int(year))
-                    missed_years_short.append(int(year))
-                
-                # DEBUG for DIS 2015 Case - Removed to clean output
-                
-                yearly_trades.append({
-                    "year": int(year),
-                    "entry_date": actual_entry_date.strftime("%Y-%m-%d"),
-                    "exit_date": actual_exit_date.strftime("%Y-%m-%d"),
-                    "entry_price": float(start_price),
-                    "exit_price": float(end_price),
-                    "gain_percent": float((end_price - start_price) / start_price * 100) if start_price != 0 else 0
-                })
+    check_cancelled(cancel_token)
 
-            if total_years < 2: # Reduced to 2 to allow for sparse filters (e.g. 10y lookback + post-election = 2 years)
-                continue
+    if offset_mode == 'trading':
+        grid = _trading_day_windows(dates, closes, active_years, search_range)
+    else:
+        grid = _calendar_windows(dates, active_years, search_range)
+    if grid is None:
+        return []
+    entry_loc, exit_loc, valid, window_meta = grid
 
-            # Calculate Stats (Direction Agnostic first, then adjust for Short)
-            # yearly_trades has "gain_percent" which is (Exit - Entry)/Entry * 100
-            # For LONG: gain_percent is correct
-            # For SHORT: gain_percent needs to be inverted (-1 * gain_percent)
-            
-            trades_df = pd.DataFrame(yearly_trades)
-            if trades_df.empty: continue
-            
-            # Check Long
-            win_rate_long = (wins_long / total_years) * 100
-            if win_rate_long >= min_win_rate:
-                long_gains = trades_df['gain_percent']
-                avg_ret = long_gains.mean()
-                max_ret = long_gains.max()
-                min_ret = long_gains.min() # Max Loss
-                
-                patterns.append({
-                    'start_md': (start_month, start_day),
-                    'end_md': (target_end_dummy.month, target_end_dummy.day),
-                    'duration': duration,
-                    'type': 'Long',
-                    'win_rate': float(win_rate_long),
-                    'missed_years': missed_years_long,
-                    'years_analyzed': total_years,
-                    'avg_return': float(avg_ret),
-                    'max_return': float(max_ret),
-                    'min_return': float(min_ret),
-                    'analysis_period_start': int(years.min()),
-                    'analysis_period_end': int(years.max()),
-                    'yearly_trades': yearly_trades,
-                    'start_str': f"2023-{start_month:02d}-{start_day:02d}",
-                    'end_str': f"2023-{target_end_dummy.month:02d}-{target_end_dummy.day:02d}"
-                })
-                
-            # Check Short
-            win_rate_short = (wins_short / total_years) * 100
-            if win_rate_short >= min_win_rate:
-                # Invert gains for Short
-                short_gains = -1 * trades_df['gain_percent']
-                avg_ret = short_gains.mean()
-                max_ret = short_gains.max()
-                min_ret = short_gains.min()
-                
-                patterns.append({
-                    'start_md': (start_month, start_day),
-                    'end_md': (target_end_dummy.month, target_end_dummy.day),
-                    'duration': duration,
-                    'type': 'Short',
-                    'win_rate': float(win_rate_short),
-                    'missed_years': missed_years_short,
-                    'years_analyzed': total_years,
-                    'avg_return': float(avg_ret),
-                    'max_return': float(max_ret),
-                    'min_return': float(min_ret),
-                    'analysis_period_start': int(years.min()),
-                    'analysis_period_end': int(years.max()),
-                    'yearly_trades': yearly_trades,
-                    'start_str': f"2023-{start_month:02d}-{start_day:02d}",
-                    'end_str': f"2023-{target_end_dummy.month:02d}-{target_end_dummy.day:02d}"
-                })
+    patterns = _window_patterns(dates, closes, entry_loc, exit_loc, valid, active_years, min_win_rate,
+                                window_meta, (int(years.min()), int(years.max())), cancel_token)
 
     # Sort by Win Rate (desc), then by Years (desc)
     patterns.sort(key=lambda x: (x['win_rate'], x['years_analyzed']), reverse=True)
@@ -844,6 +686,8 @@ def analyze_seasonality(data_source, lookback_years=10, min_win_rate=70, search_
     final_patterns = []
     
     def get_doy_range(p):
+        if p.get('offset_mode') == 'trading':
+            return p['start_td'], p['start_td'] + p['duration']
         # Convert MD to DOY (approx)
         start = (datetime(2023, p['start_md'][0], p['start_md'][1]) - datetime(2023, 1, 1)).days
         end = start + p['duration']
@@ -875,6 +719,264 @@ def analyze_seasonality(data_source, lookback_years=10, min_win_rate=70, search_
             
     return final_patterns
 
+def _in_search_range(month, day, s_md, e_md):
+    # Construct simple compare
+    curr_val = month * 100 + day
+    start_val = s_md[0] * 100 + s_md[1]
+    end_val = e_md[0] * 100 + e_md[1]
+    
+    if start_val <= end_val:
+        return start_val <= curr_val <= end_val
+    # Wrap around (e.g. Dec to Feb)
+    return curr_val >= start_val or curr_val <= end_val
+
+def _calendar_windows(dates, active_years, search_range=None):
+    """
+    Calendar-day windows: entry index per (year, start) and exit index per (year, start, duration),
+    resolved with one searchsorted each instead of one lookup per trade.
+    Returns (entry_loc, exit_loc, valid, window_meta) or None.
+    """
+    # Optimization: Step by 3 days instead of 1 to approximate faster
+    dummy_dates = pd.date_range('2023-01-01', '2023-12-31', freq='3D')
+    starts = [d for d in dummy_dates if search_range is None or _in_search_range(d.month, d.day, *search_range)]
+
+    # Max duration 100 days (as requested)
+    # Optimization: Step duration by 3 days
+    durations = np.arange(10, 101, 3) # 10 to 100 days, step 3
+    if not starts:
+        return None
+
+    n_dates = len(dates)
+    target_starts = np.array(
+        [[np.datetime64(datetime(y, d.month, d.day), 'D') for d in starts] for y in active_years]
+    ).astype('datetime64[ns]')
+    target_ends = target_starts[:, :, None] + durations.astype('timedelta64[D]')[None, None, :]
+
+    entry_loc = np.searchsorted(dates, target_starts, side='left')
+    exit_loc = np.searchsorted(dates, target_ends, side='left')
+    valid_entry = entry_loc < n_dates
+    entry_loc = np.minimum(entry_loc, n_dates - 1)
+    # Only skip if data is REALLY missing (more than 10 days gap)
+    valid_entry &= (dates[entry_loc] - target_starts) // np.timedelta64(1, 'D') <= 10
+
+    valid = valid_entry[:, :, None] & (exit_loc < n_dates)
+    exit_loc = np.minimum(exit_loc, n_dates - 1)
+    valid &= dates[exit_loc] > dates[entry_loc][:, :, None]
+
+    def window_meta(si, di):
+        start_date_dummy = starts[si]
+        duration = int(durations[di])
+        target_end_dummy = start_date_dummy + timedelta(days=duration)
+        head = {
+            'start_md': (start_date_dummy.month, start_date_dummy.day),
+            'end_md': (target_end_dummy.month, target_end_dummy.day),
+            'duration': duration,
+        }
+        tail = {
+            'start_str': f"2023-{start_date_dummy.month:02d}-{start_date_dummy.day:02d}",
+            'end_str': f"2023-{target_end_dummy.month:02d}-{target_end_dummy.day:02d}"
+        }
+        return head, tail
+
+    return entry_loc, exit_loc, valid, window_meta
+
+def trading_day_calendar(dates, closes, max_first_day=10):
+    """
+    Per-year trading-day ordinals. Returns (rows, years) where rows are the positions of
+    the priced rows and years maps year -> (first, count): trading day N (1-based) of
+    that year is dates[rows[first + N - 1]]. Years whose data starts after Jan 10
+    (partial first year) are left out, their ordinals would be shifted.
+    """
+    rows = np.flatnonzero(~np.isnan(closes))
+    priced = dates[rows]
+    row_years = priced.astype('datetime64[Y]').astype(int) + 1970
+    uniq, first, counts = np.unique(row_years, return_index=True, return_counts=True)
+
+    years = {}
+    for y, f, c in zip(uniq, first, counts):
+        offset = (priced[f] - np.datetime64(f"{int(y):04d}-01-01")) // np.timedelta64(1, 'D')
+        if offset <= max_first_day:
+            years[int(y)] = (int(f), int(c))
+    return rows, years
+
+def _typical_md(dates, locs, years):
+    """Median calendar position (as a 2023 month/day) of the given dates, relative to Jan 1 of their years."""
+    if len(locs) == 0:
+        return None
+    jan1 = np.array([np.datetime64(f"{y:04d}-01-01") for y in years]).astype('datetime64[ns]')
+    offsets = (dates[locs] - jan1) // np.timedelta64(1, 'D')
+    d = datetime(2023, 1, 1) + timedelta(days=int(np.median(offsets)) % 365)
+    return d.month, d.day
+
+def _trading_day_windows(dates, closes, active_years, search_range=None):
+    """
+    Trading-day windows: entry on trading day N of each year, exit D trading days later.
+    Entries and exits are direct lookups into the per-year ordinal arrays (no calendar
+    drift around holidays). Returns (entry_loc, exit_loc, valid, window_meta) or None.
+    """
+    rows, td_years = trading_day_calendar(dates, closes)
+    starts = np.asarray(TRADING_DAY_STARTS)
+    durations = TRADING_DAY_DURATIONS
+    n_rows = len(rows)
+    if n_rows == 0:
+        return None
+
+    first = np.array([td_years.get(y, (0, 0))[0] for y in active_years])
+    count = np.array([td_years.get(y, (0, 0))[1] for y in active_years])
+
+    # Positions in the priced-row array
+    entry_pos = first[:, None] + starts[None, :] - 1
+    valid_entry = starts[None, :] <= count[:, None]
+    exit_pos = entry_pos[:, :, None] + durations[None, None, :]
+    valid = valid_entry[:, :, None] & (exit_pos < n_rows)
+
+    entry_loc = rows[np.minimum(entry_pos, n_rows - 1)]
+    exit_loc = rows[np.minimum(exit_pos, n_rows - 1)]
+    year_arr = np.asarray(active_years)
+
+    keep = []
+    typical_starts = []
+    for si in range(len(starts)):
+        yi = np.flatnonzero(valid_entry[:, si])
+        md = _typical_md(dates, entry_loc[yi, si], year_arr[yi])
+        if md is None or (search_range is not None and not _in_search_range(md[0], md[1], *search_range)):
+            continue
+        keep.append(si)
+        typical_starts.append(md)
+    if not keep:
+        return None
+
+    entry_loc, exit_loc, valid = entry_loc[:, keep], exit_loc[:, keep], valid[:, keep]
+    starts = starts[keep]
+
+    def window_meta(si, di):
+        start_td = int(starts[si])
+        duration = int(durations[di])
+        yi = np.flatnonzero(valid[:, si, di])
+        s_m, s_d = typical_starts[si]
+        e_m, e_d = _typical_md(dates, exit_loc[yi, si, di], year_arr[yi])
+        head = {
+            'start_md': (s_m, s_d),
+            'end_md': (e_m, e_d),
+            'duration': duration, # Trading days
+        }
+        tail = {
+            'start_str': f"2023-{s_m:02d}-{s_d:02d}",
+            'end_str': f"2023-{e_m:02d}-{e_d:02d}",
+            'offset_mode': 'trading',
+            'start_td': start_td,
+            'end_td': start_td + duration
+        }
+        return head, tail
+
+    return entry_loc, exit_loc, valid, window_meta
+
+def _window_patterns(dates, closes, entry_loc, exit_loc, valid, active_years, min_win_rate, window_meta, period,
+                     cancel_token=None):
+    """
+    Long/Short pattern stats for every (start, duration) window of the grid whose win rate
+    reaches min_win_rate. valid[y, s, d] marks the years in which a window could be traded.
+    """
+    entry_3d = np.broadcast_to(entry_loc[:, :, None], exit_loc.shape)
+    start_prices = closes[entry_3d]
+    end_prices = closes[exit_loc]
+    valid = valid & ~np.isnan(start_prices) & ~np.isnan(end_prices)
+
+    up = valid & (end_prices > start_prices)
+    down = valid & (end_prices < start_prices)
+    total_years_m = valid.sum(axis=0)
+    wins_long_m = up.sum(axis=0)
+    wins_short_m = down.sum(axis=0)
+
+    date_strs = np.datetime_as_string(dates, unit='D')
+    period_start, period_end = period
+    patterns = []
+
+    n_starts, n_durations = total_years_m.shape
+    for si in range(n_starts):
+        # Chunk boundary: stop early if the caller went away or the deadline passed
+        check_cancelled(cancel_token)
+
+        for di in range(n_durations):
+            total_years = int(total_years_m[si, di])
+            if total_years < 2: # Reduced to 2 to allow for sparse filters (e.g. 10y lookback + post-election = 2 years)
+                continue
+
+            win_rate_long = (int(wins_long_m[si, di]) / total_years) * 100
+            win_rate_short = (int(wins_short_m[si, di]) / total_years) * 100
+            if win_rate_long < min_win_rate and win_rate_short < min_win_rate:
+                continue
+
+            head, tail = window_meta(si, di)
+            
+            missed_years_long = []
+            missed_years_short = []
+            yearly_trades = []
+            for yi in np.flatnonzero(valid[:, si, di]):
+                year = active_years[yi]
+                start_price = start_prices[yi, si, di]
+                end_price = end_prices[yi, si, di]
+                if end_price > start_price:
+                    missed_years_short.append(year)
+                elif end_price < start_price:
+                    missed_years_long.append(year)
+                else:
+                    missed_years_long.append(year)
+                    missed_years_short.append(year)
+
+                yearly_trades.append({
+                    "year": year,
+                    "entry_date": str(date_strs[entry_loc[yi, si]]),
+                    "exit_date": str(date_strs[exit_loc[yi, si, di]]),
+                    "entry_price": float(start_price),
+                    "exit_price": float(end_price),
+                    "gain_percent": float((end_price - start_price) / start_price * 100) if start_price != 0 else 0
+                })
+
+            # Calculate Stats (Direction Agnostic first, then adjust for Short)
+            # yearly_trades has "gain_percent" which is (Exit - Entry)/Entry * 100
+            # For LONG: gain_percent is correct
+            # For SHORT: gain_percent needs to be inverted (-1 * gain_percent)
+            gains = pd.Series([t["gain_percent"] for t in yearly_trades], dtype=float)
+            
+            # Check Long
+            if win_rate_long >= min_win_rate:
+                patterns.append({
+                    **head,
+                    'type': 'Long',
+                    'win_rate': float(win_rate_long),
+                    'missed_years': missed_years_long,
+                    'years_analyzed': total_years,
+                    'avg_return': float(gains.mean()),
+                    'max_return': float(gains.max()),
+                    'min_return': float(gains.min()), # Max Loss
+                    'analysis_period_start': period_start,
+                    'analysis_period_end': period_end,
+                    'yearly_trades': yearly_trades,
+                    **tail
+                })
+                
+            # Check Short
+            if win_rate_short >= min_win_rate:
+                # Invert gains for Short
+                short_gains = -1 * gains
+                patterns.append({
+                    **head,
+                    'type': 'Short',
+                    'win_rate': float(win_rate_short),
+                    'missed_years': missed_years_short,
+                    'years_analyzed': total_years,
+                    'avg_return': float(short_gains.mean()),
+                    'max_return': float(short_gains.max()),
+                    'min_return': float(short_gains.min()),
+                    'analysis_period_start': period_start,
+                    'analysis_period_end': period_end,
+                    'yearly_trades': yearly_trades,
+                    **tail
+                })
+
+    return patterns
+
 def load_valuation_df(file_path):
     """
     Specialized loader for Valuation files that may contain multiple Symbol columns.
@@ -1156,131 +1258,239 @@ def get_current_year_data(df):
 
 def evaluate_custom_pattern(df, start_md, end_md, lookback_years=10, min_win_rate=0, filter_mode=None,
                             filter_odd_years=False, exclude_2020=False, 
-                            filter_election=False, filter_midterm=False, filter_pre_election=False, filter_post_election=False):
+                            filter_election=False, filter_midterm=False, filter_pre_election=False, filter_post_election=False,
+                            offset_mode='calendar', start_td=None, end_td=None):
     """
     Evaluates a specific seasonal pattern (Start MD to End MD) over the lookback period.
+    With offset_mode='trading' the window is trading day start_td to trading day end_td instead.
     Returns the full stats structure.
     """
     try:
-        df = df.copy()
-        if 'Date' not in df.columns and df.index.name == 'Date':
-             df = df.reset_index()
-             
-        if not pd.api.types.is_datetime64_any_dtype(df['Date']):
-            df['Date'] = pd.to_datetime(df['Date'])
-            
-        df = df.set_index('Date').sort_index()
-        trading_dates = df.index
-        
-        current_year = datetime.now().year
-        start_year = current_year - lookback_years
-        years = range(start_year, current_year + 1)
-        
-        s_m, s_d = map(int, start_md.split('-'))
-        e_m, e_d = map(int, end_md.split('-'))
-        
-        wins_long = 0
-        total_years = 0
-        missed_years_long = []
-        yearly_trades = []
-        
-        for year in years:
-            # --- FILTER LOGIC ---
-            if filter_mode == 'post_election': filter_post_election = True
-            
-            if exclude_2020 and year == 2020: continue
-            if filter_odd_years and (year % 2 == 0): continue
-            
-            if filter_election and (year % 4 != 0): continue
-            if filter_post_election and (year % 4 != 1): continue
-            if filter_midterm and (year % 4 != 2): continue
-            if filter_pre_election and (year % 4 != 3): continue
-            # --------------------
+        spec = {
+            "start_md": start_md,
+            "end_md": end_md,
+            "offset_mode": offset_mode,
+            "start_td": start_td,
+            "end_td": end_td,
+            "lookback_years": lookback_years,
+            "filter_mode": filter_mode,
+            "filter_odd_years": filter_odd_years,
+            "exclude_2020": exclude_2020,
+            "filter_election": filter_election,
+            "filter_midterm": filter_midterm,
+            "filter_pre_election": filter_pre_election,
+            "filter_post_election": filter_post_election
+        }
+        return evaluate_custom_patterns(df, [spec])[0]
 
-            try:
-                # Target Dates
-                target_start = datetime(year, s_m, s_d)
-                
-                # Handle Year Wrap (Dec -> Jan)
-                target_end_year = year if (s_m < e_m) or (s_m == e_m and s_d < e_d) else year + 1
-                target_end = datetime(target_end_year, e_m, e_d)
-                
-                # Find valid trading days
-                # Entry
-                start_idx = trading_dates.searchsorted(target_start)
-                if start_idx >= len(trading_dates): continue
-                actual_entry = trading_dates[start_idx]
-                
-                # Check latency
-                if (actual_entry - target_start).days > 10: continue
+    except Exception as e:
+        print(f"Custom Pattern Error: {e}")
+        return None
 
-                # Exit
-                end_idx = trading_dates.searchsorted(target_end)
-                if end_idx >= len(trading_dates): continue
-                actual_exit = trading_dates[end_idx]
-                
-                if actual_exit <= actual_entry: continue
-                
-                # Prices
-                metrics = df.loc[[actual_entry, actual_exit]]
-                if len(metrics) < 2: continue
-                
-                start_price = metrics.loc[actual_entry]['Close']
-                end_price = metrics.loc[actual_exit]['Close']
-                
-                gain_pct = ((end_price - start_price) / start_price) * 100
-                
-                yearly_trades.append({
-                    "year": year,
-                    "entry_date": actual_entry.strftime("%Y-%m-%d"),
-                    "exit_date": actual_exit.strftime("%Y-%m-%d"),
-                    "entry_price": float(start_price),
-                    "exit_price": float(end_price),
-                    "gain_percent": float(gain_pct)
-                })
-                
-                total_years += 1
-                if gain_pct > 0:
-                    wins_long += 1
+def _pattern_years(start_year, end_year, filter_mode=None, filter_odd_years=False, exclude_2020=False,
+                   filter_election=False, filter_midterm=False, filter_pre_election=False, filter_post_election=False):
+    """Years in [start_year, end_year] that pass the year filters of a pattern request."""
+    if filter_mode == 'post_election': filter_post_election = True
+
+    years = []
+    for year in range(start_year, end_year + 1):
+        if exclude_2020 and year == 2020: continue
+        if filter_odd_years and (year % 2 == 0): continue
+
+        if filter_election and (year % 4 != 0): continue
+        if filter_post_election and (year % 4 != 1): continue
+        if filter_midterm and (year % 4 != 2): continue
+        if filter_pre_election and (year % 4 != 3): continue
+        years.append(year)
+    return years
+
+def evaluate_custom_patterns(df, specs):
+    """
+    Evaluates many custom patterns (Start MD to End MD) against one price history.
+    Each spec is a dict with start_md/end_md ("MM-DD"), lookback_years and the usual year filters;
+    specs with offset_mode 'trading' give start_td/end_td (trading day N to trading day M) instead.
+    Entry/exit lookups for all windows and years are resolved in one vectorized pass.
+    Returns one stats dict (or None) per spec, in input order.
+    """
+    df = df.copy()
+    if 'Date' not in df.columns and df.index.name == 'Date':
+         df = df.reset_index()
+
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        df['Date'] = pd.to_datetime(df['Date'])
+
+    df = df.set_index('Date').sort_index()
+    trading_dates = df.index.values.astype('datetime64[ns]')
+    closes = pd.to_numeric(df['Close'], errors='coerce').to_numpy(dtype=float)
+    n_dates = len(trading_dates)
+
+    current_year = datetime.now().year
+
+    # 1. Expand every spec into its (year, target_start, target_end) candidates
+    parsed = []
+    spec_idx, cand_years, cand_starts, cand_ends = [], [], [], []
+    # Trading-day specs resolve straight to row positions
+    td_rows, td_years = None, None
+    td_spec_idx, td_cand_years, td_entry_pos, td_exit_pos = [], [], [], []
+    for i, spec in enumerate(specs):
+        trading = spec.get('offset_mode') == 'trading'
+        try:
+            if trading:
+                start_td, end_td = int(spec['start_td']), int(spec['end_td'])
+                if start_td < 1 or end_td < 1 or start_td == end_td:
+                    raise ValueError("trading days must be >= 1 and differ")
+            else:
+                s_m, s_d = map(int, spec['start_md'].split('-'))
+                e_m, e_d = map(int, spec['end_md'].split('-'))
+        except Exception as e:
+            if trading:
+                print(f"Custom Pattern Error: invalid window {spec.get('start_td')} -> {spec.get('end_td')}: {e}")
+            else:
+                print(f"Custom Pattern Error: invalid window {spec.get('start_md')} -> {spec.get('end_md')}: {e}")
+            parsed.append(None)
+            continue
+        parsed.append(('trading', start_td, end_td) if trading else (s_m, s_d, e_m, e_d))
+
+        lookback_years = spec.get('lookback_years')
+        if lookback_years is None: lookback_years = 10
+        years = _pattern_years(
+            current_year - lookback_years, current_year,
+            filter_mode=spec.get('filter_mode'),
+            filter_odd_years=spec.get('filter_odd_years', False),
+            exclude_2020=spec.get('exclude_2020', False),
+            filter_election=spec.get('filter_election', False),
+            filter_midterm=spec.get('filter_midterm', False),
+            filter_pre_election=spec.get('filter_pre_election', False),
+            filter_post_election=spec.get('filter_post_election', False)
+        )
+
+        if trading:
+            if td_rows is None:
+                td_rows, td_years = trading_day_calendar(trading_dates, closes)
+            for year in years:
+                if year not in td_years or start_td > td_years[year][1]:
+                    continue
+                entry_pos = td_years[year][0] + start_td - 1
+                if end_td > start_td:
+                    # Trading day M counted on from the entry (may run into next year)
+                    exit_pos = entry_pos + (end_td - start_td)
+                elif year + 1 in td_years:
+                    # Trading day M of the following year
+                    exit_pos = td_years[year + 1][0] + end_td - 1
                 else:
-                    missed_years_long.append(year)
-                    
-            except Exception:
+                    continue
+                if exit_pos >= len(td_rows):
+                    continue
+                td_spec_idx.append(i)
+                td_cand_years.append(year)
+                td_entry_pos.append(entry_pos)
+                td_exit_pos.append(exit_pos)
+            continue
+
+        # Handle Year Wrap (Dec -> Jan)
+        wraps = not ((s_m < e_m) or (s_m == e_m and s_d < e_d))
+        for year in years:
+            try:
+                target_start = datetime(year, s_m, s_d)
+                target_end = datetime(year + 1 if wraps else year, e_m, e_d)
+            except ValueError:
                 continue
-                
-        if total_years == 0:
-            return None
-            
-        win_rate = (wins_long / total_years) * 100
-        
-        trades_df = pd.DataFrame(yearly_trades)
-        avg_ret = trades_df['gain_percent'].mean()
-        max_ret = trades_df['gain_percent'].max()
-        min_ret = trades_df['gain_percent'].min()
-        
-        # Determine duration
-        duration = (datetime(2023, s_m, s_d) - datetime(2023 if s_m <= e_m else 2024, e_m, e_d)).days
-        duration = abs(duration)
-        
-        return {
+            spec_idx.append(i)
+            cand_years.append(year)
+            cand_starts.append(target_start)
+            cand_ends.append(target_end)
+
+    results = [None] * len(specs)
+    if (not cand_years and not td_cand_years) or n_dates == 0:
+        return results
+
+    # 2. Resolve entries/exits for all candidates at once
+    starts = np.asarray(cand_starts, dtype='datetime64[ns]')
+    ends = np.asarray(cand_ends, dtype='datetime64[ns]')
+
+    entry_loc = np.searchsorted(trading_dates, starts, side='left')
+    exit_loc = np.searchsorted(trading_dates, ends, side='left')
+    valid = (entry_loc < n_dates) & (exit_loc < n_dates)
+    entry_loc = np.minimum(entry_loc, n_dates - 1)
+    exit_loc = np.minimum(exit_loc, n_dates - 1)
+
+    # Check latency (entry more than 10 days after target -> data missing)
+    latency_days = (trading_dates[entry_loc] - starts) // np.timedelta64(1, 'D')
+    valid &= latency_days <= 10
+
+    if td_cand_years:
+        # Trading-day candidates: direct lookups, no latency check needed
+        spec_idx += td_spec_idx
+        cand_years += td_cand_years
+        entry_loc = np.concatenate([entry_loc, td_rows[np.asarray(td_entry_pos, dtype=int)]])
+        exit_loc = np.concatenate([exit_loc, td_rows[np.asarray(td_exit_pos, dtype=int)]])
+        valid = np.concatenate([valid, np.ones(len(td_cand_years), dtype=bool)])
+
+    spec_idx = np.asarray(spec_idx)
+    entry_dates = trading_dates[entry_loc]
+    exit_dates = trading_dates[exit_loc]
+    valid &= exit_dates > entry_dates
+
+    entry_prices = closes[entry_loc]
+    exit_prices = closes[exit_loc]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gains = (exit_prices - entry_prices) / entry_prices * 100
+
+    entry_strs = np.datetime_as_string(entry_dates, unit='D')
+    exit_strs = np.datetime_as_string(exit_dates, unit='D')
+
+    # 3. Assemble per-spec stats
+    for i in np.unique(spec_idx[valid]):
+        rows = np.flatnonzero(valid & (spec_idx == i))
+        window = {}
+        if parsed[i][0] == 'trading':
+            _, start_td, end_td = parsed[i]
+            row_years = np.asarray(cand_years)[rows]
+            s_m, s_d = _typical_md(trading_dates, entry_loc[rows], row_years)
+            e_m, e_d = _typical_md(trading_dates, exit_loc[rows], row_years)
+            window = {'offset_mode': 'trading', 'start_td': start_td, 'end_td': end_td}
+        else:
+            s_m, s_d, e_m, e_d = parsed[i]
+
+        yearly_trades = []
+        missed_years_long = []
+        wins_long = 0
+        for r in rows:
+            year = cand_years[r]
+            yearly_trades.append({
+                "year": year,
+                "entry_date": str(entry_strs[r]),
+                "exit_date": str(exit_strs[r]),
+                "entry_price": float(entry_prices[r]),
+                "exit_price": float(exit_prices[r]),
+                "gain_percent": float(gains[r])
+            })
+            if gains[r] > 0:
+                wins_long += 1
+            else:
+                missed_years_long.append(year)
+
+        total_years = len(rows)
+        row_gains = pd.Series(gains[rows])
+
+        results[i] = {
             'start_md': (s_m, s_d),
             'end_md': (e_m, e_d),
             'type': 'Long', # Default to Long for interactive analysis
-            'win_rate': float(win_rate),
+            'win_rate': float(wins_long / total_years * 100),
             'missed_years': missed_years_long,
             'years_analyzed': total_years,
-            'avg_return': float(avg_ret),
-            'max_return': float(max_ret),
-            'min_return': float(min_ret),
+            'avg_return': float(row_gains.mean()),
+            'max_return': float(row_gains.max()),
+            'min_return': float(row_gains.min()),
             'yearly_trades': yearly_trades,
              # Format for frontend matching
             'start_str': f"2023-{s_m:02d}-{s_d:02d}",
-            'end_str': f"2023-{e_m:02d}-{e_d:02d}"
+            'end_str': f"2023-{e_m:02d}-{e_d:02d}",
+            **window
         }
 
-    except Exception as e:
-        print(f"Custom Pattern Error: {e}")
-        return None
+    return results
 
 def get_institutional_data(ticker_symbol):
     """
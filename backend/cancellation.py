@@ -0,0 +1,67 @@
+import os
+import time
+import uuid
+import tempfile
+
+# Marker files make a cancel visible to worker processes (they only receive a pickled token)
+CANCEL_DIR = os.environ.get("CANCEL_DIR", os.path.join(tempfile.gettempdir(), "lucidalpha_cancel"))
+os.makedirs(CANCEL_DIR, exist_ok=True)
+
+
+class OperationCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    """
+    Cooperative cancellation with an optional deadline (epoch seconds).
+    Long-running loops call check() at chunk boundaries and stop with OperationCancelled.
+    """
+
+    def __init__(self, deadline=None, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.deadline = deadline
+        self._cancelled = False
+
+    @classmethod
+    def with_timeout(cls, seconds):
+        return cls(deadline=time.time() + seconds if seconds else None)
+
+    @property
+    def marker_path(self):
+        return os.path.join(CANCEL_DIR, self.job_id)
+
+    def cancel(self):
+        self._cancelled = True
+        try:
+            with open(self.marker_path, "w"):
+                pass
+        except OSError as e:
+            print(f"Cancel marker write failed for {self.job_id}: {e}")
+
+    def deadline_exceeded(self):
+        return self.deadline is not None and time.time() > self.deadline
+
+    def cancelled(self):
+        if not self._cancelled and os.path.exists(self.marker_path):
+            self._cancelled = True
+        return self._cancelled or self.deadline_exceeded()
+
+    def reason(self):
+        return "deadline exceeded" if self.deadline_exceeded() and not self._cancelled else "cancelled"
+
+    def check(self):
+        if self.cancelled():
+            raise OperationCancelled(self.reason())
+
+    def close(self):
+        try:
+            os.remove(self.marker_path)
+        except OSError:
+            pass
+
+
+def check_cancelled(token):
+    """No-op when no token was passed (keeps call sites short)."""
+    if token is not None:
+        token.check()
@@ -1,23 +1,31 @@
 import pandas as pd
 import requests
 import io
+import json
 import datetime
 import os
+import fcntl
 import zipfile
+import threading
+import concurrent.futures
 import numpy as np
+from rolling import rolling_range_index
 
 # CONFIG
-# CONFIG
-CURRENT_YEAR = 2025
-YEARS_HISTORY = list(range(2000, 2026))
+# History starts here; the last year is always the current one
+COT_FIRST_YEAR = int(os.environ.get("COT_FIRST_YEAR", "2000"))
+COT_DATA_DIR = os.environ.get("COT_DATA_DIR", "cot_data")
+COT_FETCH_WORKERS = int(os.environ.get("COT_FETCH_WORKERS", "6"))
+# Yearly zips of the previous year keep changing until the last December report is out
+COT_YEAR_SETTLE_DAYS = int(os.environ.get("COT_YEAR_SETTLE_DAYS", "14"))
+# Reports are weekly: a larger gap before the weekly file means missed weeks, re-pull the yearly zip
+COT_MAX_GAP_DAYS = int(os.environ.get("COT_MAX_GAP_DAYS", "7"))
+HTTP_HEADERS = {'User-Agent': 'Mozilla/5.0'}
 
 # URLs - Legacy
 URL_LEGACY_CURRENT = "https://www.cftc.gov/dea/newcot/deacot.txt" 
 URL_LEGACY_HIST = "https://www.cftc.gov/files/dea/history/deacot{}.zip"
 
-# URLs - TFF (Financial Futures)
-# We will iterate lists in function
-
 # Mapping
 TICKER_TO_CFTC = {
     "DX=F": "098662", "6C=F": "090741", "6A=F": "232741", "6E=F": "099741",
@@ -29,408 +37,712 @@ TICKER_TO_CFTC = {
     "RTY=F": "239742"
 }
 
-CACHE_LEGACY = "cftc_combined_v3.csv"
-CACHE_TFF = "cftc_tff_v2.csv"
-CACHE_DISAGG = "cftc_disagg_v1.csv"
-CACHE_EXPIRY = 3600 * 24
+# Report definitions: column positions in the CFTC text files, weekly file, yearly zips ({} = year)
+REPORTS = {
+    "legacy": {
+        "rename_map": {
+            0: 'market_name', 2: 'date', 3: 'cftc_code', 7: 'open_interest',
+            8: 'noncomm_long', 9: 'noncomm_short',
+            11: 'comm_long', 12: 'comm_short',
+            15: 'nonrep_long', 16: 'nonrep_short'
+        },
+        "current_urls": [
+            URL_LEGACY_CURRENT,
+            "https://www.cftc.gov/dea/newcot/deafut.txt"
+        ],
+        "history_urls": [
+            URL_LEGACY_HIST,
+            "https://www.cftc.gov/files/dea/history/deafut{}.zip"
+        ],
+    },
+    "tff": {
+        "rename_map": {
+            0: 'market_name', 2: 'date', 3: 'cftc_code',
+            7: 'open_interest',
+            8: 'dealer_long', 9: 'dealer_short',
+            11: 'asset_long', 12: 'asset_short',
+            14: 'lev_long', 15: 'lev_short',
+            17: 'other_long', 18: 'other_short',
+            20: 'nonrep_long', 21: 'nonrep_short'
+        },
+        "current_urls": [
+            "https://www.cftc.gov/dea/newcot/FinFutWk.txt",
+            "https://www.cftc.gov/dea/newcot/FinFut.txt",
+            "https://www.cftc.gov/dea/newcot/fin_fut.txt"
+        ],
+        "history_urls": [
+            "https://www.cftc.gov/files/dea/history/fin_fut_txt_{}.zip",
+            "https://www.cftc.gov/files/dea/history/fut_fin_txt_{}.zip"
+        ],
+    },
+    "disaggregated": {
+        "rename_map": {
+            0: 'market_name', 2: 'date', 3: 'cftc_code',
+            7: 'open_interest',
+            8: 'pm_long', 9: 'pm_short', # Producer/Merchant
+            10: 'swap_long', 11: 'swap_short', # Swap Dealers
+            13: 'mm_long', 14: 'mm_short', # Managed Money
+            16: 'other_long', 17: 'other_short',
+            19: 'nonrep_long', 20: 'nonrep_short' # Approx index, might need verifying
+        },
+        # Note on Indices: 
+        # Swap Spreading is usually 12?
+        # MM Spreading usually 15?
+        # Other Spreading usually 18?
+        # So 16 for Other Long is correct if (13,14,15) are MM.
+        # NonReportable starts after Other Spread (18) + maybe Total reportable? No. 
+        # Standard Disagg: 
+        # ... Other Long(16), Other Short(17), Other Spread(18), Total Reportable(19?? No)
+        # Actually NonReportable Long (19) ? Let's Assume 19/20 for NonRep.
+        "current_urls": [
+            "https://www.cftc.gov/dea/newcot/f_disagg.txt",
+            "https://www.cftc.gov/dea/newcot/c_disagg.txt" # Combined fallback
+        ],
+        "history_urls": [
+            "https://www.cftc.gov/files/dea/history/fut_disagg_txt_{}.zip"
+        ],
+    },
+}
 
-CACHE_LEGACY_DF = None
-CACHE_TFF_DF = None
-CACHE_DISAGG_DF = None
-CACHE_LAST_LOAD = {}
+# Net series per report: (output prefix, long column, short column)
+COT_SERIES = {
+    'legacy': [('commercial', 'comm_long', 'comm_short'),
+               ('large_spec', 'noncomm_long', 'noncomm_short'),
+               ('small_spec', 'nonrep_long', 'nonrep_short')],
+    'tff': [('dealer', 'dealer_long', 'dealer_short'),
+            ('asset', 'asset_long', 'asset_short'),
+            ('lev', 'lev_long', 'lev_short')],
+    'disaggregated': [('pm', 'pm_long', 'pm_short'),
+                      ('swap', 'swap_long', 'swap_short'),
+                      ('mm', 'mm_long', 'mm_short')],
+}
 
-def fetch_legacy_data():
-    global CACHE_LEGACY_DF
-    
-    # Check In-Memory Cache first
-    if CACHE_LEGACY_DF is not None:
-         # Optional: Check expiry? For now assume memory is fresh for the session lifetime or until restart
-         return CACHE_LEGACY_DF
-
-    if os.path.exists(CACHE_LEGACY):
-        mtime = os.path.getmtime(CACHE_LEGACY)
-        if datetime.datetime.now().timestamp() - mtime < CACHE_EXPIRY:
-             try:
-                 df = pd.read_csv(CACHE_LEGACY, dtype={'cftc_code': str}, parse_dates=['date'], low_memory=False)
-                 CACHE_LEGACY_DF = df
-                 return df
-             except: pass
-
-    print("Downloading CoT Legacy Data...")
-    dfs = []
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    
-    rename_map = {
-        0: 'market_name', 2: 'date', 3: 'cftc_code', 7: 'open_interest',
-        8: 'noncomm_long', 9: 'noncomm_short',
-        11: 'comm_long', 12: 'comm_short',
-        15: 'nonrep_long', 16: 'nonrep_short'
-    }
+# Output fields (and row key order) per report
+COT_FIELDS = {
+    'legacy': ['date', 'open_interest', 'commercial_net', 'large_spec_net', 'small_spec_net',
+               'commercial_index', 'large_spec_index', 'small_spec_index'],
+    'tff': ['date', 'open_interest', 'dealer_net', 'dealer_index', 'asset_net', 'asset_index',
+            'lev_net', 'lev_index'],
+    'disaggregated': ['date', 'open_interest', 'pm_net', 'pm_index', 'swap_net', 'swap_index',
+                      'mm_net', 'mm_index'],
+}
 
-    # 1. Current
-    try:
-        r = requests.get(URL_LEGACY_CURRENT, headers=headers)
-        if r.status_code == 404:
-             fallback = "https://www.cftc.gov/dea/newcot/deafut.txt"
-             print(f"Legacy Current 404, fallback: {fallback}")
-             r = requests.get(fallback, headers=headers)
-        r.raise_for_status()
-        df = pd.read_csv(io.StringIO(r.text), header=None, low_memory=False)
-        df = df.rename(columns=rename_map)
-        dfs.append(df[[c for c in df.columns if c in rename_map.values()]])
-    except Exception as e:
-        print(f"Error fetching Legacy Current: {e}")
+COT_FORMATS = ('columns', 'rows')
 
-    # 2. History
-    for year in YEARS_HISTORY:
-        url = URL_LEGACY_HIST.format(year)
-        try:
-            r = requests.get(url, headers=headers)
-            if r.status_code == 404:
-                # Fallback to deafut
-                fallback = f"https://www.cftc.gov/files/dea/history/deafut{year}.zip"
-                r = requests.get(fallback, headers=headers)
-            
-            if r.status_code == 404: continue
-            r.raise_for_status()
-            
-            with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-                with z.open(z.namelist()[0]) as f:
-                    df = pd.read_csv(f, header=None, low_memory=False)
-                    df = df.rename(columns=rename_map)
-                    dfs.append(df[[c for c in df.columns if c in rename_map.values()]])
-        except Exception as e:
-            print(f"Error fetching Legacy Hist {year}: {e}")
+CACHE_EXPIRY = 3600 * 24  # Age after which the current-year partition pulls the weekly file again
+# Served stores older than this (a missed weekly release) get a background refresh from the request path;
+# normally the scheduled refresh (jobs.COT_REFRESH_CRON) keeps them current
+COT_MAX_AGE = int(os.environ.get("COT_MAX_AGE", 8 * 24 * 3600))
+# After a failed background refresh, requests wait this long before triggering another one
+COT_REFRESH_RETRY_SECONDS = int(os.environ.get("COT_REFRESH_RETRY_SECONDS", 15 * 60))
+# Lookbacks (weeks) of the cross-market dashboard, precomputed with every store build
+COT_DASHBOARD_LOOKBACKS = [int(x) for x in os.environ.get("COT_DASHBOARD_LOOKBACKS", "13,26,52,156").split(",") if x.strip()]
 
-    if not dfs: return pd.DataFrame()
-    final = pd.concat(dfs, ignore_index=True)
-    final['date'] = pd.to_datetime(final['date'], errors='coerce')
-    final['cftc_code'] = final['cftc_code'].astype(str).str.strip()
-    
-    # Remove duplicates
-    final = final.drop_duplicates(subset=['date', 'cftc_code'], keep='last')
+CACHE_LAST_LOAD = {}
 
-    final.to_csv(CACHE_LEGACY, index=False)
-    return final
+def cot_years(today=None):
+    """Years covered by the store: COT_FIRST_YEAR up to (and including) the current year."""
+    today = today or datetime.date.today()
+    return list(range(COT_FIRST_YEAR, today.year + 1))
 
-def fetch_tff_data():
-    global CACHE_TFF_DF
-    if CACHE_TFF_DF is not None:
-        return CACHE_TFF_DF
-
-    if os.path.exists(CACHE_TFF):
-        mtime = os.path.getmtime(CACHE_TFF)
-        if datetime.datetime.now().timestamp() - mtime < CACHE_EXPIRY:
-             try:
-                 df = pd.read_csv(CACHE_TFF, dtype={'cftc_code': str}, parse_dates=['date'], low_memory=False)
-                 CACHE_TFF_DF = df
-                 return df
-             except: pass
-
-    print("Downloading CoT TFF Data...")
-    dfs = []
-    headers = {'User-Agent': 'Mozilla/5.0'}
-
-    rename_map = {
-        0: 'market_name', 2: 'date', 3: 'cftc_code',
-        7: 'open_interest',
-        8: 'dealer_long', 9: 'dealer_short',
-        11: 'asset_long', 12: 'asset_short',
-        14: 'lev_long', 15: 'lev_short',
-        17: 'other_long', 18: 'other_short',
-        20: 'nonrep_long', 21: 'nonrep_short'
-    }
+def _report_dir(report):
+    return os.path.join(COT_DATA_DIR, report)
+
+def _partition_path(report, year):
+    return os.path.join(_report_dir(report), f"{year}.csv")
 
-    # 1. Current URLs to try
-    current_urls = [
-        "https://www.cftc.gov/dea/newcot/FinFutWk.txt",
-        "https://www.cftc.gov/dea/newcot/FinFut.txt",
-        "https://www.cftc.gov/dea/newcot/fin_fut.txt"
-    ]
-    
-    current_found = False
-    for url in current_urls:
+def _manifest_path(report):
+    return os.path.join(_report_dir(report), "manifest.json")
+
+def _disk_cache_changed(path):
+    """True if the store was rewritten (e.g. by another worker) since this process loaded it."""
+    try:
+        return os.path.getmtime(path) != CACHE_LAST_LOAD.get(path)
+    except OSError:
+        return False
+
+def _remember_load(path):
+    try:
+        CACHE_LAST_LOAD[path] = os.path.getmtime(path)
+    except OSError:
+        pass
+
+def _parse_report(source, rename_map):
+    """CFTC text (headerless CSV) -> frame with our column names, typed date and stripped cftc_code."""
+    code_col = next(k for k, v in rename_map.items() if v == 'cftc_code')
+    # Codes keep their leading zeros
+    df = pd.read_csv(source, header=None, dtype={code_col: str}, low_memory=False)
+    df = df.rename(columns=rename_map)
+    df = df[[c for c in df.columns if c in rename_map.values()]]
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['cftc_code'] = df['cftc_code'].astype(str).str.strip()
+    return df
+
+def _download_year(report, year):
+    """
+    Yearly zip for one report. Returns the frame, or None if no URL has that year (404).
+    Network errors raise, so the year is retried on the next sync instead of being marked empty.
+    """
+    spec = REPORTS[report]
+    for template in spec["history_urls"]:
+        r = requests.get(template.format(year), headers=HTTP_HEADERS, timeout=60)
+        if r.status_code == 404:
+            continue
+        r.raise_for_status()
+        with zipfile.ZipFile(io.BytesIO(r.content)) as z:
+            with z.open(z.namelist()[0]) as f:
+                return _parse_report(f, spec["rename_map"])
+    return None
+
+def _download_current(report):
+    """Weekly file (latest report only). Returns None if no URL answered."""
+    spec = REPORTS[report]
+    for url in spec["current_urls"]:
         try:
-            print(f"Trying TFF Current: {url}")
-            r = requests.get(url, headers=headers)
+            r = requests.get(url, headers=HTTP_HEADERS, timeout=60)
             if r.status_code == 200:
-                df = pd.read_csv(io.StringIO(r.text), header=None, low_memory=False)
-                df = df.rename(columns=rename_map)
-                wanted = [c for c in df.columns if c in rename_map.values()]
-                dfs.append(df[wanted])
-                current_found = True
-                print("Success")
-                break
+                return _parse_report(io.StringIO(r.text), spec["rename_map"])
+            print(f"CoT {report} current {url}: HTTP {r.status_code}")
         except Exception as e:
             print(f"Err {url}: {e}")
-            
-    if not current_found:
-        print("TFF Current not found in any standard URL.")
-
-    # 2. History
-    for year in YEARS_HISTORY:
-        urls_hist = [
-            f"https://www.cftc.gov/files/dea/history/fin_fut_txt_{year}.zip",
-            f"https://www.cftc.gov/files/dea/history/fut_fin_txt_{year}.zip"
-        ]
-        
-        hist_found = False
-        for url in urls_hist:
+    print(f"CoT {report}: current file not found in any standard URL.")
+    return None
+
+def _write_partition(path, df):
+    # Write to a temp file and swap, readers never see half a partition
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+def _read_partition(path):
+    return pd.read_csv(path, dtype={'cftc_code': str}, parse_dates=['date'], low_memory=False)
+
+def _dedupe(df):
+    # Later rows win (weekly delta over yearly zip)
+    return df.drop_duplicates(subset=['date', 'cftc_code'], keep='last').reset_index(drop=True)
+
+def _partition_is_final(year, path, today=None):
+    """Closed years are immutable once fetched after the year (plus the settle period) was over."""
+    today = today or datetime.date.today()
+    if year >= today.year or not os.path.exists(path):
+        return False
+    settled = datetime.datetime(year + 1, 1, 1) + datetime.timedelta(days=COT_YEAR_SETTLE_DAYS)
+    return os.path.getmtime(path) >= settled.timestamp()
+
+def _backfill_year(report, year):
+    df = _download_year(report, year)
+    if df is None:
+        # Not published for this report (e.g. TFF before 2006): store an empty partition, don't ask again
+        print(f"CoT {report} {year}: not available")
+        df = pd.DataFrame(columns=list(REPORTS[report]["rename_map"].values()))
+    _write_partition(_partition_path(report, year), _dedupe(df))
+    return len(df)
+
+def sync_report(report, force_current=False):
+    """
+    Brings the partitioned store of one report up to date:
+    - closed years missing (or fetched before they settled) are downloaded once, in parallel;
+    - the current year is bootstrapped from its yearly zip, then only the weekly file is merged in
+      (when the partition is older than CACHE_EXPIRY or force_current is set).
+    Returns True if any partition was written.
+    """
+    os.makedirs(_report_dir(report), exist_ok=True)
+    today = datetime.date.today()
+    years = cot_years(today)
+    current_year = years[-1]
+
+    missing = [y for y in years[:-1] if not _partition_is_final(y, _partition_path(report, y), today)]
+    current_path = _partition_path(report, current_year)
+    if not os.path.exists(current_path):
+        missing.append(current_year)
+
+    changed = False
+    if missing:
+        print(f"Downloading CoT {report} history: {len(missing)} year(s)...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=COT_FETCH_WORKERS) as executor:
+            futures = {executor.submit(_backfill_year, report, y): y for y in missing}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                    changed = True
+                except Exception as e:
+                    print(f"Error fetching CoT {report} {futures[future]}: {e}")
+
+    stale = not os.path.exists(current_path) or \
+        datetime.datetime.now().timestamp() - os.path.getmtime(current_path) >= CACHE_EXPIRY
+    # A fresh bootstrap still needs the weekly file: the yearly zip may lag behind it
+    if force_current or stale or current_year in missing:
+        changed |= _merge_current(report)
+
+    if changed:
+        _write_manifest(report)
+    return changed
+
+def _partition_last_date(report, year):
+    path = _partition_path(report, year)
+    if not os.path.exists(path):
+        return None
+    dates = _read_partition(path)['date'].dropna()
+    return None if dates.empty else dates.max()
+
+def _merge_current(report):
+    """
+    Merges the weekly file into the partitions of the years it covers (delta only).
+    The weekly file holds one report: if the stored history stops more than COT_MAX_GAP_DAYS
+    before it (weeks missed while no refresh ran), the yearly zips fill the weeks in between.
+    """
+    delta = _download_current(report)
+    if delta is None or delta.empty:
+        return False
+
+    delta = delta.dropna(subset=['date'])
+    if delta.empty:
+        return False
+    first = delta['date'].min()
+    last_known = _partition_last_date(report, first.year)
+    if last_known is None:
+        last_known = _partition_last_date(report, first.year - 1)
+    if last_known is None or (first - last_known).days > COT_MAX_GAP_DAYS:
+        print(f"CoT {report}: gap before weekly file ({last_known} -> {first.date()}), re-pulling yearly zip")
+        gap_years = range(last_known.year if last_known is not None else first.year, first.year + 1)
+        for year in gap_years:
+            if year < COT_FIRST_YEAR:
+                continue
             try:
-                r = requests.get(url, headers=headers)
-                if r.status_code == 200:
-                    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-                        with z.open(z.namelist()[0]) as f:
-                            df = pd.read_csv(f, header=None, low_memory=False)
-                            df = df.rename(columns=rename_map)
-                            wanted = [c for c in df.columns if c in rename_map.values()]
-                            dfs.append(df[wanted])
-                    hist_found = True
-                    break
+                history = _download_year(report, year)
             except Exception as e:
-                # print(f"Err TFF Hist {year}: {e}")
-                pass
-        
-        if not hist_found:
-            pass
-
+                print(f"Error re-pulling CoT {report} {year}: {e}")
+                continue
+            if history is not None and not history.empty:
+                # Weekly rows stay last, so they win over the zip in _dedupe
+                delta = pd.concat([history.dropna(subset=['date']), delta], ignore_index=True)
+
+    changed = False
+    for year, rows in delta.groupby(delta['date'].dt.year):
+        path = _partition_path(report, int(year))
+        if not os.path.exists(path) and int(year) < COT_FIRST_YEAR:
+            continue
+        base = _read_partition(path) if os.path.exists(path) else None
+        if not _rows_change(report, base, rows):
+            continue
+        merged = rows if base is None or base.empty else pd.concat([base, rows], ignore_index=True)
+        _write_partition(path, _dedupe(merged))
+        changed = True
+    if not changed:
+        # Nothing new: record the check, so staleness (CACHE_EXPIRY, COT_MAX_AGE) counts from now
+        current_path = _partition_path(report, cot_years()[-1])
+        if os.path.exists(current_path):
+            os.utime(current_path)
+    return changed
+
+def _rows_change(report, base, rows):
+    """True if rows add a (date, cftc_code) to the partition or revise a stored value."""
+    if base is None or base.empty:
+        return True
+    keys = ['date', 'cftc_code']
+    def keyed(df):
+        df = df.assign(cftc_code=df['cftc_code'].astype(str).str.strip())
+        return df.drop_duplicates(subset=keys, keep='last').set_index(keys)
+    base, rows = keyed(base), keyed(rows)
+    if not rows.index.isin(base.index).all():
+        return True
+    cols = [c for c in value_columns(report) if c in rows.columns]
+    if any(c not in base.columns for c in cols):
+        return True
+    new = rows[cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    old = base.loc[rows.index, cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    return not np.allclose(new, old, equal_nan=True)
+
+def _write_manifest(report):
+    partitions = {}
+    for year in cot_years():
+        path = _partition_path(report, year)
+        if os.path.exists(path):
+            partitions[str(year)] = os.path.getmtime(path)
+    tmp = _manifest_path(report) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated_at": datetime.datetime.now().isoformat(), "partitions": partitions}, f)
+    os.replace(tmp, _manifest_path(report))
+
+def _read_partitions(report):
+    dfs = []
+    for year in cot_years():
+        path = _partition_path(report, year)
+        if not os.path.exists(path):
+            continue
+        try:
+            df = _read_partition(path)
+        except Exception as e:
+            print(f"Error reading CoT partition {path}: {e}")
+            continue
+        if not df.empty:
+            dfs.append(df)
     if not dfs: return pd.DataFrame()
-    final = pd.concat(dfs, ignore_index=True)
-    final['date'] = pd.to_datetime(final['date'], errors='coerce')
-    final['cftc_code'] = final['cftc_code'].astype(str).str.strip()
-    
-    # Remove duplicates (e.g. overlap between Current and History 2025)
-    final = final.drop_duplicates(subset=['date', 'cftc_code'], keep='last')
-    
-    final.to_csv(CACHE_TFF, index=False)
-    return final
+    return _dedupe(pd.concat(dfs, ignore_index=True))
 
-def fetch_disagg_data():
-    global CACHE_DISAGG_DF
-    if CACHE_DISAGG_DF is not None:
-        return CACHE_DISAGG_DF
-
-    if os.path.exists(CACHE_DISAGG):
-        mtime = os.path.getmtime(CACHE_DISAGG)
-        if datetime.datetime.now().timestamp() - mtime < CACHE_EXPIRY:
-             try:
-                 df = pd.read_csv(CACHE_DISAGG, dtype={'cftc_code': str}, parse_dates=['date'], low_memory=False)
-                 CACHE_DISAGG_DF = df
-                 return df
-             except: pass
-
-    print("Downloading CoT Disaggregated Data...")
-    dfs = []
-    headers = {'User-Agent': 'Mozilla/5.0'}
-
-    rename_map = {
-        0: 'market_name', 2: 'date', 3: 'cftc_code',
-        7: 'open_interest',
-        8: 'pm_long', 9: 'pm_short', # Producer/Merchant
-        10: 'swap_long', 11: 'swap_short', # Swap Dealers
-        13: 'mm_long', 14: 'mm_short', # Managed Money
-        16: 'other_long', 17: 'other_short',
-        19: 'nonrep_long', 20: 'nonrep_short' # Approx index, might need verifying
+def _read_manifest(report):
+    try:
+        with open(_manifest_path(report)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def value_columns(report):
+    return [c for c in REPORTS[report]["rename_map"].values() if c not in ('market_name', 'date', 'cftc_code')]
+
+def build_store(report):
+    """
+    Compacts the yearly partitions into one typed, binary row file sorted by (cftc_code, date)
+    plus a JSON index of each code's row range. Readers memory-map the row file and slice
+    a single market; the CSV partitions are only parsed here, when they changed.
+    """
+    df = _read_partitions(report)
+    cols = value_columns(report)
+    dtype = [('date', 'M8[ns]')] + [(c, 'f8') for c in cols]
+
+    codes = {}
+    if df.empty:
+        rows = np.zeros(0, dtype=dtype)
+    else:
+        df = df.dropna(subset=['date'])
+        df['cftc_code'] = df['cftc_code'].astype(str).str.strip()
+        df = df.sort_values(['cftc_code', 'date'], kind='stable').reset_index(drop=True)
+        rows = np.zeros(len(df), dtype=dtype)
+        rows['date'] = df['date'].values.astype('datetime64[ns]')
+        for c in cols:
+            if c in df.columns:
+                rows[c] = pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=float)
+            else:
+                rows[c] = np.nan
+
+        code_arr = df['cftc_code'].to_numpy()
+        uniq, first, counts = np.unique(code_arr, return_index=True, return_counts=True)
+        names = df['market_name'].astype(str).to_numpy() if 'market_name' in df.columns else None
+        for code, start, n in zip(uniq, first, counts):
+            codes[str(code)] = [int(start), int(start + n), str(names[start + n - 1]).strip() if names is not None else None]
+
+    # New row file per build; the index is swapped last, so readers see the old or the new store
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    row_file = f"rows-{stamp}.npy"
+    np.save(os.path.join(_report_dir(report), row_file), rows)
+    index = {
+        "file": row_file,
+        "manifest": _read_manifest(report).get("updated_at"),
+        "columns": cols,
+        "rows": int(len(rows)),
+        "codes": codes,
+        "dashboard": build_dashboard(report, rows, codes),
     }
-    # Note on Indices: 
-    # Swap Spreading is usually 12?
-    # MM Spreading usually 15?
-    # Other Spreading usually 18?
-    # So 16 for Other Long is correct if (13,14,15) are MM.
-    # NonReportable starts after Other Spread (18) + maybe Total reportable? No. 
-    # Standard Disagg: 
-    # ... Other Long(16), Other Short(17), Other Spread(18), Total Reportable(19?? No)
-    # Actually NonReportable Long (19) ? Let's Assume 19/20 for NonRep.
-
-    # 1. Current
-    # f_disagg.txt (Futures Only)
-    current_urls = [
-         "https://www.cftc.gov/dea/newcot/f_disagg.txt",
-         "https://www.cftc.gov/dea/newcot/c_disagg.txt" # Combined fallback
-    ]
-    
-    current_found = False
-    for url in current_urls:
+    tmp = _store_path(report) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, _store_path(report))
+
+    # Old row files stay readable for processes that still map them (unlinked, not truncated).
+    # Builds run under the report's refresh lock, so this never removes a concurrent build's file.
+    for name in os.listdir(_report_dir(report)):
+        if name.startswith("rows-") and name.endswith(".npy") and name != row_file:
+            try:
+                os.remove(os.path.join(_report_dir(report), name))
+            except OSError:
+                pass
+    print(f"CoT {report} store built: {len(rows)} rows, {len(codes)} markets")
+    return index
+
+def build_dashboard(report, rows, codes, lookbacks=None):
+    """
+    Latest positioning of every tracked market in one columnar table:
+    nets, 1-week net change and the COT index at each dashboard lookback.
+    """
+    lookbacks = lookbacks or COT_DASHBOARD_LOOKBACKS
+    series = COT_SERIES[report]
+    table = {f: [] for f in dashboard_fields(report, lookbacks)}
+
+    for ticker, code in TICKER_TO_CFTC.items():
+        hit = codes.get(code) or codes.get(code.lstrip('0'))
+        if hit is None or hit[1] <= hit[0]:
+            continue
+        chunk = rows[hit[0]:hit[1]]
+        table['ticker'].append(ticker)
+        table['cftc_code'].append(code)
+        table['market_name'].append(hit[2])
+        table['date'].append(str(np.datetime_as_string(chunk['date'][-1], unit='D')))
+        table['open_interest'].append(int(np.nan_to_num(chunk['open_interest'][-1])))
+        nets = np.column_stack([np.nan_to_num(chunk[long_col]) - np.nan_to_num(chunk[short_col])
+                                for _, long_col, short_col in series])
+        indices = calc_index_cols(nets, lookbacks)
+        for j, (name, _, _) in enumerate(series):
+            net = nets[:, j]
+            table[f'{name}_net'].append(int(net[-1]))
+            table[f'{name}_net_change'].append(int(net[-1] - net[-2]) if len(net) > 1 else None)
+            for lb in lookbacks:
+                latest = indices[lb][-1, j]
+                table[f'{name}_index_{lb}'].append(None if np.isnan(latest) else float(latest))
+    return table
+
+def dashboard_fields(report, lookbacks=None):
+    lookbacks = lookbacks or COT_DASHBOARD_LOOKBACKS
+    fields = ['ticker', 'cftc_code', 'market_name', 'date', 'open_interest']
+    for name, _, _ in COT_SERIES[report]:
+        fields += [f'{name}_net', f'{name}_net_change'] + [f'{name}_index_{lb}' for lb in lookbacks]
+    return fields
+
+def get_cot_dashboard(report_types=None):
+    """
+    Cross-market dashboard for the given (default: all) reports, served from the table
+    precomputed at store build time.
+    """
+    reports = {}
+    for report in report_types or list(REPORTS):
+        store = get_cot_store(report)
+        table = store.index.get("dashboard")
+        if table is None:
+            # Store built before dashboards existed
+            table = build_dashboard(report, store.rows, store.index["codes"])
+        reports[report] = table
+    return {"lookbacks": COT_DASHBOARD_LOOKBACKS, "reports": reports}
+
+def _store_path(report):
+    return os.path.join(_report_dir(report), "store.json")
+
+def _report_lock_path(report):
+    return os.path.join(_report_dir(report), ".refresh.lock")
+
+class CotStore:
+    """Read side of a built store: index in memory, rows memory-mapped."""
+
+    def __init__(self, report):
+        self.report = report
         try:
-            print(f"Trying Disagg Current: {url}")
-            r = requests.get(url, headers=headers)
-            if r.status_code == 200:
-                df = pd.read_csv(io.StringIO(r.text), header=None, low_memory=False)
-                # Map columns
-                # We only map what we need
-                # If indices are shifted in c_disagg (Combined), this might break. 
-                # Ideally check file type. Assuming f_disagg works.
-                df_mapped = df.rename(columns=rename_map)
-                wanted = [c for c in df_mapped.columns if c in rename_map.values()]
-                dfs.append(df_mapped[wanted])
-                current_found = True
-                print("Success")
-                break
-        except Exception as e:
-            print(f"Err {url}: {e}")
-            
-    # 2. History
-    for year in YEARS_HISTORY:
-        # https://www.cftc.gov/files/dea/history/fut_disagg_txt_2024.zip
-        urls_hist = [
-            f"https://www.cftc.gov/files/dea/history/fut_disagg_txt_{year}.zip"
-        ]
-        
-        for url in urls_hist:
+            self._load()
+        except FileNotFoundError:
+            # A rebuild swapped the index and removed its row file between our two reads
+            self._load()
+
+    def _load(self):
+        with open(_store_path(self.report)) as f:
+            self.index = json.load(f)
+        self.columns = self.index["columns"]
+        self.rows = np.load(os.path.join(_report_dir(self.report), self.index["file"]), mmap_mode='r')
+
+    def _range(self, code):
+        code = str(code).strip()
+        hit = self.index["codes"].get(code)
+        if hit is None:
+            # Codes parsed as numbers lost their leading zeros
+            hit = self.index["codes"].get(code.lstrip('0'))
+        return hit
+
+    def market(self, code):
+        """Rows of one market as a DataFrame sorted by date (None if the code is unknown)."""
+        hit = self._range(code)
+        if hit is None:
+            return None
+        chunk = np.asarray(self.rows[hit[0]:hit[1]])
+        df = pd.DataFrame({c: chunk[c] for c in chunk.dtype.names})
+        df['cftc_code'] = str(code)
+        df['market_name'] = hit[2]
+        return df
+
+    def frame(self):
+        """All rows (full read, for bulk consumers)."""
+        chunk = np.asarray(self.rows)
+        df = pd.DataFrame({c: chunk[c] for c in chunk.dtype.names})
+        code_col = np.empty(len(df), dtype=object)
+        name_col = np.empty(len(df), dtype=object)
+        for code, (start, end, name) in self.index["codes"].items():
+            code_col[start:end] = code
+            name_col[start:end] = name
+        df['cftc_code'] = code_col
+        df['market_name'] = name_col
+        return df
+
+CACHE_STORES = {}
+_REFRESH_LOCKS = {report: threading.Lock() for report in REPORTS}
+_REFRESH_EXECUTOR = None
+_REFRESH_EXECUTOR_LOCK = threading.Lock()
+_REFRESH_PENDING = {}      # report -> future of the queued/running background refresh
+_REFRESH_FAILED_AT = {}    # report -> time of the last failed background refresh
+
+def _store_is_current(report):
+    try:
+        with open(_store_path(report)) as f:
+            built_from = json.load(f).get("manifest")
+    except (OSError, ValueError):
+        return False
+    return built_from is not None and built_from == _read_manifest(report).get("updated_at")
+
+def refresh_report(report, force_current=True):
+    """
+    Syncs a report (weekly file merged in when force_current), rebuilds its store if the
+    partitions changed, then swaps the new store in. Requests keep reading the previous
+    store until the swap, so they never see a partial update. Returns a short status string.
+    Sync and build run under a per-report file lock: a worker that finds another process
+    refreshing waits for it (then finds the partitions fresh) instead of racing its writes
+    and deleting the row file the other one just built.
+    """
+    lock = _REFRESH_LOCKS.setdefault(report, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return "in_progress"
+    try:
+        os.makedirs(_report_dir(report), exist_ok=True)
+        with open(_report_lock_path(report), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
             try:
-                r = requests.get(url, headers=headers)
-                if r.status_code == 200:
-                    with zipfile.ZipFile(io.BytesIO(r.content)) as z:
-                        with z.open(z.namelist()[0]) as f:
-                            df = pd.read_csv(f, header=None, low_memory=False)
-                            df = df.rename(columns=rename_map)
-                            wanted = [c for c in df.columns if c in rename_map.values()]
-                            dfs.append(df[wanted])
-                    break
-            except: pass
+                changed = sync_report(report, force_current=force_current)
+                if changed or not _store_is_current(report):
+                    build_store(report)
+                elif CACHE_STORES.get(report) is not None and not _disk_cache_changed(_store_path(report)):
+                    return "unchanged"
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        store = CotStore(report)
+        CACHE_STORES[report] = store
+        _remember_load(_store_path(report))
+        return "updated" if changed else "reloaded"
+    finally:
+        lock.release()
+
+def refresh_cot(reports=None):
+    """Refreshes all (or the given) reports, e.g. from the weekly scheduled job."""
+    summary = {}
+    for report in reports or list(REPORTS):
+        try:
+            summary[report] = refresh_report(report)
+        except Exception as e:
+            print(f"CoT refresh {report} failed: {e}")
+            summary[report] = f"error: {e}"
+    return summary
 
-    if not dfs: return pd.DataFrame()
-    final = pd.concat(dfs, ignore_index=True)
-    final['date'] = pd.to_datetime(final['date'], errors='coerce')
-    final['cftc_code'] = final['cftc_code'].astype(str).str.strip()
-    
-    # Remove duplicates
-    final = final.drop_duplicates(subset=['date', 'cftc_code'], keep='last')
-    
-    final.to_csv(CACHE_DISAGG, index=False)
-    return final
+def _refresh_done(report, future):
+    try:
+        future.result()
+        _REFRESH_FAILED_AT.pop(report, None)
+    except Exception as e:
+        print(f"CoT background refresh {report} failed: {e}")
+        _REFRESH_FAILED_AT[report] = datetime.datetime.now().timestamp()
+
+def refresh_report_async(report):
+    """
+    Schedules a refresh on a background thread; never blocks the caller. At most one refresh
+    per report is pending, and none is scheduled within COT_REFRESH_RETRY_SECONDS of a failed one.
+    Returns the pending future, or None when backing off.
+    """
+    global _REFRESH_EXECUTOR
+    with _REFRESH_EXECUTOR_LOCK:
+        pending = _REFRESH_PENDING.get(report)
+        if pending is not None and not pending.done():
+            return pending
+        failed_at = _REFRESH_FAILED_AT.get(report)
+        if failed_at is not None and datetime.datetime.now().timestamp() - failed_at < COT_REFRESH_RETRY_SECONDS:
+            return None
+        if _REFRESH_EXECUTOR is None:
+            _REFRESH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=len(REPORTS),
+                                                                     thread_name_prefix="cot-refresh")
+        future = _REFRESH_EXECUTOR.submit(refresh_report, report, False)
+        _REFRESH_PENDING[report] = future
+    future.add_done_callback(lambda f: _refresh_done(report, f))
+    return future
+
+def _store_age(report):
+    try:
+        return datetime.datetime.now().timestamp() - os.path.getmtime(_partition_path(report, cot_years()[-1]))
+    except OSError:
+        return None
+
+def get_cot_store(report):
+    """
+    Opened store of a report. Requests never download: an existing store is served
+    (reopened if another worker rebuilt it) and a stale one is refreshed in the background.
+    Only a report that was never ingested is fetched synchronously.
+    """
+    store = CACHE_STORES.get(report)
+    if store is None or _disk_cache_changed(_store_path(report)):
+        if not os.path.exists(_store_path(report)):
+            refresh_report(report, force_current=False)
+            store = CACHE_STORES.get(report)
+            if store is None:
+                # Another thread holds the refresh lock: wait for its swap
+                with _REFRESH_LOCKS[report]:
+                    store = CACHE_STORES.get(report) or CotStore(report)
+            return store
+        store = CotStore(report)
+        CACHE_STORES[report] = store
+        _remember_load(_store_path(report))
+
+    age = _store_age(report)
+    if age is None or age > COT_MAX_AGE:
+        refresh_report_async(report)
+    return store
+
+def fetch_legacy_data():
+    return get_cot_store("legacy").frame()
+
+def fetch_tff_data():
+    return get_cot_store("tff").frame()
+
+def fetch_disagg_data():
+    return get_cot_store("disaggregated").frame()
 
 def calc_index_col(series, weeks=26):
-        s = series.astype(float)
-        rmin = s.rolling(window=weeks).min()
-        rmax = s.rolling(window=weeks).max()
-        denom = rmax - rmin
-        denom = denom.replace(0, np.nan) 
-        idx = 100 * (s - rmin) / denom 
-        # Standard 0-100 logic
-        return idx
+        # Standard 0-100 logic (NaN while the window fills or when it is flat)
+        idx = rolling_range_index(series.to_numpy(dtype=float), [weeks])[weeks]
+        return pd.Series(idx, index=series.index)
+
+def calc_index_cols(nets, lookbacks):
+        """COT indices of several net series (columns of nets) for several lookbacks in one pass."""
+        return rolling_range_index(nets, lookbacks)
         
-def get_cot_data(ticker, report_type='legacy', lookback_weeks=26):
+def _nullable(values):
+    """Float array -> list with None where NaN (JSON null)."""
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+def _cot_output(columns, fields, fmt):
+    if fmt == 'rows':
+        return [dict(zip(fields, vals)) for vals in zip(*(columns[f] for f in fields))]
+    return {f: columns[f] for f in fields}
+
+def get_cot_data(ticker, report_type='legacy', lookback_weeks=26, fmt='columns'):
+    """
+    Weekly nets and 0-100 COT indices of one market.
+    fmt 'columns' returns {field: [values...]}, 'rows' a list of {field: value} dicts.
+    """
     print(f"DEBUG: get_cot_data {ticker} type={report_type} lookback={lookback_weeks}")
+    report = report_type if report_type in COT_SERIES else 'legacy'
+    fields = COT_FIELDS[report]
+    empty = _cot_output({f: [] for f in fields}, fields, fmt)
+
     code = TICKER_TO_CFTC.get(ticker)
-    if not code: return []
-
-    if report_type == 'tff':
-        df = fetch_tff_data()
-        cols_num = ['dealer_long', 'dealer_short', 'asset_long', 'asset_short', 
-                    'lev_long', 'lev_short', 'other_long', 'other_short', 
-                    'nonrep_long', 'nonrep_short', 'open_interest']
-    elif report_type == 'disaggregated':
-        df = fetch_disagg_data()
-        cols_num = ['pm_long', 'pm_short', 'swap_long', 'swap_short', 
-                    'mm_long', 'mm_short', 'other_long', 'other_short',
-                    'nonrep_long', 'nonrep_short', 'open_interest']
-    else:
-        df = fetch_legacy_data()
-        cols_num = ['comm_long', 'comm_short', 'noncomm_long', 'noncomm_short', 
-                    'nonrep_long', 'nonrep_short', 'open_interest']
+    if not code: return empty
 
-    if df.empty: return []
+    # Only this market's rows are read (store is sorted by code, then date)
+    subset = get_cot_store(report).market(code)
+    if subset is None or subset.empty: return empty
 
-    df['cftc_code'] = df['cftc_code'].astype(str).str.strip()
-    subset = df[df['cftc_code'] == code]
-    if subset.empty:
-        short_code = code.lstrip('0')
-        subset = df[df['cftc_code'] == short_code]
-    
-    if subset.empty: return []
-    subset = subset.sort_values('date')
-
-    for c in cols_num:
-        if c in subset.columns:
-            subset[c] = pd.to_numeric(subset[c], errors='coerce').fillna(0)
-    
-    out = []
-    
     # Ensure lookback_weeks is integer
     try:
         lb = int(lookback_weeks)
     except:
         lb = 26
 
-    if report_type == 'tff':
-        # Calculate Nets
-        subset['dealer_net'] = subset['dealer_long'] - subset['dealer_short']
-        subset['asset_net'] = subset['asset_long'] - subset['asset_short']
-        subset['lev_net'] = subset['lev_long'] - subset['lev_short']
-        
-        # Calculate Index
-        subset['dealer_index'] = calc_index_col(subset['dealer_net'], weeks=lb)
-        subset['asset_index'] = calc_index_col(subset['asset_net'], weeks=lb)
-        subset['lev_index'] = calc_index_col(subset['lev_net'], weeks=lb)
-        
-        for _, row in subset.iterrows():
-             try:
-                def gv(v): return float(v) if pd.notna(v) else None
-                out.append({
-                    "date": row['date'].strftime("%Y-%m-%d"),
-                    "open_interest": int(row.get('open_interest', 0)),
-                    "dealer_net": int(row['dealer_net']),
-                    "dealer_index": gv(row['dealer_index']),
-                    "asset_net": int(row['asset_net']),
-                    "asset_index": gv(row['asset_index']),
-                    "lev_net": int(row['lev_net']),
-                    "lev_index": gv(row['lev_index'])
-                })
-             except: continue
-    
-    elif report_type == 'disaggregated':
-        # Nets
-        subset['pm_net'] = subset['pm_long'] - subset['pm_short']
-        subset['swap_net'] = subset['swap_long'] - subset['swap_short']
-        subset['mm_net'] = subset['mm_long'] - subset['mm_short']
-        
-        # Index
-        subset['pm_index'] = calc_index_col(subset['pm_net'], weeks=lb)
-        subset['swap_index'] = calc_index_col(subset['swap_net'], weeks=lb)
-        subset['mm_index'] = calc_index_col(subset['mm_net'], weeks=lb)
-        
-        for _, row in subset.iterrows():
-             try:
-                def gv(v): return float(v) if pd.notna(v) else None
-                out.append({
-                    "date": row['date'].strftime("%Y-%m-%d"),
-                    "open_interest": int(row.get('open_interest', 0)),
-                    "pm_net": int(row['pm_net']),
-                    "pm_index": gv(row['pm_index']),
-                    "swap_net": int(row['swap_net']),
-                    "swap_index": gv(row['swap_index']),
-                    "mm_net": int(row['mm_net']),
-                    "mm_index": gv(row['mm_index'])
-                })
-             except: continue
+    def col(name):
+        return np.nan_to_num(subset[name].to_numpy(dtype=float), nan=0.0)
 
-    else:
-        # Legacy
-        subset['commercial_net'] = subset['comm_long'] - subset['comm_short']
-        subset['large_spec_net'] = subset['noncomm_long'] - subset['noncomm_short']
-        subset['small_spec_net'] = subset['nonrep_long'] - subset['nonrep_short']
-        
-        subset['commercial_index'] = calc_index_col(subset['commercial_net'], weeks=lb)
-        subset['large_spec_index'] = calc_index_col(subset['large_spec_net'], weeks=lb)
-        subset['small_spec_index'] = calc_index_col(subset['small_spec_net'], weeks=lb)
-        
-        for _, row in subset.iterrows():
-             try:
-                def gv(v): return float(v) if pd.notna(v) else None
-                out.append({
-                    "date": row['date'].strftime("%Y-%m-%d"),
-                    "open_interest": int(row['open_interest']),
-                    "commercial_net": int(row['commercial_net']),
-                    "large_spec_net": int(row['large_spec_net']),
-                    "small_spec_net": int(row['small_spec_net']),
-                    "commercial_index": gv(row['commercial_index']),
-                    "large_spec_index": gv(row['large_spec_index']),
-                    "small_spec_index": gv(row['small_spec_index'])
-                })
-             except: continue
-
-    return out
+    columns = {
+        'date': np.datetime_as_string(subset['date'].to_numpy(dtype='datetime64[ns]'), unit='D').tolist(),
+        'open_interest': col('open_interest').astype(np.int64).tolist(),
+    }
+    series = COT_SERIES[report]
+    nets = np.column_stack([col(long_col) - col(short_col) for _, long_col, short_col in series])
+    indices = calc_index_cols(nets, [lb])[lb]
+    for j, (name, _, _) in enumerate(series):
+        columns[f'{name}_net'] = nets[:, j].astype(np.int64).tolist()
+        columns[f'{name}_index'] = _nullable(indices[:, j])
+
+    return _cot_output(columns, fields, fmt)
 
 if __name__ == "__main__":
     pass
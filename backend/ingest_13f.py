@@ -3,13 +3,78 @@ import requests
 import json
 import time
 import os
+import io
+import queue
+import threading
+import concurrent.futures
 import xml.etree.ElementTree as ET
 from datetime import datetime
-from institutional_db import get_db_connection
+from institutional_db import get_db_connection, init_db, load_ticker_map, name_key
 
 # Configuration
 USER_AGENT = "LucidAlphaResearch contact@lucidalpha.com" # Must be valid format
 TOP_FUNDS_FILE = "backends_data/top_funds.json"
+SEC_MAX_RPS = float(os.environ.get("SEC_MAX_RPS", "8"))  # SEC fair-access limit is 10 req/s per client
+SEC_MAX_RETRIES = int(os.environ.get("SEC_MAX_RETRIES", "3"))
+INGEST_FETCH_WORKERS = int(os.environ.get("INGEST_FETCH_WORKERS", "8"))
+INGEST_PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", "2"))
+FILING_INDEX_DIR = os.environ.get("FILING_INDEX_DIR", "backends_data/filing_index")  # Cached index.json listings
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "5000"))  # Holdings per executemany
+INGEST_STREAM_CHUNKS = int(os.environ.get("INGEST_STREAM_CHUNKS", "2"))  # Parsed batches buffered per filing
+TICKER_PREFIX_CHARS = 40  # Longest issuer-name prefix probed in ticker_map (longer keys never match)
+
+INSERT_HOLDING_SQL = '''
+    INSERT INTO holdings (accession_number, cusip, name, shares, value, ticker,
+                          title_of_class, share_type, put_call, investment_discretion,
+                          voting_sole, voting_shared, voting_none)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# One limiter for every SEC request of this process (all funds, all stages).
+# Small burst so no 1s window exceeds rate + 2 requests
+SEC_LIMITER = TokenBucket(SEC_MAX_RPS, capacity=2)
+SEC_SESSION = requests.Session()
+
+
+def sec_get(url, headers=None, timeout=20):
+    """Rate-limited GET against sec.gov; backs off and retries on 429/5xx."""
+    headers = headers or {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+    for attempt in range(SEC_MAX_RETRIES + 1):
+        SEC_LIMITER.acquire()
+        r = SEC_SESSION.get(url, headers=headers, timeout=timeout)
+        if r.status_code != 429 and r.status_code < 500:
+            return r
+        if attempt < SEC_MAX_RETRIES:
+            try:
+                delay = float(r.headers.get("Retry-After", 0))
+            except ValueError:
+                delay = 0
+            time.sleep(max(delay, 2 ** attempt))
+    return r
 
 def load_top_funds():
     if not os.path.exists(TOP_FUNDS_FILE):
@@ -26,7 +91,7 @@ def fetch_filings_list(cik):
     headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate", "Host": "data.sec.gov"}
     
     try:
-        r = requests.get(url, headers=headers, timeout=20)
+        r = sec_get(url, headers=headers, timeout=20)
         if r.status_code != 200:
             print(f"Error {r.status_code} fetching CIK {cik}: {r.text[:100]}")
             return []
@@ -69,25 +134,89 @@ def fetch_filings_list(cik):
         print(f"Fetch list error: {e}")
         return []
 
+def _filing_base_url(cik, accession_number):
+    return f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{accession_number.replace('-', '')}"
+
+def _listing_cache_path(accession_number):
+    return os.path.join(FILING_INDEX_DIR, f"{accession_number}.json")
+
+def fetch_filing_listing(cik, accession_number):
+    """
+    File listing of a filing from its machine-readable index.json (one request).
+    Listings never change once filed, so they are cached on disk by accession number.
+    Returns a list of {"name", "type", "size"} dicts, or None if unavailable.
+    """
+    path = _listing_cache_path(accession_number)
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    url = f"{_filing_base_url(cik, accession_number)}/index.json"
+    try:
+        r = sec_get(url, timeout=20)
+        if r.status_code != 200:
+            print(f"Filing index not found: {url} ({r.status_code})")
+            return None
+        items = r.json().get("directory", {}).get("item", [])
+    except Exception as e:
+        print(f"Filing index error {url}: {e}")
+        return None
+
+    listing = [{"name": i.get("name"), "type": i.get("type"), "size": i.get("size")} for i in items if i.get("name")]
+    os.makedirs(FILING_INDEX_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(listing, f)
+    os.replace(tmp, path)
+    return listing
+
+def resolve_infotable_name(listing, primary_doc):
+    """Picks the information table among the filing's XML files (not the cover page)."""
+    primary = (primary_doc or "").split("/")[-1].lower()
+    xmls = [i for i in listing if i["name"].lower().endswith(".xml") and i["name"].lower() != primary]
+    if not xmls:
+        return None
+    for i in xmls:
+        name = i["name"].lower()
+        if 'infotable' in name or 'information' in name or 'holding' in name:
+            return i["name"]
+
+    # Otherwise the holdings table is the largest remaining XML
+    def size(i):
+        try:
+            return int(i.get("size") or 0)
+        except (TypeError, ValueError):
+            return 0
+    return max(xmls, key=size)["name"]
+
 def fetch_infotable_xml(cik, accession_number, primary_doc):
     """
-    To find the infotable, we often need to look at the index page or guess.
-    Most 13F-HRs have a separate 'xml' for the InfoTable. 
-    Standard naming often: 'infotable.xml' or similar. 
-    However, parsing the main HTML/XML of the filing might link to it.
-    
-    Robust way: Use SEC Archive index.json or scrape the index page.
-    Let's try standard 'infotable.xml' or 'InfoTable.xml' if the primary doc isn't it.
-    Actually primary_doc usually contains the COVER PAGE. The Data is in the InfoTable.
+    Downloads a filing's information table. The file name comes from the cached
+    index.json listing, so a filing costs one listing request (first time only)
+    plus the XML itself; name guessing is only the fallback when no listing exists.
     """
-    
+    base_url = _filing_base_url(cik, accession_number)
+    listing = fetch_filing_listing(cik, accession_number)
+    if listing is not None:
+        name = resolve_infotable_name(listing, primary_doc)
+        if not name:
+            print(f"No information table in listing of {accession_number}: {[i['name'] for i in listing]}")
+            return None
+        r = sec_get(f"{base_url}/{name}")
+        if r.status_code == 200:
+            return r.content
+        print(f"Information table {name} of {accession_number}: HTTP {r.status_code}")
+        return None
+
+    return _guess_infotable_xml(cik, accession_number)
+
+def _guess_infotable_xml(cik, accession_number):
+    """Fallback without a listing: guess common names, then scan the -index.html page."""
     acc_clean = accession_number.replace('-', '')
     base_url = f"https://www.sec.gov/Archives/edgar/data/{cik}/{acc_clean}"
     
-    # Try finding the index.json or parsing index page is hard without scraping tools.
-    # Let's try to fetch the index.xml or similar? 
-    # Known trick: `index.xml` might list files.
-    
     # Hack/Optimization: many modern 13Fs name it 'infotable.xml'
     # Let's try explicit common names.
     candidates = ["infotable.xml", "InfoTable.xml", "xml/infotable.xml"]
@@ -97,18 +226,17 @@ def fetch_infotable_xml(cik, accession_number, primary_doc):
     for c in candidates:
         url = f"{base_url}/{c}"
         try:
-            r = requests.get(url, headers=headers, timeout=5)
+            r = sec_get(url, headers=headers, timeout=5)
             if r.status_code == 200:
                 return r.content
         except:
             pass
-        time.sleep(0.1)
         
     # If failed, we might need to look at the Filing Summary or search the index page.
     # Parsing the index page (HTML) to find the xml file ending in .xml that is NOT the primary doc?
     try:
         index_url = f"{base_url}/{accession_number}-index.html"
-        r = requests.get(index_url, headers=headers)
+        r = sec_get(index_url, headers=headers)
         if r.status_code == 200:
             # Simple string find for .xml
             # This is rough but effective for a "Hack"
@@ -121,7 +249,7 @@ def fetch_infotable_xml(cik, accession_number, primary_doc):
                      fname = l.split('/')[-1]
                      xml_url = f"{base_url}/{fname}"
                      print(f"Propsective XML: {xml_url}")
-                     rx = requests.get(xml_url, headers=headers)
+                     rx = sec_get(xml_url, headers=headers)
                      if rx.status_code == 200:
                          return rx.content
             print(f"Index scan found potential XMLs but no match: {links}")
@@ -134,145 +262,287 @@ def fetch_infotable_xml(cik, accession_number, primary_doc):
     print(f"FAILED to find XML for {accession_number}. Base: {base_url}")
     return None
 
+# Infotable element (local name, namespace stripped) -> (record field, type)
+INFOTABLE_FIELDS = {
+    "nameOfIssuer": ("name", str),
+    "titleOfClass": ("title_of_class", str),
+    "cusip": ("cusip", str),
+    "value": ("value", float), # x1000 usually
+    "sshPrnamt": ("shares", float),
+    "sshPrnamtType": ("share_type", str),
+    "putCall": ("put_call", str),
+    "investmentDiscretion": ("investment_discretion", str),
+    "Sole": ("voting_sole", int),
+    "Shared": ("voting_shared", int),
+    "None": ("voting_none", int),
+}
+INFOTABLE_RECORD_FIELDS = [field for field, _ in INFOTABLE_FIELDS.values()]
+
+_LOCAL_NAMES = {}
+
+def _local_name(tag):
+    # '{http://www.sec.gov/edgar/document/thirteenf/informationtable}infoTable' -> 'infoTable'
+    name = _LOCAL_NAMES.get(tag)
+    if name is None:
+        name = _LOCAL_NAMES[tag] = tag.rsplit('}', 1)[-1]
+    return name
+
+def iter_infotable(xml_content):
+    """
+    Streams holdings out of a 13F information table with iterparse: one pass,
+    namespace-agnostic, each <infoTable> is cleared once read so memory stays bounded
+    by one entry instead of the whole document. Yields typed holding dicts.
+    """
+    source = io.BytesIO(xml_content) if isinstance(xml_content, (bytes, bytearray)) else xml_content
+    root = None
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if _local_name(elem.tag) != "infoTable":
+            continue
+
+        record = dict.fromkeys(INFOTABLE_RECORD_FIELDS)
+        for child in elem.iter():
+            spec = INFOTABLE_FIELDS.get(_local_name(child.tag))
+            if spec is None or child.text is None:
+                continue
+            field, cast = spec
+            text = child.text.strip()
+            try:
+                record[field] = cast(float(text)) if cast is int else cast(text)
+            except ValueError:
+                pass
+        record["ticker"] = None # CUSIP mapping needed later
+
+        elem.clear()
+        if root is not None:
+            root.clear() # Drop references to already processed entries
+
+        if record["name"] and record["value"] is not None and record["shares"] is not None:
+            yield record
+
 def parse_infotable(xml_content):
-    """Parses standard 13F InfoTable XML"""
+    """Parses standard 13F InfoTable XML into a list (the ingest pipeline streams instead)."""
     print(f"Parsing XML content ({len(xml_content)} bytes)...")
     try:
-        root = ET.fromstring(xml_content)
-        # Namespace handling
-        # 13F XMLs often have namespaces like {http://www.sec.gov/edgar/document/thirteenf/informationtable}
-        # We strip namespaces for easier parsing
-        
-        holdings = []
-        for info in root.findall(".//*"):
-            # We iterate all nodes to find 'infoTable' equivalent regardless of namespace
-            if 'infoTable' in info.tag:
-                # Extract data
-                # Need recursive search for children due to namespaces
-                def get_val(parent, tag_part):
-                     for child in parent:
-                         if tag_part.lower() in child.tag.lower():
-                             return child.text
-                     return None
-                
-                # Deeper helpers for nested like <shrsOrPrnAmt><sshPrnamt>
-                def get_nested_val(parent, path):
-                     # path = ["shrsOrPrnAmt", "sshPrnamt"]
-                     curr = parent
-                     for p in path:
-                         found = False
-                         for child in curr:
-                             if p.lower() in child.tag.lower():
-                                 curr = child
-                                 found = True
-                                 break
-                         if not found: return None
-                     return curr.text
-
-                name = get_val(info, 'nameOfIssuer')
-                class_title = get_val(info, 'titleOfClass')
-                cusip = get_val(info, 'cusip')
-                value = get_val(info, 'value') # x1000 usually
-                
-                shares = get_nested_val(info, ["shrsOrPrnAmt", "sshPrnamt"])
-                
-                if name and value and shares:
-                    holdings.append({
-                        "name": name,
-                        "cusip": cusip,
-                        "value": float(value),
-                        "shares": float(shares),
-                        "ticker": None # CUSIP mapping needed later
-                    })
+        holdings = list(iter_infotable(xml_content))
         print(f"Parsed {len(holdings)} holdings.")
         return holdings
     except Exception as e:
         print(f"XML Parse Error: {e}")
         return []
 
-def ingest_fund(fund):
+_STREAM_END = object()
+
+class HoldingStream:
+    """
+    Holdings of one filing handed from its parse thread to the DB writer in
+    INGEST_BATCH_SIZE batches through a small bounded queue: the parser blocks while
+    the writer is busy, so at most INGEST_STREAM_CHUNKS batches per filing are in memory.
+    """
+
+    def __init__(self, maxsize=INGEST_STREAM_CHUNKS):
+        self._chunks = queue.Queue(maxsize=maxsize)
+        self.finished = False
+
+    def put(self, batch):
+        self._chunks.put(batch)
+
+    def close(self, error=None):
+        self._chunks.put(_STREAM_END if error is None else error)
+
+    def __iter__(self):
+        while not self.finished:
+            chunk = self._chunks.get()
+            if chunk is _STREAM_END or isinstance(chunk, Exception):
+                self.finished = True
+                if chunk is not _STREAM_END:
+                    raise chunk
+                return
+            yield from chunk
+
+    def discard(self):
+        """Drains the rest of the stream so its parse thread can finish."""
+        try:
+            for _ in self:
+                pass
+        except Exception:
+            pass
+
+def stream_infotable(xml_content, f, write_q):
+    """
+    Parse stage: queues the filing for the writer, then feeds it the parsed holdings
+    batch by batch. Returns the number of holdings parsed.
+    """
+    stream = HoldingStream()
+    write_q.put(("filing", f, stream))
+    count = 0
+    error = None
+    try:
+        batch = []
+        for record in iter_infotable(xml_content):
+            batch.append(record)
+            if len(batch) >= INGEST_BATCH_SIZE:
+                stream.put(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            stream.put(batch)
+            count += len(batch)
+    except Exception as e:
+        print(f"XML Parse Error ({f['accession_number']}): {e}")
+        error = e
+    stream.close(error)
+    return count
+
+def resolve_ticker(name, ticker_map):
+    """
+    Probes the character prefixes of the normalized issuer name (longest first) in the
+    ticker_map dict, so 'NVIDIA CORP' also matches 'NVIDIA CORPORATION': a bounded number
+    of hash lookups per holding instead of a substring scan over every mapping.
+    """
+    key = name_key(name)
+    for n in range(min(len(key), TICKER_PREFIX_CHARS), 0, -1):
+        ticker = ticker_map.get(key[:n])
+        if ticker:
+            return ticker
+    return None
+
+def write_filing(c, f, holdings, ticker_map):
+    """
+    Stores one parsed filing and its holdings (any iterable, e.g. a HoldingStream) in
+    executemany batches. Returns the number of holdings written.
+    """
+    # Insert Filing
+    c.execute("INSERT OR REPLACE INTO filings (accession_number, cik, report_date, filed_date) VALUES (?, ?, ?, ?)",
+              (f['accession_number'], f['cik'], f['report_date'], f['filed_date']))
+    # Re-ingesting a filing replaces its holdings
+    c.execute("DELETE FROM holdings WHERE accession_number = ?", (f['accession_number'],))
+
+    # Insert Holdings
+    # Tickers come from the ticker_map table (issuer-name prefixes), CUSIP is kept for a later mapping.
+    batch = []
+    count = 0
+    for h in holdings:
+        count += 1
+        batch.append((f['accession_number'], h['cusip'], h['name'], h['shares'], h['value'],
+                      resolve_ticker(h['name'], ticker_map),
+                      h.get('title_of_class'), h.get('share_type'), h.get('put_call'), h.get('investment_discretion'),
+                      h.get('voting_sole'), h.get('voting_shared'), h.get('voting_none')))
+        if len(batch) >= INGEST_BATCH_SIZE:
+            c.executemany(INSERT_HOLDING_SQL, batch)
+            batch = []
+    if batch:
+        c.executemany(INSERT_HOLDING_SQL, batch)
+    return count
+
+def _db_writer(write_q, stats):
+    """Single writer thread: SQLite takes one writer at a time, so all inserts go through here."""
     conn = get_db_connection()
+    ticker_map = load_ticker_map(conn)
     c = conn.cursor()
-    
-    # Insert Fund
-    c.execute("INSERT OR REPLACE INTO funds (cik, name) VALUES (?, ?)", (fund['cik'], fund['name']))
-    
-    filings = fetch_filings_list(fund['cik'])
-    
-    for f in filings:
-        # Check if already exists
-        c.execute("SELECT 1 FROM filings WHERE accession_number = ?", (f['accession_number'],))
-        if c.fetchone():
-            print(f"Skipping existing filing {f['accession_number']}")
-            continue
-            
-        print(f"Processing Filing {f['accession_number']} ({f['report_date']})")
-        xml = fetch_infotable_xml(f['cik'], f['accession_number'], f['primary_doc'])
-        
-        if xml:
-            holdings = parse_infotable(xml)
-            if holdings:
-                # Insert Filing
-                c.execute("INSERT OR REPLACE INTO filings (accession_number, cik, report_date, filed_date) VALUES (?, ?, ?, ?)",
-                          (f['accession_number'], f['cik'], f['report_date'], f['filed_date']))
-                
-                # Insert Holdings
-                # Note: We need CUSIP mapping. For now we save CUSIP. 
-                # Ideally we have a CUSIP->Ticker DB. 
-                # Or we can use 'nameOfIssuer' to fuzzy match ticker if needed, but CUSIP is key.
-                # For this MVP, we save the holding.
-                
-                # Simple Ticker Mapping for MVP
-                TICKER_MAP = {
-                    'APPLE INC': 'AAPL', 'APPLE COMPUTER': 'AAPL',
-                    'NVIDIA CORP': 'NVDA',
-                    'MICROSOFT CORP': 'MSFT',
-                    'AMAZON COM': 'AMZN',
-                    'ALPHABET INC': 'GOOGL', 'GOOGLE INC': 'GOOGL',
-                    'TESLA INC': 'TSLA', 'TESLA MOTORS': 'TSLA',
-                    'META PLATFORMS': 'META', 'FACEBOOK': 'META',
-                    'ADVANCED MICRO': 'AMD',
-                    'NETFLIX INC': 'NFLX',
-                    'INTEL CORP': 'INTC',
-                    'BERKSHIRE HATHAWAY': 'BRK.B',
-                    'JPMORGAN CHASE': 'JPM'
-                }
-
-                for h in holdings:
-                    # Try to map ticker
-                    inferred_ticker = None
-                    upper_name = h['name'].upper()
-                    for k, v in TICKER_MAP.items():
-                         if k in upper_name:
-                             inferred_ticker = v
-                             break
-                    
-                    c.execute('''
-                        INSERT INTO holdings (accession_number, cusip, name, shares, value, ticker)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (f['accession_number'], h['cusip'], h['name'], h['shares'], h['value'], inferred_ticker))
-                
-                conn.commit()
-        else:
-             print(f"Skipping {f['accession_number']} due to missing XML.")
-        
-        time.sleep(1) # Polite delay
-        
-    conn.commit()
+    try:
+        while True:
+            item = write_q.get()
+            if item is None:
+                break
+            kind = item[0]
+            try:
+                # One explicit transaction per item: a filing lands completely or not at all
+                c.execute("BEGIN IMMEDIATE")
+                if kind == "fund":
+                    fund = item[1]
+                    c.execute("INSERT OR REPLACE INTO funds (cik, name) VALUES (?, ?)", (fund['cik'], fund['name']))
+                else:
+                    _, f, stream = item
+                    written = write_filing(c, f, stream, ticker_map)
+                    if not written:
+                        raise ValueError(f"no holdings parsed for {f['accession_number']}")
+                    stats["filings"] += 1
+                    stats["holdings"] += written
+                c.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    c.execute("ROLLBACK")
+                if kind == "filing":
+                    item[2].discard()
+                    stats["failed"] += 1
+                print(f"DB write error ({kind}): {e}")
+    finally:
+        conn.close()
+
+def ingest_funds(funds, fetch_workers=INGEST_FETCH_WORKERS, parse_workers=INGEST_PARSE_WORKERS):
+    """
+    Ingests many funds concurrently as a pipeline:
+    fetch (filing lists, infotables; fetch_workers threads, all behind SEC_LIMITER)
+    -> parse (parse_workers threads, streaming batches) -> DB write (one writer thread).
+    Throughput is bound by SEC_MAX_RPS, not by per-request sleeps.
+    """
+    t0 = time.time()
+    init_db()
+    conn = get_db_connection()
+    existing = {row[0] for row in conn.execute("SELECT accession_number FROM filings")}
     conn.close()
 
+    stats = {"funds": len(funds), "filings": 0, "holdings": 0, "skipped": 0, "failed": 0}
+    write_q = queue.Queue(maxsize=64)
+    writer = threading.Thread(target=_db_writer, args=(write_q, stats), name="13f-writer")
+    writer.start()
+
+    fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="13f-fetch")
+    parse_pool = concurrent.futures.ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="13f-parse")
+    pending = {}  # future -> (stage, payload)
+    try:
+        for fund in funds:
+            pending[fetch_pool.submit(fetch_filings_list, fund['cik'])] = ("list", fund)
+
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                stage, payload = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Ingest {stage} error: {e}")
+                    stats["failed"] += 1
+                    continue
+
+                if stage == "list":
+                    print(f"--- {payload['name']}: {len(result)} filings ---")
+                    write_q.put(("fund", payload))
+                    for f in result:
+                        if f['accession_number'] in existing:
+                            print(f"Skipping existing filing {f['accession_number']}")
+                            stats["skipped"] += 1
+                            continue
+                        existing.add(f['accession_number'])
+                        pending[fetch_pool.submit(fetch_infotable_xml, f['cik'], f['accession_number'], f['primary_doc'])] = ("fetch", f)
+                elif stage == "fetch":
+                    if result:
+                        # The parse task streams the holdings straight to the writer
+                        pending[parse_pool.submit(stream_infotable, result, payload, write_q)] = ("parse", payload)
+                    else:
+                        print(f"Skipping {payload['accession_number']} due to missing XML.")
+                        stats["failed"] += 1
+    finally:
+        fetch_pool.shutdown(wait=True)
+        parse_pool.shutdown(wait=True)
+        write_q.put(None)
+        writer.join()
+
+    stats["seconds"] = round(time.time() - t0, 1)
+    print(f"13F ingest done: {stats}")
+    return stats
+
+def ingest_fund(fund):
+    return ingest_funds([fund])
+
 def main():
     funds = load_top_funds()
     print(f"Found {len(funds)} funds to ingest.")
-    
-    for fund in funds:
-        try:
-            print(f"--- Ingesting {fund['name']} ---")
-            ingest_fund(fund)
-        except Exception as e:
-            print(f"Error ingesting {fund['name']}: {e}")
-            import traceback
-            traceback.print_exc()
+    ingest_funds(funds)
 
 if __name__ == "__main__":
     main()
@@ -4,11 +4,52 @@ import os
 
 DB_FILE = "institutional.db"
 
+# Infotable fields captured besides name/cusip/shares/value
+HOLDING_EXTRA_COLUMNS = [
+    ("title_of_class", "TEXT"),
+    ("share_type", "TEXT"),              # SH (shares) or PRN (principal amount)
+    ("put_call", "TEXT"),                # Put / Call for option positions, NULL otherwise
+    ("investment_discretion", "TEXT"),   # SOLE / DFND / OTR
+    ("voting_sole", "INTEGER"),
+    ("voting_shared", "INTEGER"),
+    ("voting_none", "INTEGER"),
+]
+
+# Seed for the ticker_map table: issuer-name prefix (upper case, whole words) -> ticker
+DEFAULT_TICKER_MAP = {
+    'APPLE INC': 'AAPL', 'APPLE COMPUTER': 'AAPL',
+    'NVIDIA CORP': 'NVDA',
+    'MICROSOFT CORP': 'MSFT',
+    'AMAZON COM': 'AMZN',
+    'ALPHABET INC': 'GOOGL', 'GOOGLE INC': 'GOOGL',
+    'TESLA INC': 'TSLA', 'TESLA MOTORS': 'TSLA',
+    'META PLATFORMS': 'META', 'FACEBOOK': 'META',
+    'ADVANCED MICRO': 'AMD',
+    'NETFLIX INC': 'NFLX',
+    'INTEL CORP': 'INTC',
+    'BERKSHIRE HATHAWAY': 'BRK.B',
+    'JPMORGAN CHASE': 'JPM'
+}
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(DB_FILE, timeout=30)
     conn.row_factory = sqlite3.Row
+    # WAL: readers (API) keep reading while an ingest writes; NORMAL sync is safe in WAL mode
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # 64 MB
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
     return conn
 
+def name_key(name):
+    """Normalized issuer name used by the ticker mapping (upper case, single spaces)."""
+    return " ".join(str(name).upper().split())
+
+def load_ticker_map(conn):
+    """ticker_map as a dict (the build side of the name -> ticker hash join)."""
+    return {row[0]: row[1] for row in conn.execute("SELECT name_prefix, ticker FROM ticker_map")}
+
 def init_db():
     conn = get_db_connection()
     c = conn.cursor()
@@ -50,6 +91,22 @@ def init_db():
         )
     ''')
 
+    # Columns added after the first release of the table
+    existing = {row[1] for row in c.execute("PRAGMA table_info(holdings)")}
+    for column, col_type in HOLDING_EXTRA_COLUMNS:
+        if column not in existing:
+            c.execute(f"ALTER TABLE holdings ADD COLUMN {column} {col_type}")
+
+    # Issuer-name prefix -> ticker mapping used at ingest
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS ticker_map (
+            name_prefix TEXT PRIMARY KEY, -- see name_key()
+            ticker TEXT NOT NULL
+        )
+    ''')
+    c.executemany("INSERT OR IGNORE INTO ticker_map (name_prefix, ticker) VALUES (?, ?)",
+                  [(name_key(k), v) for k, v in DEFAULT_TICKER_MAP.items()])
+
     # Index for speed
     c.execute('CREATE INDEX IF NOT EXISTS idx_holdings_ticker ON holdings (ticker)')
     c.execute('CREATE INDEX IF NOT EXISTS idx_holdings_acc ON holdings (accession_number)')
@@ -5,14 +5,15 @@ from institutional_db import get_db_connection
 import json
 import os
 
-import functools
+from shared_cache import shared_cached
 
 STOCK_DB_FILE = "stock_db.json"
+INSTITUTIONAL_CACHE_TTL = 24 * 3600 # 13F data only changes on ingest
 
 def get_cusip_map():
     return {} 
 
-@functools.lru_cache(maxsize=32)
+@shared_cached("smart_money_flow", ttl=INSTITUTIONAL_CACHE_TTL, maxsize=32)
 def get_smart_money_flow(ticker_symbol):
     """
     Calculates the 'Smart Money Flow' for a ticker.
@@ -410,7 +411,7 @@ def get_largest_moves(ticker_symbol):
         "sales": sales[:10]
     }
 
-@functools.lru_cache(maxsize=128)
+@shared_cached("fund_top_buys", ttl=INSTITUTIONAL_CACHE_TTL, maxsize=128)
 def get_fund_top_buys(cik):
     """
     Identifies the top 3 purchases (new or increased positions) for a fund 
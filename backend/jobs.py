@@ -0,0 +1,124 @@
+import os
+import fcntl
+import functools
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+# Configuration (env)
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") == "1"
+JOB_LOCK_DIR = os.environ.get("JOB_LOCK_DIR", ".")
+INDEX_REFRESH_CRON = os.environ.get("INDEX_REFRESH_CRON", "0 1 * * *")  # Before the nightly screens
+MATERIALIZE_CRON = os.environ.get("MATERIALIZE_CRON", "30 2 * * *")  # Nightly, after US close data settles
+UPCOMING_CRON = os.environ.get("UPCOMING_CRON", "0 6 * * *")  # Daily, after the nightly screens are stored
+UPCOMING_DAYS = int(os.environ.get("UPCOMING_DAYS", "7"))
+UPCOMING_MIN_WIN_RATE = float(os.environ.get("UPCOMING_MIN_WIN_RATE", "80"))
+# CFTC publishes Fridays 15:30 ET (Monday after federal holidays); second run catches late releases
+COT_REFRESH_CRON = os.environ.get("COT_REFRESH_CRON", "45 15,18 * * 1,5")
+COT_REFRESH_TZ = os.environ.get("COT_REFRESH_TZ", "America/New_York")
+
+SCHEDULER = None
+
+
+def _job_lock_path(name):
+    return os.path.join(JOB_LOCK_DIR, f".job_{name}.lock")
+
+
+def job_running(name):
+    """True while some worker holds the run_exclusive lock of the job."""
+    with open(_job_lock_path(name), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+
+def run_exclusive(name):
+    """
+    Job decorator: with several workers each running a scheduler, only the one
+    holding the job's file lock executes it; the others skip that firing.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with open(_job_lock_path(name), "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    print(f"Job {name}: already running in another worker, skipping.")
+                    return None
+                try:
+                    print(f"Job {name}: starting")
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    print(f"Job {name} failed: {e}")
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return wrapper
+    return decorator
+
+
+@run_exclusive("refresh_indices")
+def refresh_indices_job():
+    from screener import refresh_all_indices
+    summary = refresh_all_indices()
+    print(f"Index refresh: {summary}")
+    return summary
+
+
+@run_exclusive("materialize_screens")
+def materialize_screens_job():
+    from screener import materialize_screens
+    return materialize_screens()
+
+
+@run_exclusive("refresh_cot")
+def refresh_cot_job():
+    """Pulls the weekly COT files, rebuilds the stores and swaps them in off the request path."""
+    from cot_service import refresh_cot
+    summary = refresh_cot()
+    print(f"CoT refresh: {summary}")
+    return summary
+
+
+@run_exclusive("upcoming_patterns")
+def upcoming_patterns_job():
+    """Builds today's upcoming-entries list from the pattern store (no price data is read)."""
+    from datetime import date
+    from pattern_store import query_upcoming, save_upcoming_list
+
+    today = date.today()
+    params = {"days": UPCOMING_DAYS, "min_win_rate": UPCOMING_MIN_WIN_RATE}
+    entries = query_upcoming(start=today, limit=None, **params)
+    save_upcoming_list(today.isoformat(), params, entries)
+    print(f"Upcoming patterns for {today}: {len(entries)} entries")
+    return len(entries)
+
+
+def start_scheduler():
+    global SCHEDULER
+    if not SCHEDULER_ENABLED or SCHEDULER is not None:
+        return SCHEDULER
+
+    SCHEDULER = BackgroundScheduler(daemon=True)
+    SCHEDULER.add_job(refresh_indices_job, CronTrigger.from_crontab(INDEX_REFRESH_CRON),
+                      id="refresh_indices", max_instances=1, coalesce=True)
+    SCHEDULER.add_job(materialize_screens_job, CronTrigger.from_crontab(MATERIALIZE_CRON),
+                      id="materialize_screens", max_instances=1, coalesce=True)
+    SCHEDULER.add_job(refresh_cot_job, CronTrigger.from_crontab(COT_REFRESH_CRON, timezone=COT_REFRESH_TZ),
+                      id="refresh_cot", max_instances=1, coalesce=True)
+    SCHEDULER.add_job(upcoming_patterns_job, CronTrigger.from_crontab(UPCOMING_CRON),
+                      id="upcoming_patterns", max_instances=1, coalesce=True)
+    SCHEDULER.start()
+    print("Scheduler started: " + ", ".join(j.id for j in SCHEDULER.get_jobs()))
+    return SCHEDULER
+
+
+def shutdown_scheduler():
+    global SCHEDULER
+    if SCHEDULER is not None:
+        SCHEDULER.shutdown(wait=False)
+        SCHEDULER = None
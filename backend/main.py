@@ -1,14 +1,18 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, BackgroundTasks, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 import os
 import glob
 import json
 import time
+import uuid
+import base64
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
 import concurrent.futures
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import os
 
@@ -16,6 +20,10 @@ import os
 env_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(env_path)
 
+from shared_cache import SharedCache
+from cancellation import CancelToken, OperationCancelled
+from admission import admission_controlled, CONTROLLER as ADMISSION, INTERACTIVE, STANDARD, BATCH
+
 # Verify loading
 if os.environ.get("PERPLEXITY_API_KEY"):
     print("✅ Loaded PERPLEXITY_API_KEY from .env")
@@ -30,7 +38,19 @@ REPORTS_DIR = "reports"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(REPORTS_DIR, exist_ok=True)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    # Warm-up runs in the background; /health/ready reports 503 until it is done
+    from warmup import start_warmup
+    start_warmup(tickers=[a['ticker'] for a in ALL_ASSETS])
+    from jobs import start_scheduler, shutdown_scheduler
+    start_scheduler()
+    yield
+    shutdown_scheduler()
+    from screener import shutdown_screener_pool
+    shutdown_screener_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,6 +64,23 @@ app.add_middleware(
 def read_root():
     return {"message": "Seasonality Analysis API is running"}
 
+@app.get("/health")
+def health():
+    # Liveness: process is up (may still be warming)
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    # Readiness: only route traffic to warm instances
+    from warmup import is_ready, get_warmup_state
+    state = get_warmup_state()
+    return JSONResponse(status_code=200 if is_ready() else 503, content=state)
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    # Queue depth, in-flight and wait times per endpoint (for sizing the deployment)
+    return ADMISSION.metrics()
+
 
 # --- REMOVED VALUATION/REPORTS ---
 
@@ -51,7 +88,16 @@ def read_root():
 # Cache Global
 ANALYSIS_CACHE_FILE = "seasonality_cache.json"
 CACHE_DURATION = 2592000  # 30 days
-RESULT_CACHE = {}
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 6 * 3600))
+# Shared across workers (in-process LRU + SQLite file)
+RESULT_CACHE = SharedCache("analyze_ticker", ttl=RESULT_CACHE_TTL, maxsize=256)
+# Screener: default top-K (bounded heap; clients opt into every match with top_k=0) and
+# ranked result sets kept for cursor pagination / row expansion
+SCREENER_TOP_K = int(os.environ.get("SCREENER_TOP_K", 1000))
+SCREENER_PAGE_TTL = int(os.environ.get("SCREENER_PAGE_TTL", 3600))
+SCREENER_PAGES = SharedCache("screener_pages", ttl=SCREENER_PAGE_TTL, maxsize=32)
+# Token for admin-only endpoints (X-Admin-Token header); unset disables them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 
 ALL_ASSETS = [
@@ -95,11 +141,12 @@ class TickerRequest(BaseModel):
     filter_midterm: Optional[bool] = False
     filter_pre_election: Optional[bool] = False
     filter_post_election: Optional[bool] = False
+    offset_mode: Optional[str] = "calendar"  # "calendar" or "trading" (trading-day ordinals)
 
 class CustomPatternRequest(BaseModel):
     ticker: str
-    start_md: str
-    end_md: str
+    start_md: Optional[str] = None
+    end_md: Optional[str] = None
     lookback_years: Optional[int] = 15
     filter_mode: Optional[str] = None
     filter_odd_years: Optional[bool] = False
@@ -108,22 +155,72 @@ class CustomPatternRequest(BaseModel):
     filter_midterm: Optional[bool] = False
     filter_pre_election: Optional[bool] = False
     filter_post_election: Optional[bool] = False
+    offset_mode: Optional[str] = "calendar"
+    start_td: Optional[int] = None  # Trading day N of the year (offset_mode="trading")
+    end_td: Optional[int] = None  # Trading day M (next year if M <= N)
+
+OFFSET_MODES = ("calendar", "trading")
+
+# Deadlines (seconds) for long analyses; clients may shorten them via X-Request-Timeout
+ANALYZE_DEADLINE_SECONDS = float(os.environ.get("ANALYZE_DEADLINE_SECONDS", 60))
+SCREENER_DEADLINE_SECONDS = float(os.environ.get("SCREENER_DEADLINE_SECONDS", 900))
+DISCONNECT_POLL_SECONDS = 0.5
+
+def _make_cancel_token(http_request, default_timeout):
+    timeout = default_timeout
+    header = http_request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            timeout = min(float(header), default_timeout)
+        except ValueError:
+            pass
+    return CancelToken.with_timeout(timeout)
+
+async def _run_cancellable(http_request, token, fn, *args, **kwargs):
+    """
+    Runs a blocking analysis in a thread and cancels its token when the client disconnects.
+    The analysis stops at its next chunk boundary; we still wait for it to wind down.
+    """
+    task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and not token.cancelled() and await http_request.is_disconnected():
+            print(f"DEBUG: Client disconnected, cancelling job {token.job_id}")
+            token.cancel()
+    return task.result()
+
+def _cancelled_http_error(token):
+    if token.deadline_exceeded():
+        return HTTPException(status_code=504, detail="Analysis deadline exceeded")
+    return HTTPException(status_code=499, detail="Client closed request")
 
 @app.post("/analyze_ticker")
-def analyze_ticker_endpoint(request: TickerRequest):
+@admission_controlled("analyze_ticker", priority=INTERACTIVE)
+async def analyze_ticker_endpoint(request: TickerRequest, http_request: Request):
+    token = _make_cancel_token(http_request, ANALYZE_DEADLINE_SECONDS)
+    try:
+        return await _run_cancellable(http_request, token, _analyze_ticker, request, token)
+    finally:
+        token.close()
+
+def _analyze_ticker(request, cancel_token=None):
     try:
         from analysis import analyze_seasonality, fetch_ticker_data, calculate_seasonal_trend
         import pandas as pd
         
 
+        offset_mode = request.offset_mode or "calendar"
+        if offset_mode not in OFFSET_MODES:
+            raise HTTPException(status_code=400, detail=f"offset_mode must be one of {', '.join(OFFSET_MODES)}")
+
         # Cache Key Generation
-        req_key = f"{request.ticker}_{request.lookback_years}_{request.min_win_rate}_{request.filter_mode}_{request.filter_odd_years}_{request.exclude_2020}_{request.filter_election}_{request.filter_midterm}_{request.filter_pre_election}_{request.filter_post_election}"
+        req_key = f"{request.ticker}_{request.lookback_years}_{request.min_win_rate}_{request.filter_mode}_{request.filter_odd_years}_{request.exclude_2020}_{request.filter_election}_{request.filter_midterm}_{request.filter_pre_election}_{request.filter_post_election}_{offset_mode}"
         
         # Check Cache
-        global RESULT_CACHE
-        if req_key in RESULT_CACHE:
+        cached = RESULT_CACHE.get(req_key)
+        if cached is not None:
              print(f"DEBUG: Cache Hit for {req_key}")
-             return RESULT_CACHE[req_key]
+             return cached
 
         df = fetch_ticker_data(request.ticker)
         if df is None or df.empty:
@@ -141,7 +238,9 @@ def analyze_ticker_endpoint(request: TickerRequest):
             filter_election=request.filter_election,
             filter_midterm=request.filter_midterm,
             filter_pre_election=request.filter_pre_election,
-            filter_post_election=request.filter_post_election
+            filter_post_election=request.filter_post_election,
+            cancel_token=cancel_token,
+            offset_mode=offset_mode
         )
         
         # 3. Calculate Seasonal Trend
@@ -174,15 +273,34 @@ def analyze_ticker_endpoint(request: TickerRequest):
         }
         
         # Save to Cache
-        RESULT_CACHE[req_key] = result_payload
+        RESULT_CACHE.set(req_key, result_payload)
+
+        # Persist unfiltered calendar patterns for the upcoming-window queries
+        if not _has_year_filters(request) and offset_mode == "calendar":
+            try:
+                from pattern_store import save_ticker_patterns
+                save_ticker_patterns(request.ticker, request.lookback_years if request.lookback_years else 15, patterns)
+            except Exception as e:
+                print(f"Pattern store write failed for {request.ticker}: {e}")
         
         return result_payload
+    except HTTPException:
+        raise
+    except OperationCancelled:
+        raise _cancelled_http_error(cancel_token)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _has_year_filters(request):
+    return bool(request.filter_mode) or any([
+        request.filter_odd_years, request.exclude_2020, request.filter_election, request.filter_midterm,
+        request.filter_pre_election, request.filter_post_election
+    ])
+
 @app.post("/ticker_seasonality_trend")
+@admission_controlled("seasonality_trend", priority=INTERACTIVE)
 def ticker_seasonality_trend_endpoint(request: TickerRequest):
     try:
         from analysis import fetch_ticker_data, calculate_seasonal_trend, get_current_year_data
@@ -243,9 +361,18 @@ def ticker_seasonality_trend_endpoint(request: TickerRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/evaluate_pattern")
+@admission_controlled("evaluate_pattern", priority=INTERACTIVE)
 def evaluate_pattern_endpoint(request: CustomPatternRequest):
+    if (request.offset_mode or "calendar") not in OFFSET_MODES:
+        raise HTTPException(status_code=400, detail=f"offset_mode must be one of {', '.join(OFFSET_MODES)}")
     try:
         from analysis import fetch_ticker_data, evaluate_custom_pattern
+
+        if request.offset_mode == "trading":
+            if request.start_td is None or request.end_td is None:
+                return {"status": "error", "message": "start_td and end_td are required for offset_mode=trading"}
+        elif not request.start_md or not request.end_md:
+            return {"status": "error", "message": "start_md and end_md are required"}
         
         df = fetch_ticker_data(request.ticker)
         if df is None:
@@ -263,7 +390,10 @@ def evaluate_pattern_endpoint(request: CustomPatternRequest):
             filter_election=request.filter_election,
             filter_midterm=request.filter_midterm,
             filter_pre_election=request.filter_pre_election,
-            filter_post_election=request.filter_post_election
+            filter_post_election=request.filter_post_election,
+            offset_mode=request.offset_mode or "calendar",
+            start_td=request.start_td,
+            end_td=request.end_td
         )
         
         return {
@@ -275,15 +405,96 @@ def evaluate_pattern_endpoint(request: CustomPatternRequest):
         return {"status": "error", "message": str(e)}
 
 
+class BatchPatternRequest(BaseModel):
+    patterns: List[CustomPatternRequest]
+
+def _evaluate_ticker_patterns(ticker, specs):
+    from analysis import fetch_ticker_data, evaluate_custom_patterns
+
+    df = fetch_ticker_data(ticker)
+    if df is None or df.empty:
+        return [{"status": "error", "message": "Ticker not found"} for _ in specs]
+
+    try:
+        stats_list = evaluate_custom_patterns(df, [s.model_dump() for s in specs])
+    except Exception as e:
+        print(f"Batch Eval Error for {ticker}: {e}")
+        return [{"status": "error", "message": str(e)} for _ in specs]
+
+    return [{"status": "success", "stats": stats} for stats in stats_list]
+
+@app.post("/evaluate_patterns")
+@admission_controlled("evaluate_patterns", priority=STANDARD)
+def evaluate_patterns_endpoint(request: BatchPatternRequest):
+    """
+    Batch version of /evaluate_pattern: groups specs by ticker, loads each history once
+    and evaluates all windows of that ticker in one pass. Results keep the input order.
+    """
+    for pos, spec in enumerate(request.patterns):
+        if (spec.offset_mode or "calendar") not in OFFSET_MODES:
+            raise HTTPException(status_code=400,
+                                detail=f"patterns[{pos}]: offset_mode must be one of {', '.join(OFFSET_MODES)}")
+
+    # Group by ticker (keep original positions)
+    groups = {}
+    for pos, spec in enumerate(request.patterns):
+        groups.setdefault(spec.ticker.upper().strip(), []).append(pos)
+
+    results = [None] * len(request.patterns)
+
+    # Histories are network-bound -> fetch tickers concurrently
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {
+            executor.submit(_evaluate_ticker_patterns, ticker, [request.patterns[p] for p in positions]): positions
+            for ticker, positions in groups.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            positions = futures[future]
+            try:
+                ticker_results = future.result()
+            except Exception as e:
+                ticker_results = [{"status": "error", "message": str(e)} for _ in positions]
+            for p, res in zip(positions, ticker_results):
+                spec = request.patterns[p]
+                res.update({"ticker": spec.ticker, "start_md": spec.start_md, "end_md": spec.end_md})
+                results[p] = res
+
+    return {
+        "status": "success",
+        "tickers": len(groups),
+        "count": len(results),
+        "results": results
+    }
+
+
 # --- REMOVED ANALYZE ALL ASSETS ---
 
 
+@app.get("/cot/dashboard")
+def get_cot_dashboard_endpoint(report_type: Optional[str] = None):
+    """Latest nets and COT indices (all dashboard lookbacks) of every market; one call instead of one per ticker."""
+    try:
+        from cot_service import get_cot_dashboard, REPORTS
+        if report_type is not None and report_type not in REPORTS:
+            raise HTTPException(status_code=400, detail=f"report_type must be one of {', '.join(REPORTS)}")
+        return get_cot_dashboard([report_type] if report_type else None)
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/cot/{ticker}")
-def get_cot_report(ticker: str, report_type: str = "legacy", lookback: int = 26):
+def get_cot_report(ticker: str, report_type: str = "legacy", lookback: int = 26, format: str = "columns"):
     try:
-        from cot_service import get_cot_data
-        data = get_cot_data(ticker, report_type, lookback_weeks=lookback)
-        return {"ticker": ticker, "data": data, "report_type": report_type, "lookback": lookback}
+        from cot_service import get_cot_data, COT_FORMATS
+        if format not in COT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(COT_FORMATS)}")
+        data = get_cot_data(ticker, report_type, lookback_weeks=lookback, fmt=format)
+        return {"ticker": ticker, "data": data, "report_type": report_type, "lookback": lookback, "format": format}
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -418,24 +629,9 @@ def search_ticker(q: str):
     if not q_lower:
         return {"results": []}
 
-    local_results = []
-    
-    # 1. Search Local DB
-    for item in STOCK_DB:
-        # Check Ticker
-        if q_lower in item['ticker'].lower():
-            local_results.append(item)
-            continue
-            
-        # Check Name
-        if q_lower in item['name'].lower():
-            local_results.append(item)
-            continue
-            
-        # Check Aliases
-        if any(q_lower in alias.lower() for alias in item.get('aliases', [])):
-             local_results.append(item)
-             continue
+    # 1. Search local index (stock_db + symbol universe)
+    from ticker_search import search_symbols
+    local_results = search_symbols(q_lower)
     
     # If we found local matches, return them immediately for speed
     if local_results:
@@ -547,15 +743,40 @@ def get_ticker_history(request: TickerHistoryRequest):
          raise HTTPException(status_code=500, detail=str(e))
 
 # Screener Endpoints
-from screener import screen_index, INDEX_FETCHERS
+from screener import screen_index, is_valid_version, INDEX_FETCHERS, SCREENER_MAX_TICKERS
 
 @app.get("/screener/indices")
 def get_screener_indices():
     return list(INDEX_FETCHERS.keys())
 
+@app.get("/screener/indices/{index_name}/versions")
+def get_index_versions(index_name: str):
+    from screener import list_index_versions, get_index_version
+    if index_name.lower() not in INDEX_FETCHERS:
+        raise HTTPException(status_code=400, detail="Invalid index provided.")
+    return {"index": index_name.lower(), "current": get_index_version(index_name), "versions": list_index_versions(index_name)}
+
+def _require_admin(token):
+    import secrets
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set).")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+@app.post("/screener/indices/refresh")
+def trigger_index_refresh(background_tasks: BackgroundTasks, x_admin_token: Optional[str] = Header(None)):
+    from jobs import refresh_indices_job
+    _require_admin(x_admin_token)
+    background_tasks.add_task(refresh_indices_job)
+    return {"status": "scheduled"}
+
 
 class ScreenerRequest(BaseModel):
-    index: str
+    index: str                           # Index name, or "custom" together with tickers
+    tickers: Optional[List[str]] = None  # Custom universe (overrides the index constituents)
+    resume: Optional[bool] = True        # Continue an interrupted scan of the same universe/parameters
+    sharded: Optional[bool] = None       # Split into shards on the shard queue (default: SCREENER_SHARDED)
+    constituents_version: Optional[str] = None  # Pin a stored constituents snapshot
     min_win_rate: Optional[int] = 70
     lookback_years: Optional[int] = 20
     search_start_date: Optional[str] = None
@@ -567,12 +788,199 @@ class ScreenerRequest(BaseModel):
     filter_midterm: Optional[bool] = False
     filter_pre_election: Optional[bool] = False
     filter_post_election: Optional[bool] = False
+    # Ranking / filtering of the result rows
+    top_k: Optional[int] = None          # Defaults to SCREENER_TOP_K, 0 = unlimited
+    sort_by: Optional[str] = None        # e.g. "-win_rate,-avg_return"
+    min_avg_return: Optional[float] = None
+    pattern_type: Optional[str] = None   # Long / Short
+    min_duration: Optional[int] = None
+    max_duration: Optional[int] = None
+    min_years: Optional[int] = None
+    # Paging
+    page_size: Optional[int] = None      # None = everything in one response
+    cursor: Optional[str] = None         # next_cursor of a previous page
+    include_trades: Optional[bool] = True  # False drops yearly_trades; fetch a row via /screener/results
 
 @app.post("/screener/run")
-def run_screener(request: ScreenerRequest):
+async def run_screener(request: ScreenerRequest, http_request: Request):
+    from screener import parse_sort, TopK
+
+    if request.cursor:
+        return _screener_page_from_cursor(request.cursor)
+    if request.page_size is not None and request.page_size < 1:
+        raise HTTPException(status_code=400, detail="page_size must be at least 1.")
+    try:
+        parse_sort(request.sort_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Default parameter sets are served from the nightly pattern table without queueing
+    materialized = _load_materialized_screen(request)
+    if materialized is not None:
+        ranked = TopK(_screener_top_k(request), request.sort_by, _screener_filters(request))
+        ranked.extend(materialized["results"])
+        materialized["results"] = ranked.results()
+        materialized["total_matches"] = ranked.matched
+        response = {"status": "success", "index": request.index.lower(), "data": materialized}
+    else:
+        response = await _run_live_screener(request, http_request)
+    data = response.get("data")
+    if isinstance(data, dict) and "total_matches" in data:
+        # Tell clients when top_k cut matching rows off (total_matches has the full count)
+        data["truncated"] = data["total_matches"] > len(data.get("results") or [])
+    return _paginate_screen(response, request)
+
+def _screener_top_k(request):
+    return request.top_k if request.top_k is not None else SCREENER_TOP_K
+
+def _screener_filters(request):
+    return {
+        "min_avg_return": request.min_avg_return,
+        "pattern_type": request.pattern_type,
+        "min_duration": request.min_duration,
+        "max_duration": request.max_duration,
+        "min_years": request.min_years,
+    }
+
+def _encode_cursor(result_id, offset, page_size, include_trades):
+    raw = json.dumps({"r": result_id, "o": offset, "n": page_size, "t": include_trades})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _screener_page(result_id, stored, offset, page_size, include_trades):
+    data = stored["data"]
+    rows = data["results"][offset:offset + page_size] if page_size else data["results"][offset:]
+    page = []
+    for pos, p in enumerate(rows, start=offset):
+        row = dict(p, row=pos)
+        if not include_trades:
+            row.pop("yearly_trades", None)
+        page.append(row)
+
+    end = offset + len(rows)
+    meta = {k: v for k, v in data.items() if k != "results"}
+    meta.update({
+        "results": page,
+        "result_id": result_id,
+        "offset": offset,
+        "next_cursor": _encode_cursor(result_id, end, page_size, include_trades) if end < len(data["results"]) else None
+    })
+    return {"status": stored["status"], "index": stored["index"], "data": meta}
+
+def _paginate_screen(response, request):
+    data = response.get("data")
+    if not isinstance(data, dict) or (not request.page_size and request.include_trades is not False):
+        return response
+    result_id = uuid.uuid4().hex
+    stored = {"status": response["status"], "index": response["index"], "data": data}
+    SCREENER_PAGES.set(result_id, stored)
+    return _screener_page(result_id, stored, 0, request.page_size, request.include_trades is not False)
+
+def _screener_page_from_cursor(cursor):
+    try:
+        c = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        result_id, offset, page_size, include_trades = c["r"], int(c["o"]), c["n"], c["t"]
+        if offset < 0 or (page_size is not None and int(page_size) < 1):
+            raise ValueError("cursor out of range")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    stored = SCREENER_PAGES.get(result_id)
+    if stored is None:
+        raise HTTPException(status_code=410, detail="Screener results expired, please run the screen again.")
+    return _screener_page(result_id, stored, offset, page_size, include_trades)
+
+@app.get("/screener/shards/{scan_id}")
+def get_shard_status(scan_id: str):
+    """Progress of a sharded screen (shards pending / leased / done / failed)."""
+    from sharding import open_queue
+    state = open_queue().status(scan_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown scan.")
+    return state
+
+@app.get("/screener/results/{result_id}/{row}")
+def get_screener_row(result_id: str, row: int):
+    """Full pattern (including yearly_trades) of a paged screener result."""
+    stored = SCREENER_PAGES.get(result_id)
+    if stored is None:
+        raise HTTPException(status_code=410, detail="Screener results expired, please run the screen again.")
+    results = stored["data"]["results"]
+    if row < 0 or row >= len(results):
+        raise HTTPException(status_code=404, detail="Row not found.")
+    return dict(results[row], row=row)
+
+def _load_materialized_screen(request):
+    from screener import MATERIALIZE_LOOKBACKS, MATERIALIZE_MIN_WIN_RATE
+    from pattern_store import load_screen
+
+    lookback = request.lookback_years if request.lookback_years else 20
+    min_win_rate = request.min_win_rate if request.min_win_rate is not None else 70
+    if request.tickers or request.constituents_version or request.search_start_date or request.search_end_date or _has_year_filters(request):
+        return None
+    if lookback not in MATERIALIZE_LOOKBACKS or min_win_rate < MATERIALIZE_MIN_WIN_RATE:
+        return None
+    try:
+        return load_screen(request.index.lower(), lookback, min_win_rate)
+    except Exception as e:
+        print(f"Materialized screen lookup failed: {e}")
+        return None
+
+@app.post("/screener/materialize")
+def trigger_materialize(background_tasks: BackgroundTasks, x_admin_token: Optional[str] = Header(None)):
+    from jobs import materialize_screens_job, job_running
+    _require_admin(x_admin_token)
+    if job_running("materialize_screens"):
+        raise HTTPException(status_code=409, detail="Materialization already running.")
+    background_tasks.add_task(materialize_screens_job)
+    return {"status": "scheduled"}
+
+@app.get("/patterns/upcoming")
+def get_upcoming_patterns(days: int = 7, min_win_rate: float = 80, type: Optional[str] = None,
+                          index: Optional[str] = None, ticker: Optional[str] = None,
+                          lookback_years: Optional[int] = None, min_years: Optional[int] = None,
+                          start_date: Optional[str] = None, limit: int = 500):
+    """Stored patterns (screens and past analyses) entering within the next `days` days."""
+    from pattern_store import query_upcoming
+    import datetime
+    try:
+        start = datetime.date.fromisoformat(start_date) if start_date else datetime.date.today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date must be YYYY-MM-DD")
+    if days < 0 or days > 364:
+        raise HTTPException(status_code=400, detail="days must be between 0 and 364")
+
+    entries = query_upcoming(days=days, min_win_rate=min_win_rate, start=start, pattern_type=type,
+                             index_name=index, ticker=ticker, lookback_years=lookback_years,
+                             min_years=min_years, limit=limit)
+    return {"start_date": start.isoformat(), "days": days, "count": len(entries), "results": entries}
+
+@app.get("/patterns/upcoming/daily")
+def get_daily_upcoming_patterns(as_of: Optional[str] = None):
+    """List produced by the daily upcoming job."""
+    from pattern_store import load_upcoming_list
+    data = load_upcoming_list(as_of)
+    if data is None:
+        raise HTTPException(status_code=404, detail="No upcoming list stored yet.")
+    return data
+
+@admission_controlled("screener", priority=BATCH)
+async def _run_live_screener(request: ScreenerRequest, http_request: Request):
+    token = _make_cancel_token(http_request, SCREENER_DEADLINE_SECONDS)
+    try:
+        return await _run_cancellable(http_request, token, _run_screener, request, token)
+    finally:
+        token.close()
+
+def _run_screener(request, cancel_token=None):
     index_name = request.index.lower()
-    if index_name not in INDEX_FETCHERS:
+    tickers = None
+    if request.tickers:
+        tickers = list(dict.fromkeys(t.upper().strip() for t in request.tickers if t and t.strip()))
+        if len(tickers) > SCREENER_MAX_TICKERS:
+            raise HTTPException(status_code=400, detail=f"Too many tickers (max {SCREENER_MAX_TICKERS}).")
+    elif index_name not in INDEX_FETCHERS:
         raise HTTPException(status_code=400, detail="Invalid index provided.")
+    if request.constituents_version is not None and not is_valid_version(request.constituents_version):
+        raise HTTPException(status_code=400, detail="Invalid constituents_version (expected YYYYMMDDTHHMMSS-xxxxxxxx).")
         
 
         
@@ -597,7 +1005,15 @@ def run_screener(request: ScreenerRequest):
             filter_election=request.filter_election,
             filter_midterm=request.filter_midterm,
             filter_pre_election=request.filter_pre_election,
-            filter_post_election=request.filter_post_election
+            filter_post_election=request.filter_post_election,
+            cancel_token=cancel_token,
+            top_k=_screener_top_k(request),
+            sort_by=request.sort_by,
+            filters=_screener_filters(request),
+            tickers=tickers,
+            resume=request.resume is not False,
+            sharded=request.sharded,
+            version=request.constituents_version
         )
         
         # Check if result_data is a dict (new format) or list (old format fallback)
@@ -626,6 +1042,7 @@ class CycleRequest(BaseModel):
     max_cycles: Optional[int] = 20
 
 @app.post("/cycle_scan")
+@admission_controlled("cycle_scan", priority=INTERACTIVE)
 def cycle_scan_endpoint(request: CycleRequest):
     try:
         from cycle_analysis import perform_cycle_analysis
@@ -707,6 +1124,7 @@ class MonteCarloRequest(BaseModel):
     num_simulations: int
 
 @app.post("/calculators/risk_analysis")
+@admission_controlled("risk_analysis", priority=STANDARD)
 def risk_analysis_endpoint(request: RiskAnalysisRequest):
     try:
         from calculators import run_risk_analysis
@@ -725,6 +1143,7 @@ def risk_analysis_endpoint(request: RiskAnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/calculators/monte_carlo")
+@admission_controlled("monte_carlo", priority=STANDARD)
 def monte_carlo_endpoint(request: MonteCarloRequest):
     try:
         from calculators import run_monte_carlo
@@ -778,6 +1197,7 @@ class TermStructureRequest(BaseModel):
     ticker: str
 
 @app.post("/term_structure/analyze")
+@admission_controlled("term_structure", priority=INTERACTIVE)
 def analyze_term_structure_endpoint(request: TermStructureRequest):
     try:
         from term_structure import get_term_structure
@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime, date, timedelta
+
+# Configuration
+PATTERN_DB_FILE = os.environ.get("PATTERN_DB_FILE", "patterns.db")
+MATERIALIZED_MAX_AGE = int(os.environ.get("MATERIALIZED_MAX_AGE", 36 * 3600))  # Serve nightly screens up to 36h old
+PATTERN_MAX_AGE = int(os.environ.get("PATTERN_MAX_AGE", 7 * 24 * 3600))  # Ignore stored patterns older than a week in queries
+
+SOURCE_SCREEN = "screen"      # Stored by materialized screener runs
+SOURCE_ANALYSIS = "analysis"  # Stored by single-ticker analyze_seasonality requests
+
+
+def get_db_connection():
+    conn = sqlite3.connect(PATTERN_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def init_db():
+    conn = get_db_connection()
+    c = conn.cursor()
+
+    # One row per materialized screen (index x parameter set)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS screen_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            index_name TEXT,
+            lookback_years INTEGER,
+            base_min_win_rate REAL,  -- Lowest win rate stored; stricter requests filter
+            created_at REAL,
+            tickers_found INTEGER,
+            scanned_count INTEGER,
+            error_count INTEGER,
+            sample_errors TEXT,      -- JSON
+            is_current INTEGER DEFAULT 0
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS patterns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER,
+            rank INTEGER,            -- Position in the screen's sorted result list
+            index_name TEXT,
+            ticker TEXT,
+            asset_name TEXT,
+            type TEXT,               -- Long / Short
+            start_month INTEGER,
+            start_day INTEGER,
+            start_doy INTEGER,       -- Day of year (non-leap calendar, 1-365)
+            end_month INTEGER,
+            end_day INTEGER,
+            duration INTEGER,
+            win_rate REAL,
+            years_analyzed INTEGER,
+            avg_return REAL,
+            max_return REAL,
+            min_return REAL,
+            lookback_years INTEGER,
+            data TEXT,               -- Full pattern JSON (yearly_trades, missed_years, ...)
+            source TEXT DEFAULT 'screen',
+            updated_at REAL,
+            FOREIGN KEY (run_id) REFERENCES screen_runs (run_id)
+        )
+    ''')
+
+    # Columns added after the first release of the table
+    existing = {row[1] for row in c.execute("PRAGMA table_info(patterns)")}
+    if 'source' not in existing:
+        c.execute("ALTER TABLE patterns ADD COLUMN source TEXT DEFAULT 'screen'")
+    if 'updated_at' not in existing:
+        c.execute("ALTER TABLE patterns ADD COLUMN updated_at REAL")
+
+    # Output of the daily upcoming-entries job
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS upcoming_lists (
+            as_of TEXT PRIMARY KEY,  -- YYYY-MM-DD
+            created_at REAL,
+            params TEXT,             -- JSON
+            entries TEXT             -- JSON
+        )
+    ''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_runs_lookup ON screen_runs (index_name, lookback_years, is_current)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_patterns_run ON patterns (run_id, win_rate)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_patterns_ticker ON patterns (ticker)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_patterns_doy ON patterns (start_doy, win_rate)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_patterns_type_dur ON patterns (type, duration)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_patterns_win_rate ON patterns (win_rate)')
+
+    conn.commit()
+    conn.close()
+
+
+_DB_READY = set()  # Database files whose schema was created by this process
+_DB_READY_LOCK = threading.Lock()
+
+
+def ensure_db():
+    """Runs init_db once per process (and database file) instead of on every request."""
+    if PATTERN_DB_FILE in _DB_READY:
+        return
+    with _DB_READY_LOCK:
+        if PATTERN_DB_FILE not in _DB_READY:
+            init_db()
+            _DB_READY.add(PATTERN_DB_FILE)
+
+
+def day_of_year(month, day):
+    # Fixed non-leap calendar (same convention as the 2023 dummy dates in analysis)
+    return (datetime(2023, int(month), int(day)) - datetime(2023, 1, 1)).days + 1
+
+
+def _pattern_row(p, run_id, rank, index_name, lookback_years, source=SOURCE_SCREEN, updated_at=None):
+    s_m, s_d = p['start_md']
+    e_m, e_d = p['end_md']
+    return (
+        run_id, rank, index_name, p.get('ticker'), p.get('asset_name'), p.get('type'),
+        s_m, s_d, day_of_year(s_m, s_d), e_m, e_d, p.get('duration'),
+        p.get('win_rate'), p.get('years_analyzed'),
+        p.get('avg_return'), p.get('max_return'), p.get('min_return'),
+        lookback_years, json.dumps(p), source, updated_at or time.time()
+    )
+
+
+INSERT_PATTERN_SQL = '''
+    INSERT INTO patterns (run_id, rank, index_name, ticker, asset_name, type,
+                          start_month, start_day, start_doy, end_month, end_day, duration,
+                          win_rate, years_analyzed, avg_return, max_return, min_return,
+                          lookback_years, data, source, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+def save_screen_run(index_name, lookback_years, base_min_win_rate, result):
+    """
+    Stores a finished screen and atomically makes it the current one for (index, lookback).
+    Older runs for the same key are deleted in the same transaction.
+    """
+    ensure_db()
+    created_at = time.time()
+    conn = get_db_connection()
+    try:
+        with conn:
+            c = conn.cursor()
+            c.execute('''
+                INSERT INTO screen_runs (index_name, lookback_years, base_min_win_rate, created_at,
+                                         tickers_found, scanned_count, error_count, sample_errors, is_current)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+            ''', (index_name, lookback_years, base_min_win_rate, created_at,
+                  result.get("tickers_found", 0), result.get("scanned_count", 0),
+                  result.get("error_count", 0), json.dumps(result.get("sample_errors", []))))
+            run_id = c.lastrowid
+
+            c.executemany(INSERT_PATTERN_SQL, [
+                _pattern_row(p, run_id, rank, index_name, lookback_years, updated_at=created_at)
+                for rank, p in enumerate(result.get("results", []))
+            ])
+
+            old = [r[0] for r in c.execute(
+                "SELECT run_id FROM screen_runs WHERE index_name = ? AND lookback_years = ? AND run_id != ?",
+                (index_name, lookback_years, run_id)
+            )]
+            c.execute("UPDATE screen_runs SET is_current = 1 WHERE run_id = ?", (run_id,))
+            if old:
+                marks = ",".join("?" * len(old))
+                c.execute(f"DELETE FROM patterns WHERE run_id IN ({marks})", old)
+                c.execute(f"DELETE FROM screen_runs WHERE run_id IN ({marks})", old)
+        return run_id
+    finally:
+        conn.close()
+
+
+def load_screen(index_name, lookback_years, min_win_rate, max_age=MATERIALIZED_MAX_AGE):
+    """
+    Returns a materialized screen in the same shape as screen_index(), or None if there is
+    no fresh run that covers min_win_rate.
+    """
+    if not os.path.exists(PATTERN_DB_FILE):
+        return None
+    conn = get_db_connection()
+    try:
+        run = conn.execute('''
+            SELECT * FROM screen_runs
+            WHERE index_name = ? AND lookback_years = ? AND is_current = 1
+            ORDER BY run_id DESC LIMIT 1
+        ''', (index_name, lookback_years)).fetchone()
+        if run is None or time.time() - run['created_at'] > max_age:
+            return None
+        if min_win_rate is not None and min_win_rate < run['base_min_win_rate']:
+            return None
+
+        rows = conn.execute('''
+            SELECT data FROM patterns
+            WHERE run_id = ? AND win_rate >= ?
+            ORDER BY rank
+        ''', (run['run_id'], min_win_rate or 0)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Pattern store read error: {e}")
+        return None
+    finally:
+        conn.close()
+
+    return {
+        "results": [json.loads(r['data']) for r in rows],
+        "tickers_found": run['tickers_found'],
+        "scanned_count": run['scanned_count'],
+        "error_count": run['error_count'],
+        "sample_errors": json.loads(run['sample_errors'] or "[]"),
+        "cancelled": False,
+        "materialized": True,
+        "computed_at": datetime.fromtimestamp(run['created_at']).isoformat(timespec="seconds")
+    }
+
+
+def save_ticker_patterns(ticker, lookback_years, patterns, asset_name=None):
+    """
+    Stores the patterns of a single-ticker analysis, replacing the previous
+    analysis patterns for (ticker, lookback).
+    """
+    ensure_db()
+    ticker = ticker.upper().strip()
+    now = time.time()
+    rows = []
+    for rank, p in enumerate(patterns):
+        p = dict(p, ticker=ticker)
+        if asset_name and not p.get('asset_name'):
+            p['asset_name'] = asset_name
+        rows.append(_pattern_row(p, None, rank, None, lookback_years, source=SOURCE_ANALYSIS, updated_at=now))
+
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "DELETE FROM patterns WHERE ticker = ? AND source = ? AND lookback_years = ?",
+                (ticker, SOURCE_ANALYSIS, lookback_years)
+            )
+            conn.executemany(INSERT_PATTERN_SQL, rows)
+        return len(rows)
+    finally:
+        conn.close()
+
+
+def _doy_ranges(start, days):
+    """
+    Day-of-year ranges covering [start, start + days] on the non-leap calendar.
+    A window crossing New Year is split in two; Feb 29 counts as Feb 28.
+    """
+    days = max(0, min(int(days), 364))
+    if start.month == 2 and start.day == 29:
+        start = start - timedelta(days=1)
+    first = day_of_year(start.month, start.day)
+    last = first + days
+    if last <= 365:
+        return [(first, last)]
+    return [(first, 365), (1, last - 365)]
+
+
+def query_upcoming(days=7, min_win_rate=80, start=None, pattern_type=None, index_name=None,
+                   ticker=None, lookback_years=None, min_years=None, limit=500, max_age=PATTERN_MAX_AGE):
+    """
+    Stored patterns whose entry date falls within the next `days` days, answered
+    from the start_doy index. Patterns found by several indices or by both a screen
+    and an analysis are returned once, ordered by entry date then win rate.
+    """
+    if not os.path.exists(PATTERN_DB_FILE):
+        return []
+    start = start or date.today()
+    ranges = _doy_ranges(start, days)
+
+    where = ["(" + " OR ".join("start_doy BETWEEN ? AND ?" for _ in ranges) + ")", "win_rate >= ?"]
+    params = [v for r in ranges for v in r] + [min_win_rate or 0]
+    if max_age:
+        where.append("updated_at >= ?")
+        params.append(time.time() - max_age)
+    if pattern_type:
+        where.append("type = ?")
+        params.append(pattern_type.capitalize())
+    if index_name:
+        where.append("index_name = ?")
+        params.append(index_name.lower())
+    if ticker:
+        where.append("ticker = ?")
+        params.append(ticker.upper().strip())
+    if lookback_years:
+        where.append("lookback_years = ?")
+        params.append(lookback_years)
+    if min_years:
+        where.append("years_analyzed >= ?")
+        params.append(min_years)
+
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(f'''
+            SELECT ticker, asset_name, index_name, type, start_month, start_day, start_doy,
+                   end_month, end_day, duration, win_rate, years_analyzed,
+                   avg_return, max_return, min_return, lookback_years, source, updated_at
+            FROM patterns
+            WHERE {" AND ".join(where)}
+            ORDER BY win_rate DESC, years_analyzed DESC
+        ''', params).fetchall()
+    except sqlite3.Error as e:
+        print(f"Pattern store read error: {e}")
+        return []
+    finally:
+        conn.close()
+
+    first_doy = ranges[0][0]
+    merged = {}
+    for r in rows:
+        key = (r['ticker'], r['type'], r['start_doy'], r['duration'], r['lookback_years'])
+        entry = merged.get(key)
+        if entry is None:
+            days_until = (r['start_doy'] - first_doy) % 365
+            entry = {
+                "ticker": r['ticker'],
+                "asset_name": r['asset_name'],
+                "type": r['type'],
+                "start_md": (r['start_month'], r['start_day']),
+                "end_md": (r['end_month'], r['end_day']),
+                "entry_date": (start + timedelta(days=days_until)).isoformat(),
+                "days_until": days_until,
+                "duration": r['duration'],
+                "win_rate": r['win_rate'],
+                "years_analyzed": r['years_analyzed'],
+                "avg_return": r['avg_return'],
+                "max_return": r['max_return'],
+                "min_return": r['min_return'],
+                "lookback_years": r['lookback_years'],
+                "indices": [],
+                "sources": []
+            }
+            merged[key] = entry
+        if not entry["asset_name"] and r['asset_name']:
+            entry["asset_name"] = r['asset_name']
+        if r['index_name'] and r['index_name'] not in entry["indices"]:
+            entry["indices"].append(r['index_name'])
+        if r['source'] not in entry["sources"]:
+            entry["sources"].append(r['source'])
+
+    entries = sorted(merged.values(), key=lambda e: (e["days_until"], -e["win_rate"], -e["years_analyzed"]))
+    return entries[:limit] if limit else entries
+
+
+def save_upcoming_list(as_of, params, entries):
+    ensure_db()
+    conn = get_db_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO upcoming_lists (as_of, created_at, params, entries) VALUES (?, ?, ?, ?)",
+                (as_of, time.time(), json.dumps(params), json.dumps(entries))
+            )
+            # Keep a month of history
+            cutoff = (date.fromisoformat(as_of) - timedelta(days=31)).isoformat()
+            conn.execute("DELETE FROM upcoming_lists WHERE as_of < ?", (cutoff,))
+    finally:
+        conn.close()
+
+
+def load_upcoming_list(as_of=None):
+    """Latest stored upcoming list (or the one for as_of), None if the job has not run yet."""
+    if not os.path.exists(PATTERN_DB_FILE):
+        return None
+    conn = get_db_connection()
+    try:
+        if as_of:
+            row = conn.execute("SELECT * FROM upcoming_lists WHERE as_of = ?", (as_of,)).fetchone()
+        else:
+            row = conn.execute("SELECT * FROM upcoming_lists ORDER BY as_of DESC LIMIT 1").fetchone()
+    except sqlite3.Error as e:
+        print(f"Pattern store read error: {e}")
+        return None
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {
+        "as_of": row['as_of'],
+        "computed_at": datetime.fromtimestamp(row['created_at']).isoformat(timespec="seconds"),
+        "params": json.loads(row['params']),
+        "entries": json.loads(row['entries'])
+    }
+
+
+if __name__ == "__main__":
+    ensure_db()
+    print("Pattern DB initialized.")
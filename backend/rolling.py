@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def rolling_extrema(values, windows):
+    """
+    Trailing rolling min and max of values for several window lengths at once.
+
+    values is 1-D (n,) or 2-D (n, columns); every column is handled in the same pass.
+    Uses a sparse table: level k holds the min/max of each run of 2**k rows, built
+    with one vectorized op per level, and any window is answered by two overlapping
+    runs, so cost is O(n log W) to build plus O(n) per window (W = largest window).
+
+    Matches pandas rolling(window=w).min()/max(): the first w-1 rows and every
+    window containing NaN are NaN. Returns {w: (rmin, rmax)}, arrays shaped like values.
+    """
+    x = np.asarray(values, dtype=float)
+    n = x.shape[0]
+    windows = sorted({int(w) for w in windows})
+    if windows and windows[0] < 1:
+        raise ValueError("windows must be >= 1")
+
+    # levels[k] = (min, max) over x[i : i + 2**k], for i in [0, n - 2**k]
+    levels = [(x, x)]
+    span = 1
+    max_window = min(windows[-1], n) if windows else 0
+    while span * 2 <= max_window:
+        lo, hi = levels[-1]
+        levels.append((np.minimum(lo[:-span], lo[span:]), np.maximum(hi[:-span], hi[span:])))
+        span *= 2
+
+    out = {}
+    for w in windows:
+        rmin = np.full(x.shape, np.nan)
+        rmax = np.full(x.shape, np.nan)
+        if w <= n:
+            k = w.bit_length() - 1
+            lo, hi = levels[k]
+            run = 1 << k
+            # Window ending at row j covers [j - w + 1, j]: runs starting at j - w + 1 and j - run + 1
+            count = n - w + 1
+            rmin[w - 1:] = np.minimum(lo[:count], lo[w - run:w - run + count])
+            rmax[w - 1:] = np.maximum(hi[:count], hi[w - run:w - run + count])
+        out[w] = (rmin, rmax)
+    return out
+
+
+def rolling_range_index(values, windows, low=0.0, high=100.0, flat=np.nan):
+    """
+    Range oscillator: position of each value within its trailing window's min/max,
+    scaled to [low, high] (0-100 for COT indices, -100..100 for the valuation rescale).
+    Windows with max == min get flat. Returns {w: array shaped like values}.
+    """
+    x = np.asarray(values, dtype=float)
+    out = {}
+    for w, (rmin, rmax) in rolling_extrema(x, windows).items():
+        denom = rmax - rmin
+        with np.errstate(divide='ignore', invalid='ignore'):
+            idx = (x - rmin) * (high - low) / denom + low
+        idx[denom == 0] = flat
+        out[w] = idx
+    return out
@@ -1,123 +1,205 @@
 
+import io
 import os
+import re
 import json
 import time
 import requests
 import pandas as pd
+import numpy as np
+import math
+import pickle
+import shutil
+import hashlib
+import importlib
+import heapq
+import threading
+import functools
 import concurrent.futures
-from datetime import datetime
+from datetime import datetime, timezone
 from analysis import fetch_ticker_data, analyze_seasonality
+from cancellation import OperationCancelled, check_cancelled
 
 # Configuration
 INDICES_DIR = "indices"
 os.makedirs(INDICES_DIR, exist_ok=True)
-CACHE_DURATION_CONST = 15552000  # 180 days (approx 6 months)
+INDEX_VERSIONS_DIR = os.path.join(INDICES_DIR, "versions")
+INDEX_REFRESH_AGE = int(os.environ.get("INDEX_REFRESH_AGE", 7 * 24 * 3600))  # Older snapshots trigger a background refresh
+INDEX_REFRESH_WORKERS = int(os.environ.get("INDEX_REFRESH_WORKERS", 8))
+CANCEL_POLL_SECONDS = 0.5  # How often screen_index checks for cancellation
+
+# Persistent worker pool (shared by all screens)
+SCREENER_WORKERS = int(os.environ.get("SCREENER_WORKERS", os.cpu_count() or 2))
+SCREENER_MAX_TASKS_PER_CHILD = int(os.environ.get("SCREENER_MAX_TASKS_PER_CHILD", 500))  # Recycle workers (0 = never)
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+# Scheduling: per-task timeouts and speculative retries of stragglers
+FETCH_WORKERS = int(os.environ.get("SCREENER_FETCH_WORKERS", 16))
+FETCH_TIMEOUT = float(os.environ.get("SCREENER_FETCH_TIMEOUT", 30))            # seconds per ticker
+FETCH_ATTEMPTS = 2
+COMPUTE_TIMEOUT_PER_TICKER = float(os.environ.get("SCREENER_COMPUTE_TIMEOUT", 120))
+COMPUTE_ATTEMPTS = 2
+COMPUTE_CHUNK_MAX = 8
+
+# Large universes: batches bound memory, checkpoints make long scans resumable
+SCREEN_BATCH_SIZE = int(os.environ.get("SCREENER_BATCH_SIZE", 200))
+SCREENER_MAX_TICKERS = int(os.environ.get("SCREENER_MAX_TICKERS", 10000))
+CHECKPOINT_DIR = os.environ.get("SCREENER_CHECKPOINT_DIR", "screener_checkpoints")
+CHECKPOINT_TTL = int(os.environ.get("SCREENER_CHECKPOINT_TTL", 24 * 3600))
+# Compact on-disk price histories (Date/Close only) shared by all screens
+HISTORY_DIR = os.environ.get("SCREENER_HISTORY_DIR", "screener_history")
+HISTORY_DISK_TTL = int(os.environ.get("SCREENER_HISTORY_TTL", 20 * 3600))
+US_LISTED_EXCHANGES = {"NYSE", "Nasdaq", "CBOE"}
+LARGE_UNIVERSES = {"us_all"}  # Too big for the nightly materialization by default
+# Sharded screens: publish shards to the queue in sharding.py and let workers on any node pull them
+SCREENER_SHARDED = os.environ.get("SCREENER_SHARDED", "0") == "1"
+SHARD_LOCAL_WORKER = os.environ.get("SHARD_LOCAL_WORKER", "1") == "1"  # Coordinator also works on its own scan
 # Force reload trigger
 
 
+# One session for all scrapes (connection reuse)
+SCRAPE_SESSION = requests.Session()
+SCRAPE_SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+})
+
+
 def get_html_with_headers(url):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
-    r = requests.get(url, headers=headers)
+    r = SCRAPE_SESSION.get(url, timeout=30)
     r.raise_for_status()
     return r.text
 
 
-def fetch_dow_jones():
-    url = "https://en.wikipedia.org/wiki/Dow_Jones_Industrial_Average"
-    try:
-        html = get_html_with_headers(url)
-        tables = pd.read_html(html)
-        
-        # Iterate to find the constituents table
-        for df in tables:
-            # Check for common column names
-            cols = [str(c).lower() for c in df.columns]
-            if "symbol" in cols or "ticker" in cols:
-                # Identify the correct column name (case-sensitive from original df)
-                target_col = "Symbol" if "Symbol" in df.columns else ("Ticker" if "Ticker" in df.columns else None)
-                if not target_col:
-                     # Case insensitive search
+def get_html_conditional(url, etag=None, last_modified=None):
+    """
+    Conditional GET: returns (html, etag, last_modified), with html None when the
+    server answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    r = SCRAPE_SESSION.get(url, headers=headers, timeout=30)
+    if r.status_code == 304:
+        return None, etag, last_modified
+    r.raise_for_status()
+    return r.text, r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+
+DOW_URL = "https://en.wikipedia.org/wiki/Dow_Jones_Industrial_Average"
+
+def parse_dow_jones(html):
+    """Extracts the Dow Jones constituents table from the Wikipedia page."""
+    tables = pd.read_html(io.StringIO(html))
+    
+    # Iterate to find the constituents table
+    for df in tables:
+        # Check for common column names
+        cols = [str(c).lower() for c in df.columns]
+        if "symbol" in cols or "ticker" in cols:
+            # Identify the correct column name (case-sensitive from original df)
+            target_col = "Symbol" if "Symbol" in df.columns else ("Ticker" if "Ticker" in df.columns else None)
+            if not target_col:
+                 # Case insensitive search
+                 for c in df.columns:
+                     if str(c).lower() in ["symbol", "ticker"]:
+                         target_col = c
+                         break
+            
+            if target_col:
+                # Try to find Company Name
+                name_col = "Company"
+                if "Company" not in df.columns:
                      for c in df.columns:
-                         if str(c).lower() in ["symbol", "ticker"]:
-                             target_col = c
+                         if "company" in str(c).lower() or "security" in str(c).lower():
+                             name_col = c
                              break
                 
-                if target_col:
-                    # Try to find Company Name
-                    name_col = "Company"
-                    if "Company" not in df.columns:
-                         for c in df.columns:
-                             if "company" in str(c).lower() or "security" in str(c).lower():
-                                 name_col = c
-                                 break
+                results = []
+                for idx, row in df.iterrows():
+                    t = str(row[target_col]).strip()
+                    n = str(row[name_col]).strip() if name_col in df.columns else t
+                    results.append({"ticker": t, "name": n})
                     
-                    results = []
-                    for idx, row in df.iterrows():
-                        t = str(row[target_col]).strip()
-                        n = str(row[name_col]).strip() if name_col in df.columns else t
-                        results.append({"ticker": t, "name": n})
-                        
-                    # Sanity check
-                    if 10 <= len(results) <= 50:
-                        return results
-
-        print("Dow Jones: Could not find table with Symbol/Ticker.")
-        return []
+                # Sanity check
+                if 10 <= len(results) <= 50:
+                    return results
+
+    print("Dow Jones: Could not find table with Symbol/Ticker.")
+    return []
+
+
+def fetch_dow_jones():
+    try:
+        return parse_dow_jones(get_html_with_headers(DOW_URL))
     except Exception as e:
         print(f"Error fetching Dow: {e}")
         return []
 
+
+NASDAQ_100_URL = "https://en.wikipedia.org/wiki/Nasdaq-100"
+
+def parse_nasdaq_100(html):
+    """Extracts the Nasdaq-100 constituents table from the Wikipedia page."""
+    tables = pd.read_html(io.StringIO(html))
+    for t in tables:
+        if "Ticker" in t.columns and "Company" in t.columns:
+            return [{"ticker": str(row["Ticker"]).strip(), "name": str(row["Company"]).strip()} for idx, row in t.iterrows()]
+        if "Symbol" in t.columns and "Company" in t.columns:
+            return [{"ticker": str(row["Symbol"]).strip(), "name": str(row["Company"]).strip()} for idx, row in t.iterrows()]
+    return []
+
+
 def fetch_nasdaq_100():
-    url = "https://en.wikipedia.org/wiki/Nasdaq-100"
     try:
-        html = get_html_with_headers(url)
-        tables = pd.read_html(html)
-        for t in tables:
-            if "Ticker" in t.columns and "Company" in t.columns:
-                return [{"ticker": str(row["Ticker"]).strip(), "name": str(row["Company"]).strip()} for idx, row in t.iterrows()]
-            if "Symbol" in t.columns and "Company" in t.columns:
-                return [{"ticker": str(row["Symbol"]).strip(), "name": str(row["Company"]).strip()} for idx, row in t.iterrows()]
-        return []
+        return parse_nasdaq_100(get_html_with_headers(NASDAQ_100_URL))
     except Exception as e:
         print(f"Error fetching Nasdaq: {e}")
         return []
 
+
+DAX_URL = "https://en.wikipedia.org/wiki/DAX"
+
+def parse_dax(html):
+    """Extracts the DAX constituents table from the Wikipedia page."""
+    tables = pd.read_html(io.StringIO(html))
+    for t in tables:
+        if "Ticker symbol" in t.columns:
+            res = []
+            # Try name
+            name_col = "Company" if "Company" in t.columns else t.columns[0]
+            for idx, row in t.iterrows():
+                tick = str(row["Ticker symbol"]).strip()
+                tick = tick if tick.endswith(".DE") else f"{tick}.DE"
+                name = str(row[name_col]).strip()
+                res.append({"ticker": tick, "name": name})
+            return res
+        if "Ticker" in t.columns and "Prime Standard" in str(t.columns): 
+             res = []
+             name_col = "Company" if "Company" in t.columns else "Name"
+             for idx, row in t.iterrows():
+                 tick = str(row["Ticker"]).strip()
+                 tick = tick if tick.endswith(".DE") else f"{tick}.DE"
+                 nm = str(row[name_col]).strip() if name_col in t.columns else tick
+                 res.append({"ticker": tick, "name": nm})
+             return res
+        # Fallback for generic Ticker column
+        if "Ticker" in t.columns and len(t) > 20 and len(t) < 50:
+             res = []
+             for idx, row in t.iterrows():
+                 tick = str(row["Ticker"]).strip()
+                 tick = tick if tick.endswith(".DE") else f"{tick}.DE"
+                 res.append({"ticker": tick, "name": tick}) # Name unknown
+             return res
+    return []
+
+
 def fetch_dax():
-    url = "https://en.wikipedia.org/wiki/DAX"
     try:
-        html = get_html_with_headers(url)
-        tables = pd.read_html(html)
-        for t in tables:
-            if "Ticker symbol" in t.columns:
-                res = []
-                # Try name
-                name_col = "Company" if "Company" in t.columns else t.columns[0]
-                for idx, row in t.iterrows():
-                    tick = str(row["Ticker symbol"]).strip()
-                    tick = tick if tick.endswith(".DE") else f"{tick}.DE"
-                    name = str(row[name_col]).strip()
-                    res.append({"ticker": tick, "name": name})
-                return res
-            if "Ticker" in t.columns and "Prime Standard" in str(t.columns): 
-                 res = []
-                 name_col = "Company" if "Company" in t.columns else "Name"
-                 for idx, row in t.iterrows():
-                     tick = str(row["Ticker"]).strip()
-                     tick = tick if tick.endswith(".DE") else f"{tick}.DE"
-                     nm = str(row[name_col]).strip() if name_col in t.columns else tick
-                     res.append({"ticker": tick, "name": nm})
-                 return res
-            # Fallback for generic Ticker column
-            if "Ticker" in t.columns and len(t) > 20 and len(t) < 50:
-                 res = []
-                 for idx, row in t.iterrows():
-                     tick = str(row["Ticker"]).strip()
-                     tick = tick if tick.endswith(".DE") else f"{tick}.DE"
-                     res.append({"ticker": tick, "name": tick}) # Name unknown
-                 return res
-        return []
+        return parse_dax(get_html_with_headers(DAX_URL))
     except Exception as e:
         print(f"Error fetching DAX: {e}")
         return []
@@ -219,6 +301,26 @@ def fetch_currencies_chf():
         {"ticker": "CHFJPY=X", "name": "CHF/JPY"}
     ]
 
+def fetch_us_listed():
+    """Full US listed universe (NYSE, Nasdaq, Cboe) from the SEC ticker list, largest companies first."""
+    from ticker_search import load_universe, refresh_universe
+
+    rows = load_universe()
+    if not rows:
+        refresh_universe()
+        rows = load_universe()
+
+    tickers, seen = [], set()
+    for r in rows:
+        ticker = r["ticker"].upper().strip()
+        if r.get("exchange") and r["exchange"] not in US_LISTED_EXCHANGES:
+            continue
+        if ticker in seen:
+            continue
+        seen.add(ticker)
+        tickers.append({"ticker": ticker, "name": r.get("name") or ticker})
+    return tickers
+
 INDEX_FETCHERS = {
     "dow": fetch_dow_jones,
     "nasdaq": fetch_nasdaq_100,
@@ -231,57 +333,245 @@ INDEX_FETCHERS = {
     "curr_aud": fetch_currencies_aud,
     "curr_nzd": fetch_currencies_nzd,
     "curr_cad": fetch_currencies_cad,
-    "curr_chf": fetch_currencies_chf
+    "curr_chf": fetch_currencies_chf,
+    "us_all": fetch_us_listed
 }
 
 
             
 
-def get_index_constituents(index_name):
+# Scraped indices: page URL and parser, so refreshes can use conditional requests
+INDEX_SOURCES = {
+    "dow": (DOW_URL, parse_dow_jones),
+    "nasdaq": (NASDAQ_100_URL, parse_nasdaq_100),
+    "dax": (DAX_URL, parse_dax),
+}
+
+_REFRESH_LOCKS = {name: threading.Lock() for name in INDEX_FETCHERS}
+_REFRESH_EXECUTOR = None
+_REFRESH_EXECUTOR_LOCK = threading.Lock()
+
+
+def _index_path(index_name):
+    return os.path.join(INDICES_DIR, f"{index_name}.json")
+
+
+# Snapshot versions are "<UTC timestamp>-<tickers hash>"; anything else never reaches the filesystem
+CONSTITUENTS_VERSION_RE = re.compile(r"^\d{8}T\d{6}-[0-9a-f]{8}$")
+
+
+def is_valid_version(version):
+    return isinstance(version, str) and CONSTITUENTS_VERSION_RE.fullmatch(version) is not None
+
+
+def _version_path(index_name, version):
+    if not is_valid_version(version):
+        raise ValueError(f"Invalid constituents version: {version!r}")
+    return os.path.join(INDEX_VERSIONS_DIR, index_name, f"{version}.json")
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_index_file(index_name):
+    try:
+        with open(_index_path(index_name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _tickers_hash(tickers):
+    return hashlib.sha1(json.dumps(tickers, sort_keys=True).encode()).hexdigest()[:8]
+
+
+def list_index_versions(index_name):
+    """Stored constituent snapshots of an index, newest first."""
+    index_name = index_name.lower()
+    folder = os.path.join(INDEX_VERSIONS_DIR, index_name)
+    if not os.path.isdir(folder):
+        return []
+    versions = []
+    for name in sorted(os.listdir(folder), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(folder, name), "r") as f:
+                data = json.load(f)
+            versions.append({"version": data["version"], "created_at": data["created_at"], "count": len(data["tickers"])})
+        except (OSError, ValueError, KeyError):
+            continue
+    return versions
+
+
+def get_index_version(index_name):
+    data = _read_index_file(index_name.lower())
+    return data.get("version") if data else None
+
+
+def refresh_index(index_name):
+    """
+    Refreshes one index. Scraped pages are requested with If-None-Match /
+    If-Modified-Since; a new snapshot version is only written when the
+    constituents actually changed. Returns a short status string.
+    """
+    index_name = index_name.lower()
+    lock = _REFRESH_LOCKS.setdefault(index_name, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return "in_progress"
+    try:
+        current = _read_index_file(index_name) or {}
+        now = time.time()
+
+        if index_name in INDEX_SOURCES:
+            url, parser = INDEX_SOURCES[index_name]
+            html, etag, last_modified = get_html_conditional(url, current.get("etag"), current.get("last_modified"))
+            if html is None and current.get("tickers"):
+                current["timestamp"] = now
+                _write_json(_index_path(index_name), current)
+                return "not_modified"
+            if html is None:
+                # 304 but nothing stored locally: fetch unconditionally
+                html, etag, last_modified = get_html_conditional(url)
+            tickers = parser(html)
+        else:
+            etag = last_modified = None
+            tickers = INDEX_FETCHERS[index_name]()
+
+        if not tickers:
+            print(f"ERROR: Failed to fetch constituents for {index_name}, keeping the current snapshot.")
+            return "error"
+
+        digest = _tickers_hash(tickers)
+        version = current.get("version")
+        status = "unchanged"
+        if digest != current.get("hash") or not version:
+            version = f"{datetime.fromtimestamp(now, timezone.utc):%Y%m%dT%H%M%S}-{digest}"
+            _write_json(_version_path(index_name, version), {"version": version, "created_at": now, "tickers": tickers})
+            status = f"updated:{version}"
+
+        _write_json(_index_path(index_name), {
+            "timestamp": now,
+            "tickers": tickers,
+            "version": version,
+            "hash": digest,
+            "etag": etag,
+            "last_modified": last_modified
+        })
+        print(f"DEBUG: Refreshed {index_name} ({len(tickers)} tickers): {status}")
+        return status
+    except Exception as e:
+        print(f"ERROR: Refresh of {index_name} failed: {e}")
+        return "error"
+    finally:
+        lock.release()
+
+
+def refresh_all_indices(index_names=None, max_workers=INDEX_REFRESH_WORKERS):
+    """Refreshes all (or the given) indices in parallel; returns {index: status}."""
+    index_names = index_names or list(INDEX_FETCHERS.keys())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(index_names, executor.map(refresh_index, index_names)))
+
+
+def refresh_index_async(index_name):
+    """Schedules a refresh on a background thread; never blocks the caller."""
+    global _REFRESH_EXECUTOR
+    with _REFRESH_EXECUTOR_LOCK:
+        if _REFRESH_EXECUTOR is None:
+            _REFRESH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=INDEX_REFRESH_WORKERS,
+                                                                     thread_name_prefix="index-refresh")
+    return _REFRESH_EXECUTOR.submit(refresh_index, index_name)
+
+
+def get_index_constituents(index_name, version=None):
+    """
+    Constituents of an index: the pinned snapshot if version is given, otherwise the
+    current one. A stale current snapshot is still served while a background refresh
+    runs; only an index that was never fetched is fetched synchronously.
+    """
     index_name = index_name.lower()
     if index_name not in INDEX_FETCHERS:
         raise ValueError(f"Unknown index: {index_name}")
-        
-    file_path = os.path.join(INDICES_DIR, f"{index_name}.json")
-    
-    # Check cache
-    if os.path.exists(file_path):
+
+    if version:
         try:
-            with open(file_path, "r") as f:
-                data = json.load(f)
-                timestamp = data.get("timestamp", 0)
-                tickers = data.get("tickers", [])
-                
-                # Check if valid and not empty
-                if (time.time() - timestamp) < CACHE_DURATION_CONST and len(tickers) > 0:
-                    print(f"DEBUG: Cache hit for {index_name}. found {len(tickers)} tickers.")
-                    return tickers
-                else:
-                    print(f"DEBUG: Cache expired or empty for {index_name}. Refreshing...")
-        except Exception as e:
-            print(f"DEBUG: Cache read failed for {index_name}: {e}")
-            pass # Force update if read fails
-            
-    # Update
+            with open(_version_path(index_name, version), "r") as f:
+                return json.load(f)["tickers"]
+        except (OSError, ValueError, KeyError):
+            raise ValueError(f"Unknown constituents version for {index_name}: {version}")
+
+    data = _read_index_file(index_name)
+    if data and data.get("tickers"):
+        if time.time() - data.get("timestamp", 0) > INDEX_REFRESH_AGE:
+            print(f"DEBUG: Constituents of {index_name} are stale, refreshing in the background.")
+            refresh_index_async(index_name)
+        print(f"DEBUG: Cache hit for {index_name}. found {len(data['tickers'])} tickers.")
+        return data["tickers"]
+
+    # Never fetched (or unreadable): nothing to serve until the first refresh
     print(f"Updating constituents for {index_name}...")
-    tickers = INDEX_FETCHERS[index_name]()
-    if tickers:
-        with open(file_path, "w") as f:
-            json.dump({
-                "timestamp": time.time(),
-                "tickers": tickers
-            }, f)
-        print(f"DEBUG: Successfully updated {index_name} with {len(tickers)} tickers.")
-    else:
-        print(f"ERROR: Failed to fetch constituents for {index_name}.")
-        
-    return tickers
+    refresh_index(index_name)
+    data = _read_index_file(index_name)
+    return data.get("tickers", []) if data else []
+
+
+
+WORKER_MODULES = ["pandas", "yfinance", "analysis"]
 
 
+def _init_worker():
+    # Pay the heavy imports once per worker instead of once per screen
+    for mod in WORKER_MODULES:
+        importlib.import_module(mod)
+
+
+def _warm_worker():
+    return os.getpid()
+
+
+def get_screener_pool():
+    """Returns the long-lived process pool, (re)creating and pre-warming it if needed."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            kwargs = {"max_workers": SCREENER_WORKERS, "initializer": _init_worker}
+            if SCREENER_MAX_TASKS_PER_CHILD > 0:
+                kwargs["max_tasks_per_child"] = SCREENER_MAX_TASKS_PER_CHILD
+            _POOL = concurrent.futures.ProcessPoolExecutor(**kwargs)
+            # Spawn all workers now so the first screen does not pay for it
+            warm = [_POOL.submit(_warm_worker) for _ in range(SCREENER_WORKERS)]
+            concurrent.futures.wait(warm)
+            print(f"DEBUG: Screener pool ready with {SCREENER_WORKERS} workers")
+        return _POOL
+
+
+def _discard_pool(pool):
+    """Drops a broken pool so the next screen builds a fresh one."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_screener_pool():
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
 
 def process_ticker(ticker_obj, min_win_rate=70, min_year=2014, search_start_date=None, search_end_date=None, 
                   filter_mode=None, filter_odd_years=False, exclude_2020=False, filter_election=False, 
-                  filter_midterm=False, filter_pre_election=False, filter_post_election=False):
+                  filter_midterm=False, filter_pre_election=False, filter_post_election=False, cancel_token=None,
+                  df=None):
     # Handle both string (legacy cache) and dict (new)
     if isinstance(ticker_obj, str):
         ticker = ticker_obj
@@ -294,7 +584,9 @@ def process_ticker(ticker_obj, min_win_rate=70, min_year=2014, search_start_date
         # Re-import inside process for safety if pickling issues arise, though top-level imports usually fine
         # from analysis import fetch_ticker_data, analyze_seasonality (already imported at top)
         
-        df = fetch_ticker_data(ticker)
+        check_cancelled(cancel_token)
+        if df is None:
+            df = fetch_ticker_data(ticker)
         if df is None or df.empty:
             return {"patterns": [], "error": "No Data"}
         
@@ -313,13 +605,16 @@ def process_ticker(ticker_obj, min_win_rate=70, min_year=2014, search_start_date
             filter_election=filter_election,
             filter_midterm=filter_midterm,
             filter_pre_election=filter_pre_election,
-            filter_post_election=filter_post_election
+            filter_post_election=filter_post_election,
+            cancel_token=cancel_token
         )
         for p in patterns:
             p['ticker'] = ticker
             p['asset_name'] = name
         return {"patterns": patterns, "error": None}
 
+    except OperationCancelled as e:
+        return {"patterns": [], "error": f"{ticker}: {e}", "cancelled": True}
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -327,65 +622,491 @@ def process_ticker(ticker_obj, min_win_rate=70, min_year=2014, search_start_date
         return {"patterns": [], "error": str(e)}
 
 
+def process_chunk(items, **kwargs):
+    """Compute task: screens a batch of (ticker_obj, df) pairs in one worker round-trip."""
+    return [process_ticker(ticker_obj, df=df, **kwargs) for ticker_obj, df in items]
+
+
+def _history_path(ticker):
+    safe = "".join(ch if ch.isalnum() or ch in "-_.=" else "_" for ch in ticker.upper())
+    return os.path.join(HISTORY_DIR, f"{safe}.npz")
+
+
+def load_cached_history(ticker, max_age=HISTORY_DISK_TTL):
+    path = _history_path(ticker)
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with np.load(path) as data:
+            return pd.DataFrame({"Date": pd.to_datetime(data["dates"]), "Close": data["close"]})
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_cached_history(ticker, df):
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    path = _history_path(ticker)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmp_path,
+                 dates=pd.to_datetime(df['Date']).values.astype('datetime64[ns]'),
+                 close=pd.to_numeric(df['Close'], errors='coerce').to_numpy(dtype=float))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"History cache write failed for {ticker}: {e}")
+
+
+def _fetch_history(ticker):
+    """Network task: only the columns the screen needs travel to the compute workers."""
+    df = load_cached_history(ticker)
+    if df is not None:
+        return df
+    df = fetch_ticker_data(ticker)
+    if df is None or df.empty:
+        return None
+    df = df[['Date', 'Close']]
+    save_cached_history(ticker, df)
+    return df
+
+
+def _run_speculative(executor, fn, jobs, timeout, max_attempts, cancel_token=None):
+    """
+    Runs fn(*args) for every job on the executor. Idle workers pull the next queued job.
+    If a job runs longer than timeout(key), a duplicate attempt is queued (up to max_attempts).
+    The first attempt that finishes wins. Once every attempt has timed out, the result is
+    a TimeoutError, so one hung job cannot stall the whole run.
+    Returns ({key: result or exception}, cancelled).
+    """
+    results = {}
+    attempts = {}      # key -> list of futures
+    started = {}       # future -> time it was first seen running
+    owner = {}         # future -> key
+
+    def submit(key):
+        f = executor.submit(fn, *jobs[key])
+        attempts.setdefault(key, []).append(f)
+        owner[f] = key
+
+    def settle(key, value):
+        results[key] = value
+        for f in attempts.get(key, []):
+            f.cancel()
+            owner.pop(f, None)
+
+    for key in jobs:
+        submit(key)
+
+    while owner:
+        done, _ = concurrent.futures.wait(list(owner), timeout=CANCEL_POLL_SECONDS,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        for f in done:
+            key = owner.pop(f, None)
+            if key is None or key in results or f.cancelled():
+                continue
+            try:
+                settle(key, f.result())
+            except concurrent.futures.BrokenExecutor:
+                raise
+            except Exception as e:
+                settle(key, e)
+
+        now = time.time()
+        for f, key in list(owner.items()):
+            if key in results or f.done():
+                continue
+            if f not in started:
+                if f.running():
+                    started[f] = now
+                continue
+            if now - started[f] <= timeout(key):
+                continue
+            # Straggler: queue another attempt once, give up when all attempts have timed out
+            live = [a for a in attempts[key] if not a.done()]
+            if live and f is live[-1]:
+                if len(attempts[key]) < max_attempts:
+                    print(f"DEBUG: Requeueing straggler {key} (attempt {len(attempts[key]) + 1})")
+                    submit(key)
+                elif all(a in started and now - started[a] > timeout(key) for a in live):
+                    settle(key, TimeoutError(f"timed out after {len(attempts[key])} attempts"))
+
+        if cancel_token is not None and cancel_token.cancelled():
+            # Drop queued work; running tasks stop at their next chunk boundary
+            for f in owner:
+                f.cancel()
+            return results, True
+
+    return results, False
+
+
+def _chunk_size(n_items, n_workers):
+    # ~4 chunks per worker keeps the tail short while amortizing IPC/pickling
+    return max(1, min(COMPUTE_CHUNK_MAX, math.ceil(n_items / (max(n_workers, 1) * 4))))
+
+
+# Result ranking: fields a screen can be sorted by ("-field" = descending)
+RANK_FIELDS = ("win_rate", "avg_return", "max_return", "min_return", "years_analyzed", "duration")
+DEFAULT_SORT = "-win_rate"
+
+
+def parse_sort(sort_by):
+    """'-win_rate,-avg_return' -> [('win_rate', True), ('avg_return', True)]; raises ValueError."""
+    keys = []
+    for part in (sort_by or DEFAULT_SORT).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        descending = part.startswith("-")
+        field = part.lstrip("+-")
+        if field not in RANK_FIELDS:
+            raise ValueError(f"Cannot sort by '{field}'. Use one of: {', '.join(RANK_FIELDS)}")
+        keys.append((field, descending))
+    return keys or parse_sort(DEFAULT_SORT)
+
+
+def pattern_matches(p, min_win_rate=None, min_avg_return=None, pattern_type=None,
+                    min_duration=None, max_duration=None, min_years=None):
+    if min_win_rate is not None and p.get('win_rate', 0) < min_win_rate:
+        return False
+    if min_avg_return is not None and p.get('avg_return', 0) < min_avg_return:
+        return False
+    if pattern_type and p.get('type', '').lower() != pattern_type.lower():
+        return False
+    if min_duration is not None and p.get('duration', 0) < min_duration:
+        return False
+    if max_duration is not None and p.get('duration', 0) > max_duration:
+        return False
+    if min_years is not None and p.get('years_analyzed', 0) < min_years:
+        return False
+    return True
+
+
+class TopK:
+    """
+    Streaming top-K selection over patterns: filters on push and keeps at most k
+    rows in a min-heap whose root is the current worst. Ties keep push order.
+    """
+
+    def __init__(self, k=None, sort_by=None, filters=None):
+        self.k = k if k and k > 0 else None
+        self.keys = parse_sort(sort_by)
+        self.filters = filters or {}
+        self.matched = 0
+        self._heap = []
+        self._rows = []  # Unbounded mode (k=None) skips the heap
+        self._seq = 0
+
+    def _rank(self, p):
+        rank = []
+        for field, descending in self.keys:
+            v = p.get(field)
+            v = float("-inf") if v is None else (v if descending else -v)
+            rank.append(v)
+        return tuple(rank)
+
+    def push(self, p):
+        """Returns True if p entered the kept rows (it may still be evicted later)."""
+        if not pattern_matches(p, **self.filters):
+            return False
+        self.matched += 1
+        self._seq += 1
+        if self.k is None:
+            self._rows.append((self._rank(p), -self._seq, p))
+            return True
+        item = (self._rank(p), -self._seq, p)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+        else:
+            return False
+        return True
+
+    def extend(self, patterns):
+        for p in patterns:
+            self.push(p)
+
+    def results(self):
+        rows = self._rows if self.k is None else self._heap
+        return [p for _, _, p in sorted(rows, key=lambda r: r[:2], reverse=True)]
+
+
+def _scan_id(index_name, ticker_ids, params):
+    """Stable id of a scan (universe + parameters), so rerunning the same request resumes it."""
+    raw = json.dumps({"index": index_name, "tickers": ticker_ids, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def _checkpoint_dir(scan_id):
+    return os.path.join(CHECKPOINT_DIR, scan_id)
+
+
+def load_checkpoint(scan_id, max_age=CHECKPOINT_TTL):
+    """
+    Segments of an interrupted scan in batch order, contiguous from the first ticker
+    (None if there are none, or the newest is older than max_age).
+    """
+    directory = _checkpoint_dir(scan_id)
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(".pkl"))
+    except OSError:
+        return None
+    segments = []
+    newest = 0
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            newest = max(newest, os.path.getmtime(path))
+            with open(path, "rb") as f:
+                segment = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            break
+        if segment["start"] != (segments[-1]["stop"] if segments else 0):
+            break
+        segments.append(segment)
+    if not segments or time.time() - newest > max_age:
+        return None
+    return segments
+
+
+def save_checkpoint(scan_id, segment):
+    """
+    Appends one batch segment: its counters and the patterns that entered the top-K.
+    Each batch is written once, so checkpoint I/O stays linear in the universe size.
+    """
+    directory = _checkpoint_dir(scan_id)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{segment['start']:09d}.pkl")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(segment, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(scan_id):
+    shutil.rmtree(_checkpoint_dir(scan_id), ignore_errors=True)
+
+
+def _screen_batch(tickers, ticker_ids, batch, worker_kwargs, cancel_token=None):
+    """
+    Screens tickers[i] for i in batch: fetch on threads (phase 1), then compute in
+    chunks on the persistent ProcessPool (phase 2). Returns ({i: result}, cancelled).
+    """
+    # Phase 1: network-bound history fetches, one ticker per task on threads
+    fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_WORKERS)
+    try:
+        fetched, cancelled = _run_speculative(
+            fetch_executor, _fetch_history,
+            {i: (ticker_ids[i],) for i in batch},
+            timeout=lambda key: FETCH_TIMEOUT, max_attempts=FETCH_ATTEMPTS, cancel_token=cancel_token
+        )
+    finally:
+        # Never wait on hung downloads
+        fetch_executor.shutdown(wait=False, cancel_futures=True)
+
+    results = {}
+    for i, res in fetched.items():
+        if isinstance(res, Exception):
+            results[i] = {"patterns": [], "error": f"{ticker_ids[i]}: fetch {res}"}
+        elif res is None:
+            results[i] = {"patterns": [], "error": "No Data"}
+    if cancelled:
+        return results, True
+
+    # Phase 2: CPU-bound screening, batched chunks on the persistent ProcessPool
+    ready = [i for i in fetched if i not in results]
+    executor = get_screener_pool()
+    size = _chunk_size(len(ready), SCREENER_WORKERS)
+    chunks = [ready[k:k + size] for k in range(0, len(ready), size)]
+    print(f"DEBUG: Screening {len(ready)} tickers in {len(chunks)} chunks of <= {size} (ProcessPool)...")
+
+    worker = functools.partial(process_chunk, cancel_token=cancel_token, **worker_kwargs)
+    jobs = {c: ([(tickers[i], fetched[i]) for i in chunk],) for c, chunk in enumerate(chunks)}
+    try:
+        computed, cancelled = _run_speculative(
+            executor, worker, jobs,
+            timeout=lambda c: COMPUTE_TIMEOUT_PER_TICKER * len(chunks[c]),
+            max_attempts=COMPUTE_ATTEMPTS, cancel_token=cancel_token
+        )
+    except concurrent.futures.BrokenExecutor as e:
+        _discard_pool(executor)
+        computed = {c: e for c in range(len(chunks))}
+
+    for c, res in computed.items():
+        for pos, i in enumerate(chunks[c]):
+            if isinstance(res, Exception):
+                results[i] = {"patterns": [], "error": f"{ticker_ids[i]}: {res}"}
+            else:
+                results[i] = res[pos]
+    return results, cancelled
+
+
 def screen_index(index_name, min_win_rate=70, min_year=2014, search_start_date=None, search_end_date=None,
                  filter_mode=None, filter_odd_years=False, exclude_2020=False, filter_election=False, 
-                 filter_midterm=False, filter_pre_election=False, filter_post_election=False):
+                 filter_midterm=False, filter_pre_election=False, filter_post_election=False, cancel_token=None,
+                 top_k=None, sort_by=None, filters=None, tickers=None, resume=True, sharded=None, version=None):
+    """
+    Screens every constituent of an index, or the given tickers (custom universe).
+    Results are filtered (see pattern_matches) and ranked by sort_by; with top_k only
+    the best k patterns are kept. Tickers are processed in batches of SCREEN_BATCH_SIZE;
+    scans larger than one batch append a checkpoint segment after each batch, and rerunning
+    the same scan (resume=True) replays the segments and continues after the last one.
+    With sharded=True (default: SCREENER_SHARDED for universes above one shard) the
+    universe is split into shards on the shard queue and the partial top-K lists merged.
+    version pins a stored constituents snapshot (see list_index_versions).
+    """
                  
     print(f"DEBUG: screen_index called with index={index_name}")
-    try:
-        tickers = get_index_constituents(index_name)
-    except Exception as e:
-        print(f"ERROR getting constituents: {e}")
-        return {"error": f"Failed to load index: {str(e)}", "results": []}
+    constituents_version = None
+    if tickers is None:
+        try:
+            tickers = get_index_constituents(index_name, version=version)
+            constituents_version = version or get_index_version(index_name)
+        except Exception as e:
+            print(f"ERROR getting constituents: {e}")
+            return {"error": f"Failed to load index: {str(e)}", "results": []}
 
     print(f"DEBUG: Found {len(tickers)} tickers for {index_name}")
     
     if not tickers:
         return {"error": f"No tickers found for index {index_name}. Wikipedia fetch might have failed.", "results": []}
         
-    all_patterns = []
+    worker_kwargs = dict(min_win_rate=min_win_rate,
+                         min_year=min_year,
+                         search_start_date=search_start_date,
+                         search_end_date=search_end_date,
+                         filter_mode=filter_mode,
+                         filter_odd_years=filter_odd_years,
+                         exclude_2020=exclude_2020,
+                         filter_election=filter_election,
+                         filter_midterm=filter_midterm,
+                         filter_pre_election=filter_pre_election,
+                         filter_post_election=filter_post_election)
+    ticker_ids = [t if isinstance(t, str) else t.get("ticker") for t in tickers]
+
+    if sharded is None:
+        from sharding import SHARD_SIZE
+        sharded = SCREENER_SHARDED and len(tickers) > SHARD_SIZE
+    if sharded:
+        from sharding import screen_sharded
+        params = dict(worker_kwargs, top_k=top_k, sort_by=sort_by, filters=filters)
+        result = screen_sharded(_scan_id(index_name, ticker_ids, params), index_name, tickers, params,
+                                cancel_token=cancel_token, local_worker=SHARD_LOCAL_WORKER)
+        result["constituents_version"] = constituents_version
+        return result
+
+    ranked = TopK(top_k, sort_by, filters)
     errors = []
+    error_count = 0
     scanned_count = 0
-    
-    # ProcessPool for true parallelism
-    print(f"DEBUG: Starting parallel screening (ProcessPool) for {len(tickers)} tickers...")
-    
-    # Use functools.partial to pass the constant arguments
-    import functools
-    worker = functools.partial(process_ticker, 
-                               min_win_rate=min_win_rate, 
-                               min_year=min_year, 
-                               search_start_date=search_start_date, 
-                               search_end_date=search_end_date,
-                               filter_mode=filter_mode,
-                               filter_odd_years=filter_odd_years,
-                               exclude_2020=exclude_2020,
-                               filter_election=filter_election,
-                               filter_midterm=filter_midterm,
-                               filter_pre_election=filter_pre_election,
-                               filter_post_election=filter_post_election)
-
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        # Map is cleaner for ProcessPool
-        results = list(executor.map(worker, tickers))
-        
-        # Collect results
-        for res in results:
-            scanned_count += 1
+    done = 0
+
+    checkpointing = len(tickers) > SCREEN_BATCH_SIZE
+    scan_id = None
+    if checkpointing:
+        scan_id = _scan_id(index_name, ticker_ids,
+                           dict(worker_kwargs, top_k=top_k, sort_by=sort_by, filters=filters))
+        segments = load_checkpoint(scan_id) if resume else None
+        if segments:
+            # Replaying the kept patterns in batch order rebuilds the same top-K, ties included;
+            # patterns that never entered the top-K could not be in it now either
+            for segment in segments:
+                ranked.extend(segment["kept"])
+                errors.extend(segment["errors"][:max(0, 5 - len(errors))])
+                error_count += segment["error_count"]
+                scanned_count += segment["scanned_count"]
+                done = segment["stop"]
+            ranked.matched = sum(segment["matched"] for segment in segments)
+            print(f"DEBUG: Resuming scan {scan_id} at {done}/{len(tickers)} tickers")
+        else:
+            clear_checkpoint(scan_id)
+
+    cancelled = False
+    while done < len(tickers) and not cancelled:
+        batch = range(done, min(done + SCREEN_BATCH_SIZE, len(tickers)))
+        print(f"DEBUG: Batch {batch.start}-{batch.stop} of {len(tickers)} tickers...")
+        results, cancelled = _screen_batch(tickers, ticker_ids, batch, worker_kwargs, cancel_token)
+
+        # Collect results (input order, so ties keep constituent order)
+        kept, batch_errors = [], []
+        batch_error_count = batch_scanned = 0
+        matched_before = ranked.matched
+        for i in batch:
+            res = results.get(i)
+            if res is None or res.get("cancelled"):
+                continue
+            batch_scanned += 1
             if res.get("error"):
-                 # Extract ticker from error message if possible, or just log
-                 errors.append(res["error"])
-            
-            if res.get("patterns"):
-                all_patterns.extend(res["patterns"])
+                batch_error_count += 1
+                if len(errors) + len(batch_errors) < 5:
+                    batch_errors.append(res["error"])
+            for p in res.get("patterns") or []:
+                if ranked.push(p):
+                    kept.append(p)
+        del results  # Histories and per-ticker payloads of this batch are no longer needed
+        errors.extend(batch_errors)
+        error_count += batch_error_count
+        scanned_count += batch_scanned
 
-    # Sort Global Results
-    all_patterns.sort(key=lambda x: x['win_rate'], reverse=True)
-    
-    return {
-        "results": all_patterns,
+        if cancelled:
+            break
+        done = batch.stop
+        if checkpointing and done < len(tickers):
+            save_checkpoint(scan_id, {
+                "start": batch.start,
+                "stop": batch.stop,
+                "kept": kept,
+                "matched": ranked.matched - matched_before,
+                "errors": batch_errors,
+                "error_count": batch_error_count,
+                "scanned_count": batch_scanned
+            })
+
+    if checkpointing and not cancelled:
+        clear_checkpoint(scan_id)
+
+    result = {
+        "results": ranked.results(),
+        "total_matches": ranked.matched,
         "tickers_found": len(tickers),
         "scanned_count": scanned_count,
-        "error_count": len(errors),
-        "sample_errors": errors[:5]
+        "error_count": error_count,
+        "sample_errors": errors[:5],
+        "cancelled": cancelled,
+        "constituents_version": constituents_version
     }
+    if checkpointing and cancelled:
+        # Rerunning the same request picks up from here
+        result["checkpoint"] = {"scan_id": scan_id, "done": done, "total": len(tickers)}
+    return result
+
+
+# Materialized default screens (refreshed nightly, see jobs.py)
+MATERIALIZE_LOOKBACKS = [int(x) for x in os.environ.get("MATERIALIZE_LOOKBACKS", "20").split(",") if x.strip()]
+MATERIALIZE_MIN_WIN_RATE = 50  # Lowest win rate the UI offers; stricter requests filter the stored rows
+
+
+def materialize_screens(index_names=None, lookbacks=None):
+    """Screens every index with the default parameter sets and stores the results."""
+    from pattern_store import save_screen_run
+
+    index_names = index_names or [name for name in INDEX_FETCHERS if name not in LARGE_UNIVERSES]
+    lookbacks = lookbacks or MATERIALIZE_LOOKBACKS
+    current_year = datetime.now().year
+    summary = {}
+
+    for index_name in index_names:
+        for lookback in lookbacks:
+            t0 = time.time()
+            try:
+                result = screen_index(index_name, min_win_rate=MATERIALIZE_MIN_WIN_RATE, min_year=current_year - lookback)
+                if result.get("error") or result.get("cancelled"):
+                    print(f"Materialize {index_name}/{lookback}y skipped: {result.get('error') or 'cancelled'}")
+                    summary[f"{index_name}/{lookback}"] = "skipped"
+                    continue
+                save_screen_run(index_name, lookback, MATERIALIZE_MIN_WIN_RATE, result)
+                summary[f"{index_name}/{lookback}"] = len(result["results"])
+                print(f"Materialized {index_name}/{lookback}y: {len(result['results'])} patterns in {time.time() - t0:.0f}s")
+            except Exception as e:
+                print(f"Materialize {index_name}/{lookback}y failed: {e}")
+                summary[f"{index_name}/{lookback}"] = "error"
+    return summary
@@ -0,0 +1,694 @@
+import os
+import sys
+import json
+import time
+import pickle
+import socket
+import sqlite3
+import threading
+
+# Configuration (env)
+# SHARD_QUEUE_URL selects the queue backend: redis://host:port/db for workers on any node,
+# empty for the local SQLite file. SQLite WAL needs shared memory on one host, so that
+# backend is for a single machine (and tests), never a network filesystem.
+SHARD_QUEUE_URL = os.environ.get("SHARD_QUEUE_URL", "")
+SHARD_QUEUE_FILE = os.environ.get("SHARD_QUEUE_FILE", "shard_queue.db")
+SHARD_REDIS_PREFIX = os.environ.get("SHARD_REDIS_PREFIX", "shards")
+SHARD_SIZE = int(os.environ.get("SHARD_SIZE", 100))                     # Tickers per shard
+SHARD_LEASE_SECONDS = int(os.environ.get("SHARD_LEASE_SECONDS", 600))   # Lease expiry -> shard is retried
+SHARD_MAX_ATTEMPTS = int(os.environ.get("SHARD_MAX_ATTEMPTS", 3))
+SHARD_RESULT_TTL = int(os.environ.get("SHARD_RESULT_TTL", 20 * 3600))   # Finished scans are reused this long
+SHARD_POLL_SECONDS = float(os.environ.get("SHARD_POLL_SECONDS", 1.0))
+# Without a local worker, give up if no worker touched the scan for this long
+SHARD_WORKER_WAIT = float(os.environ.get("SHARD_WORKER_WAIT", 60))
+
+OPEN = "open"
+CANCELLED = "cancelled"
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+class ShardQueue:
+    """
+    Work queue for sharded screens (interface; see SQLiteShardQueue, RedisShardQueue).
+    Shards are leased, not popped: a shard whose worker dies becomes available again
+    once its lease expires (running workers renew theirs), and only the current lease
+    owner can complete or release a shard, so retries are idempotent.
+    """
+
+    def publish(self, scan_id, index_name, tickers, params, shard_size=SHARD_SIZE):
+        """Splits tickers into shards and enqueues them (reopens an existing scan)."""
+        raise NotImplementedError
+
+    def cancel(self, scan_id):
+        """Stops handing out shards of a scan."""
+        raise NotImplementedError
+
+    def lease(self, owner, lease_seconds=SHARD_LEASE_SECONDS, scan_id=None):
+        """Claims a shard: (scan_id, shard_no, index_name, params, tickers) or None."""
+        raise NotImplementedError
+
+    def renew(self, scan_id, shard_no, owner, lease_seconds=SHARD_LEASE_SECONDS):
+        """Extends a lease still held by owner; False if it was lost."""
+        raise NotImplementedError
+
+    def complete(self, scan_id, shard_no, result, owner):
+        """Stores the result of a shard leased by owner; False if the lease was lost."""
+        raise NotImplementedError
+
+    def fail(self, scan_id, shard_no, error, owner):
+        """Releases a shard leased by owner after an error (retried until SHARD_MAX_ATTEMPTS)."""
+        raise NotImplementedError
+
+    def last_activity(self, scan_id):
+        """Latest time a worker leased, renewed or finished a shard of the scan (None if never)."""
+        raise NotImplementedError
+
+    def status(self, scan_id):
+        """Progress: shard counts per status and whether every shard is done or failed (None if unknown)."""
+        raise NotImplementedError
+
+    def results(self, scan_id):
+        """(shard_no, result or None, error) for every shard, in shard order."""
+        raise NotImplementedError
+
+
+def open_queue(url=None):
+    """The configured queue backend: Redis for SHARD_QUEUE_URL, otherwise the SQLite file."""
+    url = SHARD_QUEUE_URL if url is None else url
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisShardQueue(url)
+    return SQLiteShardQueue(url or None)
+
+
+class SQLiteShardQueue(ShardQueue):
+    """Shard queue on a SQLite file: local stand-in for tests and single-host runs."""
+
+    def __init__(self, path=None):
+        self.path = path or SHARD_QUEUE_FILE
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS scans (
+                    scan_id TEXT PRIMARY KEY,
+                    index_name TEXT,
+                    params TEXT,          -- JSON: screen_index keyword arguments
+                    total_shards INTEGER,
+                    status TEXT,          -- open / cancelled
+                    created_at REAL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS shards (
+                    scan_id TEXT,
+                    shard_no INTEGER,
+                    tickers TEXT,         -- JSON list of ticker objects
+                    status TEXT,          -- pending / leased / done / failed
+                    attempts INTEGER DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result BLOB,          -- Pickled partial top-K and counters
+                    error TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (scan_id, shard_no)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_shards_status ON shards (status, lease_expires)')
+        finally:
+            conn.close()
+
+    def publish(self, scan_id, index_name, tickers, params, shard_size=SHARD_SIZE):
+        """
+        Splits tickers into shards and enqueues them. Publishing an existing scan
+        reopens it and keeps finished shards; results older than SHARD_RESULT_TTL
+        are dropped and recomputed.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT created_at FROM scans WHERE scan_id = ?", (scan_id,)).fetchone()
+            if row is not None and now - row['created_at'] > SHARD_RESULT_TTL:
+                conn.execute("DELETE FROM shards WHERE scan_id = ?", (scan_id,))
+                conn.execute("DELETE FROM scans WHERE scan_id = ?", (scan_id,))
+                row = None
+
+            if row is None:
+                shards = [tickers[k:k + shard_size] for k in range(0, len(tickers), shard_size)]
+                conn.execute(
+                    "INSERT INTO scans (scan_id, index_name, params, total_shards, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (scan_id, index_name, json.dumps(params), len(shards), OPEN, now)
+                )
+                conn.executemany(
+                    "INSERT INTO shards (scan_id, shard_no, tickers, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    [(scan_id, n, json.dumps(shard), PENDING, now) for n, shard in enumerate(shards)]
+                )
+            else:
+                conn.execute("UPDATE scans SET status = ? WHERE scan_id = ?", (OPEN, scan_id))
+                # Give shards that ran out of attempts another round
+                conn.execute(
+                    "UPDATE shards SET status = ?, attempts = 0, updated_at = ? WHERE scan_id = ? AND status = ?",
+                    (PENDING, now, scan_id, FAILED)
+                )
+
+            # Housekeeping: drop scans nobody will reuse
+            old = [r[0] for r in conn.execute("SELECT scan_id FROM scans WHERE created_at < ?", (now - SHARD_RESULT_TTL,))]
+            for old_id in old:
+                conn.execute("DELETE FROM shards WHERE scan_id = ?", (old_id,))
+                conn.execute("DELETE FROM scans WHERE scan_id = ?", (old_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return scan_id
+
+    def cancel(self, scan_id):
+        """Stops handing out shards of a scan (running shards finish, their results are kept)."""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE scans SET status = ? WHERE scan_id = ?", (CANCELLED, scan_id))
+        finally:
+            conn.close()
+
+    def lease(self, owner, lease_seconds=SHARD_LEASE_SECONDS, scan_id=None):
+        """
+        Claims the next pending shard (or one whose lease expired) of an open scan.
+        Returns (scan_id, shard_no, index_name, params, tickers) or None.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            query = '''
+                SELECT s.scan_id, s.shard_no, s.tickers, s.attempts, c.index_name, c.params
+                FROM shards s JOIN scans c ON c.scan_id = s.scan_id
+                WHERE c.status = ?
+                  AND (s.status = ? OR (s.status = ? AND s.lease_expires < ?))
+            '''
+            args = [OPEN, PENDING, LEASED, now]
+            if scan_id:
+                query += " AND s.scan_id = ?"
+                args.append(scan_id)
+            query += " ORDER BY c.created_at, s.shard_no LIMIT 1"
+            row = conn.execute(query, args).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row['attempts'] >= SHARD_MAX_ATTEMPTS:
+                # Expired lease on the last attempt: give up on this shard
+                conn.execute(
+                    "UPDATE shards SET status = ?, error = ?, updated_at = ? WHERE scan_id = ? AND shard_no = ?",
+                    (FAILED, "lease expired on every attempt", now, row['scan_id'], row['shard_no'])
+                )
+                conn.execute("COMMIT")
+                return self.lease(owner, lease_seconds, scan_id)
+
+            conn.execute('''
+                UPDATE shards SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ?
+                WHERE scan_id = ? AND shard_no = ?
+            ''', (LEASED, owner, now + lease_seconds, now, row['scan_id'], row['shard_no']))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return row['scan_id'], row['shard_no'], row['index_name'], json.loads(row['params']), json.loads(row['tickers'])
+
+    def renew(self, scan_id, shard_no, owner, lease_seconds=SHARD_LEASE_SECONDS):
+        """Extends a lease still held by owner. False if the shard was taken over meanwhile."""
+        conn = self._connect()
+        try:
+            cur = conn.execute('''
+                UPDATE shards SET lease_expires = ?, updated_at = ?
+                WHERE scan_id = ? AND shard_no = ? AND status = ? AND lease_owner = ?
+            ''', (time.time() + lease_seconds, time.time(), scan_id, shard_no, LEASED, owner))
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+    def complete(self, scan_id, shard_no, result, owner):
+        """
+        Stores a shard result. Only the current lease owner can complete a shard, so a stale
+        worker (lease expired and re-granted) cannot overwrite or double-complete it.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.execute('''
+                UPDATE shards SET status = ?, result = ?, error = NULL, lease_expires = NULL, updated_at = ?
+                WHERE scan_id = ? AND shard_no = ? AND status != ? AND lease_owner = ?
+            ''', (DONE, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), time.time(), scan_id, shard_no, DONE, owner))
+            return cur.rowcount > 0
+        finally:
+            conn.close()
+
+    def fail(self, scan_id, shard_no, error, owner):
+        """Releases a shard after an error; it is retried until SHARD_MAX_ATTEMPTS."""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE shards
+                SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                    error = ?, lease_expires = NULL, updated_at = ?
+                WHERE scan_id = ? AND shard_no = ? AND status = ? AND lease_owner = ?
+            ''', (SHARD_MAX_ATTEMPTS, FAILED, PENDING, str(error)[:500], time.time(), scan_id, shard_no, LEASED, owner))
+        finally:
+            conn.close()
+
+    def last_activity(self, scan_id):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT MAX(updated_at) FROM shards WHERE scan_id = ? AND lease_owner IS NOT NULL", (scan_id,)
+            ).fetchone()
+            return row[0]
+        finally:
+            conn.close()
+
+    def status(self, scan_id):
+        conn = self._connect()
+        try:
+            scan = conn.execute("SELECT * FROM scans WHERE scan_id = ?", (scan_id,)).fetchone()
+            if scan is None:
+                return None
+            counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+            for r in conn.execute("SELECT status, COUNT(*) AS n FROM shards WHERE scan_id = ? GROUP BY status", (scan_id,)):
+                counts[r['status']] = r['n']
+            return {
+                "scan_id": scan_id,
+                "index": scan['index_name'],
+                "status": scan['status'],
+                "total": scan['total_shards'],
+                **counts,
+                "finished": counts[DONE] + counts[FAILED] == scan['total_shards']
+            }
+        finally:
+            conn.close()
+
+    def results(self, scan_id):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT shard_no, result, error FROM shards WHERE scan_id = ? ORDER BY shard_no", (scan_id,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(r['shard_no'], pickle.loads(r['result']) if r['result'] is not None else None, r['error']) for r in rows]
+
+
+# Lua scripts keep every state change of the Redis queue atomic (one round trip each).
+# Keys of a scan hang off "<prefix>:scan:<scan_id>": the scan hash itself, ":pending" (list of
+# shard numbers), ":leased" (set), ":shard:<n>" (hash) and ":lease:<n>" (owner, with the lease TTL).
+_REDIS_PUBLISH = """
+local base, scans = KEYS[1], KEYS[2]
+local scan_id, index_name, params, now, ttl = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4]), tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', scans, '-inf', now - ttl)
+local created = redis.call('HGET', base, 'created_at')
+if created and now - tonumber(created) > ttl then
+  local total = tonumber(redis.call('HGET', base, 'total') or '0')
+  for n = 0, total - 1 do
+    redis.call('DEL', base .. ':shard:' .. n, base .. ':lease:' .. n)
+  end
+  redis.call('DEL', base, base .. ':pending', base .. ':leased')
+  created = false
+end
+if not created then
+  local total = #ARGV - 5
+  redis.call('HSET', base, 'index_name', index_name, 'params', params, 'total', total,
+             'status', 'open', 'created_at', now)
+  for n = 0, total - 1 do
+    local shard = base .. ':shard:' .. n
+    redis.call('HSET', shard, 'tickers', ARGV[6 + n], 'status', 'pending', 'attempts', 0, 'updated_at', now)
+    redis.call('EXPIRE', shard, ttl)
+    redis.call('RPUSH', base .. ':pending', n)
+  end
+  redis.call('EXPIRE', base, ttl)
+  if total > 0 then redis.call('EXPIRE', base .. ':pending', ttl) end
+  redis.call('ZADD', scans, now, scan_id)
+else
+  redis.call('HSET', base, 'status', 'open')
+  -- Give shards that ran out of attempts another round
+  local total = tonumber(redis.call('HGET', base, 'total'))
+  for n = 0, total - 1 do
+    local shard = base .. ':shard:' .. n
+    if redis.call('HGET', shard, 'status') == 'failed' then
+      redis.call('HSET', shard, 'status', 'pending', 'attempts', 0, 'updated_at', now)
+      redis.call('RPUSH', base .. ':pending', n)
+      redis.call('EXPIRE', base .. ':pending', math.max(redis.call('TTL', base), 1))
+    end
+  end
+end
+return 1
+"""
+
+_REDIS_LEASE = """
+local base = KEYS[1]
+local owner, lease_ms, max_attempts, now = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4]
+if redis.call('HGET', base, 'status') ~= 'open' then return false end
+while true do
+  local n = redis.call('LPOP', base .. ':pending')
+  if not n then
+    -- No pending shard: take over one whose lease key expired
+    for _, m in ipairs(redis.call('SMEMBERS', base .. ':leased')) do
+      if redis.call('EXISTS', base .. ':lease:' .. m) == 0 then n = m; break end
+    end
+    if not n then return false end
+  end
+  local shard = base .. ':shard:' .. n
+  local attempts = tonumber(redis.call('HGET', shard, 'attempts') or '0')
+  if attempts >= max_attempts then
+    -- Expired lease on the last attempt: give up on this shard
+    redis.call('SREM', base .. ':leased', n)
+    redis.call('HSET', shard, 'status', 'failed', 'error', 'lease expired on every attempt', 'updated_at', now)
+  else
+    redis.call('SADD', base .. ':leased', n)
+    redis.call('EXPIRE', base .. ':leased', math.max(redis.call('TTL', base), 1))
+    redis.call('HSET', shard, 'status', 'leased', 'attempts', attempts + 1, 'owner', owner, 'updated_at', now)
+    redis.call('HSET', base, 'activity', now)
+    redis.call('SET', base .. ':lease:' .. n, owner, 'PX', lease_ms)
+    return {n, redis.call('HGET', shard, 'tickers'), redis.call('HGET', base, 'index_name'),
+            redis.call('HGET', base, 'params')}
+  end
+end
+"""
+
+_REDIS_RENEW = """
+local base, n, owner, lease_ms, now = KEYS[1], ARGV[1], ARGV[2], tonumber(ARGV[3]), ARGV[4]
+if redis.call('GET', base .. ':lease:' .. n) ~= owner then return 0 end
+redis.call('PEXPIRE', base .. ':lease:' .. n, lease_ms)
+redis.call('HSET', base .. ':shard:' .. n, 'updated_at', now)
+redis.call('HSET', base, 'activity', now)
+return 1
+"""
+
+_REDIS_COMPLETE = """
+local base, n, owner, result, now = KEYS[1], ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local shard = base .. ':shard:' .. n
+if redis.call('HGET', shard, 'owner') ~= owner or redis.call('HGET', shard, 'status') == 'done' then return 0 end
+redis.call('HSET', shard, 'status', 'done', 'result', result, 'error', '', 'updated_at', now)
+redis.call('SREM', base .. ':leased', n)
+redis.call('DEL', base .. ':lease:' .. n)
+redis.call('HSET', base, 'activity', now)
+return 1
+"""
+
+_REDIS_FAIL = """
+local base, n, owner, err, max_attempts, now = KEYS[1], ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4]), ARGV[5]
+local shard = base .. ':shard:' .. n
+if redis.call('HGET', shard, 'owner') ~= owner or redis.call('HGET', shard, 'status') ~= 'leased' then return 0 end
+redis.call('SREM', base .. ':leased', n)
+redis.call('DEL', base .. ':lease:' .. n)
+if tonumber(redis.call('HGET', shard, 'attempts')) >= max_attempts then
+  redis.call('HSET', shard, 'status', 'failed', 'error', err, 'updated_at', now)
+else
+  redis.call('HSET', shard, 'status', 'pending', 'error', err, 'updated_at', now)
+  redis.call('RPUSH', base .. ':pending', n)
+  redis.call('EXPIRE', base .. ':pending', math.max(redis.call('TTL', base), 1))
+end
+redis.call('HSET', base, 'activity', now)
+return 1
+"""
+
+
+class RedisShardQueue(ShardQueue):
+    """
+    Shard queue on Redis, shared by workers on any node. Leases are keys with a TTL
+    (renewed by the worker's heartbeat); a shard whose lease key expired is handed out
+    again. Scans expire after SHARD_RESULT_TTL. Needs the redis package.
+    """
+
+    def __init__(self, url=None, prefix=SHARD_REDIS_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SHARD_QUEUE_URL points at Redis but the redis package is not installed")
+        self.url = url or SHARD_QUEUE_URL
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(self.url)
+        self._publish = self.client.register_script(_REDIS_PUBLISH)
+        self._lease = self.client.register_script(_REDIS_LEASE)
+        self._renew = self.client.register_script(_REDIS_RENEW)
+        self._complete = self.client.register_script(_REDIS_COMPLETE)
+        self._fail = self.client.register_script(_REDIS_FAIL)
+
+    def _scan_key(self, scan_id):
+        return f"{self.prefix}:scan:{scan_id}"
+
+    def _scans_key(self):
+        return f"{self.prefix}:scans"
+
+    def publish(self, scan_id, index_name, tickers, params, shard_size=SHARD_SIZE):
+        shards = [json.dumps(tickers[k:k + shard_size]) for k in range(0, len(tickers), shard_size)]
+        self._publish(keys=[self._scan_key(scan_id), self._scans_key()],
+                      args=[scan_id, index_name, json.dumps(params), time.time(), SHARD_RESULT_TTL] + shards)
+        return scan_id
+
+    def cancel(self, scan_id):
+        key = self._scan_key(scan_id)
+        if self.client.exists(key):
+            self.client.hset(key, "status", CANCELLED)
+
+    def lease(self, owner, lease_seconds=SHARD_LEASE_SECONDS, scan_id=None):
+        if scan_id:
+            candidates = [scan_id]
+        else:
+            # Oldest scan first, like the SQLite backend
+            candidates = [s.decode() for s in self.client.zrange(self._scans_key(), 0, -1)]
+        for sid in candidates:
+            row = self._lease(keys=[self._scan_key(sid)],
+                              args=[owner, int(lease_seconds * 1000), SHARD_MAX_ATTEMPTS, time.time()])
+            if row:
+                shard_no, tickers, index_name, params = row
+                return sid, int(shard_no), index_name.decode(), json.loads(params), json.loads(tickers)
+        return None
+
+    def renew(self, scan_id, shard_no, owner, lease_seconds=SHARD_LEASE_SECONDS):
+        return bool(self._renew(keys=[self._scan_key(scan_id)],
+                                args=[shard_no, owner, int(lease_seconds * 1000), time.time()]))
+
+    def complete(self, scan_id, shard_no, result, owner):
+        return bool(self._complete(keys=[self._scan_key(scan_id)],
+                                   args=[shard_no, owner, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL),
+                                         time.time()]))
+
+    def fail(self, scan_id, shard_no, error, owner):
+        self._fail(keys=[self._scan_key(scan_id)],
+                   args=[shard_no, owner, str(error)[:500], SHARD_MAX_ATTEMPTS, time.time()])
+
+    def last_activity(self, scan_id):
+        value = self.client.hget(self._scan_key(scan_id), "activity")
+        return float(value) if value is not None else None
+
+    def _shard_fields(self, scan_id, total, *fields):
+        pipe = self.client.pipeline(transaction=False)
+        for n in range(total):
+            pipe.hmget(f"{self._scan_key(scan_id)}:shard:{n}", *fields)
+        return pipe.execute()
+
+    def status(self, scan_id):
+        scan = self.client.hgetall(self._scan_key(scan_id))
+        if not scan:
+            return None
+        total = int(scan[b"total"])
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        for (state,) in self._shard_fields(scan_id, total, "status"):
+            if state is not None:
+                counts[state.decode()] += 1
+        return {
+            "scan_id": scan_id,
+            "index": scan[b"index_name"].decode(),
+            "status": scan[b"status"].decode(),
+            "total": total,
+            **counts,
+            "finished": counts[DONE] + counts[FAILED] == total
+        }
+
+    def results(self, scan_id):
+        total = self.client.hget(self._scan_key(scan_id), "total")
+        if total is None:
+            return []
+        rows = self._shard_fields(scan_id, int(total), "result", "error")
+        return [(n, pickle.loads(result) if result else None, error.decode() if error else None)
+                for n, (result, error) in enumerate(rows)]
+
+
+def _heartbeat(queue, scan_id, shard_no, owner, stop_event, lease_seconds=SHARD_LEASE_SECONDS):
+    # Renew at a third of the lease, so a slow shard is never re-leased while it still runs
+    while not stop_event.wait(lease_seconds / 3):
+        if not queue.renew(scan_id, shard_no, owner, lease_seconds):
+            print(f"Shard {scan_id}/{shard_no}: lease lost")
+            return
+
+
+def run_shard(queue, lease, owner, cancel_token=None):
+    """
+    Screens one leased shard locally and writes the partial top-K back.
+    A cancelled shard is released instead of completed.
+    """
+    from screener import screen_index
+
+    scan_id, shard_no, index_name, params, tickers = lease
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(queue, scan_id, shard_no, owner, stop),
+                                 name=f"shard-heartbeat-{scan_id}-{shard_no}", daemon=True)
+    heartbeat.start()
+    try:
+        res = screen_index(index_name, tickers=tickers, resume=False, sharded=False,
+                           cancel_token=cancel_token, **params)
+        if res.get("error"):
+            raise RuntimeError(res["error"])
+        if res.get("cancelled"):
+            raise RuntimeError("cancelled")
+        queue.complete(scan_id, shard_no, {
+            "results": res["results"],
+            "matched": res.get("total_matches", len(res["results"])),
+            "scanned_count": res["scanned_count"],
+            "error_count": res["error_count"],
+            "sample_errors": res["sample_errors"],
+        }, owner)
+    except Exception as e:
+        print(f"Shard {scan_id}/{shard_no} failed: {e}")
+        queue.fail(scan_id, shard_no, e, owner)
+    finally:
+        stop.set()
+
+
+def run_worker(queue=None, scan_id=None, stop_event=None, idle_exit=None, cancel_token=None):
+    """
+    Worker loop: lease a shard, screen it, write the result back.
+    scan_id restricts the worker to one scan; idle_exit (seconds) ends the loop
+    once no shard was available for that long (None = run until stopped).
+    cancel_token also stops the shard in progress (coordinator's in-process worker).
+    """
+    queue = queue or open_queue()
+    owner = worker_id()
+    idle_since = time.time()
+    done = 0
+    while (stop_event is None or not stop_event.is_set()) and \
+            (cancel_token is None or not cancel_token.cancelled()):
+        lease = queue.lease(owner, scan_id=scan_id)
+        if lease is None:
+            if idle_exit is not None and time.time() - idle_since > idle_exit:
+                break
+            time.sleep(SHARD_POLL_SECONDS)
+            continue
+        run_shard(queue, lease, owner, cancel_token)
+        done += 1
+        idle_since = time.time()
+    return done
+
+
+def merge_shard_results(scan_results, top_k=None, sort_by=None):
+    """
+    Coordinator merge: every shard result is already the top-K of its tickers under
+    the same ranking, so the top-K of their union is the global top-K.
+    """
+    from screener import TopK
+
+    ranked = TopK(top_k, sort_by)
+    matched = scanned = error_count = 0
+    errors, failed = [], []
+    for shard_no, res, error in scan_results:
+        if res is None:
+            if error:
+                failed.append(shard_no)
+                if len(errors) < 5:
+                    errors.append(f"shard {shard_no}: {error}")
+            continue
+        ranked.extend(res["results"])
+        matched += res["matched"]
+        scanned += res["scanned_count"]
+        error_count += res["error_count"]
+        errors.extend(res["sample_errors"][:max(0, 5 - len(errors))])
+    return {
+        "results": ranked.results(),
+        "total_matches": matched,
+        "scanned_count": scanned,
+        "error_count": error_count,
+        "sample_errors": errors[:5],
+        "failed_shards": failed,
+    }
+
+
+def screen_sharded(scan_id, index_name, tickers, params, cancel_token=None, local_worker=True,
+                   shard_size=SHARD_SIZE, queue=None):
+    """
+    Coordinator: publishes the scan, optionally works on it in-process as well, waits
+    until every shard is done or failed, then merges the partial top-K lists.
+    Without a local worker the scan is cancelled (error result) once no worker has
+    touched it for SHARD_WORKER_WAIT seconds, instead of waiting for the deadline.
+    """
+    queue = queue or open_queue()
+    queue.publish(scan_id, index_name, tickers, params, shard_size=shard_size)
+    print(f"DEBUG: Published scan {scan_id} ({len(tickers)} tickers, shards of {shard_size})")
+
+    stop = threading.Event()
+    worker = None
+    if local_worker:
+        # Shares the request's cancel token: a cancelled scan also stops the shard being screened here
+        worker = threading.Thread(target=run_worker, kwargs={"queue": queue, "scan_id": scan_id, "stop_event": stop,
+                                                             "cancel_token": cancel_token},
+                                  name=f"shard-worker-{scan_id}", daemon=True)
+        worker.start()
+
+    cancelled = False
+    error = None
+    started = time.time()
+    try:
+        while True:
+            state = queue.status(scan_id)
+            if state["finished"]:
+                break
+            if cancel_token is not None and cancel_token.cancelled():
+                queue.cancel(scan_id)
+                cancelled = True
+                break
+            if not local_worker:
+                last = max(started, queue.last_activity(scan_id) or 0)
+                if time.time() - last > SHARD_WORKER_WAIT:
+                    queue.cancel(scan_id)
+                    error = f"No shard worker picked up scan {scan_id} within {SHARD_WORKER_WAIT:.0f}s"
+                    print(f"ERROR: {error}")
+                    break
+            time.sleep(SHARD_POLL_SECONDS)
+    finally:
+        stop.set()
+
+    merged = merge_shard_results(queue.results(scan_id), params.get("top_k"), params.get("sort_by"))
+    state = queue.status(scan_id)
+    merged.update({
+        "tickers_found": len(tickers),
+        "cancelled": cancelled,
+        "shards": {k: state[k] for k in ("scan_id", "total", DONE, FAILED, PENDING, LEASED)}
+    })
+    if error:
+        merged["error"] = error
+    return merged
+
+
+if __name__ == "__main__":
+    # python sharding.py [idle_exit_seconds] -- start a worker on this node (SHARD_QUEUE_URL for other nodes)
+    idle = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    print(f"Shard worker {worker_id()} polling {SHARD_QUEUE_URL or SHARD_QUEUE_FILE}")
+    n = run_worker(idle_exit=idle)
+    print(f"Shard worker finished {n} shards")
@@ -0,0 +1,159 @@
+import os
+import time
+import pickle
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+# Configuration (env)
+# All uvicorn/gunicorn workers on a host point at the same file and share entries.
+SHARED_CACHE_FILE = os.environ.get("SHARED_CACHE_FILE", os.path.join(os.path.dirname(__file__), "shared_cache.db"))
+SHARED_CACHE_ENABLED = os.environ.get("SHARED_CACHE_ENABLED", "1") == "1"
+PURGE_EVERY_N_SETS = 500
+
+_local = threading.local()
+
+
+def _get_conn():
+    """One SQLite connection per thread and process (connections must not cross a fork)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
+    conn = sqlite3.connect(SHARED_CACHE_FILE, timeout=10, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache (
+            namespace TEXT,
+            key TEXT,
+            value BLOB,
+            expires REAL,
+            PRIMARY KEY (namespace, key)
+        )
+    ''')
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+class SharedCache:
+    """
+    Two-tier cache: an in-process LRU (tier 1) in front of a SQLite file
+    shared by all worker processes (tier 2). Values are pickled; both tiers honour the TTL.
+    """
+
+    def __init__(self, namespace, ttl, maxsize=128):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._l1 = OrderedDict()   # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._sets = 0
+
+    def _l1_get(self, key, now):
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None:
+                return None
+            if item[0] < now:
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return item
+
+    def _l1_set(self, key, expires, value):
+        with self._lock:
+            self._l1[key] = (expires, value)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.maxsize:
+                self._l1.popitem(last=False)
+
+    def get(self, key, default=None):
+        now = time.time()
+        item = self._l1_get(key, now)
+        if item is not None:
+            return item[1]
+
+        if not SHARED_CACHE_ENABLED:
+            return default
+        try:
+            row = _get_conn().execute(
+                "SELECT value, expires FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+        except Exception as e:
+            print(f"Shared cache read error ({self.namespace}): {e}")
+            return default
+        if row is None or row[1] < now:
+            return default
+
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            return default
+        self._l1_set(key, row[1], value)
+        return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        self._l1_set(key, expires, value)
+
+        if not SHARED_CACHE_ENABLED:
+            return
+        try:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            conn = _get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, blob, expires)
+            )
+            self._sets += 1
+            if self._sets % PURGE_EVERY_N_SETS == 0:
+                conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+        except Exception as e:
+            print(f"Shared cache write error ({self.namespace}): {e}")
+
+    def delete(self, key):
+        with self._lock:
+            self._l1.pop(key, None)
+        if SHARED_CACHE_ENABLED:
+            try:
+                _get_conn().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            except Exception as e:
+                print(f"Shared cache delete error ({self.namespace}): {e}")
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        if SHARED_CACHE_ENABLED:
+            try:
+                _get_conn().execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+            except Exception as e:
+                print(f"Shared cache clear error ({self.namespace}): {e}")
+
+
+def shared_cached(namespace, ttl, maxsize=128):
+    """
+    Drop-in replacement for functools.lru_cache backed by SharedCache.
+    None results are not cached so failed fetches are retried.
+    """
+    def decorator(fn):
+        cache = SharedCache(namespace, ttl, maxsize=maxsize)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = repr((args, sorted(kwargs.items())))
+            value = cache.get(key)
+            if value is not None:
+                return value
+            value = fn(*args, **kwargs)
+            if value is not None:
+                cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorator
@@ -0,0 +1,25 @@
+import pytest
+
+from institutional_db import DEFAULT_TICKER_MAP, name_key
+from ingest_13f import resolve_ticker
+
+TICKER_MAP = {name_key(k): v for k, v in DEFAULT_TICKER_MAP.items()}
+
+
+@pytest.mark.parametrize("name, ticker", [
+    ("NVIDIA CORPORATION", "NVDA"),
+    ("MICROSOFT CORPORATION", "MSFT"),
+    ("INTEL CORPORATION", "INTC"),
+    ("NVIDIA CORP", "NVDA"),
+    ("Apple Inc", "AAPL"),
+    ("AMAZON COM INC", "AMZN"),
+    ("ADVANCED MICRO DEVICES INC", "AMD"),
+    ("  berkshire   hathaway inc del  ", "BRK.B"),
+])
+def test_resolve_ticker_matches_name_prefixes(name, ticker):
+    assert resolve_ticker(name, TICKER_MAP) == ticker
+
+
+def test_resolve_ticker_unknown_issuer():
+    assert resolve_ticker("EXXON MOBIL CORP", TICKER_MAP) is None
+    assert resolve_ticker("", TICKER_MAP) is None
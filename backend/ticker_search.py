@@ -0,0 +1,297 @@
+import os
+import re
+import json
+import threading
+import functools
+import requests
+
+# Configuration
+BASE_DIR = os.path.dirname(__file__)
+STOCK_DB_PATH = os.path.join(BASE_DIR, "stock_db.json")
+# Local symbol universe (SEC company ticker list). Refresh with: python ticker_search.py
+UNIVERSE_FILE = os.environ.get("TICKER_UNIVERSE_FILE", os.path.join(BASE_DIR, "backends_data", "company_tickers.json"))
+SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers_exchange.json"
+SEC_USER_AGENT = "LucidAlphaResearch contact@lucidalpha.com"
+
+TOP_PER_NODE = 10      # Precomputed best entries per trie node
+MAX_POSTING = 5000     # Trigrams more common than this carry no signal (e.g. "inc")
+
+# Match quality tiers (popularity in [0, 1] only breaks ties inside a tier)
+SCORE_TICKER_EXACT = 100
+SCORE_NAME_EXACT = 90
+SCORE_TICKER_PREFIX = 80
+SCORE_WORD_PREFIX = 60
+SCORE_FUZZY = 40
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _normalize(text):
+    return " ".join(_WORD_RE.findall(str(text).lower()))
+
+
+def _trigrams(text):
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Trie:
+    """Prefix trie where every node keeps its TOP_PER_NODE most popular entries."""
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, entry_id):
+        node = self.root
+        for ch in key:
+            node = node.setdefault(ch, {})
+            node.setdefault("#", []).append(entry_id)
+        node.setdefault("$", []).append(entry_id)
+
+    def finalize(self, popularity):
+        # Trim each node's candidate list to the most popular ids
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for k, child in node.items():
+                if k == "#" or k == "$":
+                    continue
+                ids = sorted(set(child["#"]), key=lambda i: -popularity[i])
+                child["#"] = ids[:TOP_PER_NODE]
+                stack.append(child)
+
+    def lookup(self, key):
+        node = self.root
+        for ch in key:
+            node = node.get(ch)
+            if node is None:
+                return [], []
+        return node.get("$", []), node.get("#", [])
+
+
+class TickerSearchIndex:
+    """
+    In-memory search index over the symbol universe:
+    - prefix trie over tickers
+    - prefix trie over name/alias words
+    - trigram postings over names/aliases for fuzzy/substring matches
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.popularity = []
+        self.by_ticker = {}
+        self.ticker_trie = _Trie()
+        self.word_trie = _Trie()
+        self.names = []          # normalized names per entry (exact match check)
+        self.grams = {}          # trigram -> list of entry ids
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, ticker, name, exchange="", type_="Equity", aliases=None, popularity=0.0):
+        ticker = str(ticker).upper().strip()
+        if not ticker:
+            return
+        aliases = list(aliases or [])
+
+        # First source wins (curated stock_db before the bulk universe), aliases are merged
+        if ticker in self.by_ticker:
+            entry = self.entries[self.by_ticker[ticker]]
+            entry["aliases"].extend(a for a in aliases if a not in entry["aliases"])
+            return
+
+        entry_id = len(self.entries)
+        self.by_ticker[ticker] = entry_id
+        self.entries.append({
+            "ticker": ticker,
+            "name": name or ticker,
+            "exchange": exchange or "",
+            "type": type_ or "Equity",
+            "aliases": aliases
+        })
+        self.popularity.append(float(popularity))
+
+    def build(self):
+        """Builds tries and postings once all entries are added."""
+        self.ticker_trie = _Trie()
+        self.word_trie = _Trie()
+        self.names = []
+        grams = {}
+
+        for entry_id, entry in enumerate(self.entries):
+            self.ticker_trie.insert(entry["ticker"].lower(), entry_id)
+
+            texts = [_normalize(entry["name"])] + [_normalize(a) for a in entry["aliases"]]
+            self.names.append(set(t for t in texts if t))
+
+            for text in texts:
+                for word in text.split():
+                    self.word_trie.insert(word, entry_id)
+                for g in _trigrams(text):
+                    grams.setdefault(g, set()).add(entry_id)
+
+        self.ticker_trie.finalize(self.popularity)
+        self.word_trie.finalize(self.popularity)
+        self.grams = {g: list(ids) for g, ids in grams.items() if len(ids) <= MAX_POSTING}
+        return self
+
+    def entry(self, entry_id):
+        """Copy of an entry, so callers cannot modify the index."""
+        entry = self.entries[entry_id]
+        return dict(entry, aliases=list(entry["aliases"]))
+
+    def search(self, q, limit=10):
+        return [self.entry(i) for i in self.search_ids(q, limit)]
+
+    def search_ids(self, q, limit=10):
+        q_norm = _normalize(q)
+        if not q_norm:
+            return []
+
+        scores = {}
+
+        def hit(entry_id, score):
+            if score > scores.get(entry_id, -1):
+                scores[entry_id] = score
+
+        # 1. Ticker trie (exact + prefix)
+        q_ticker = str(q).lower().strip()
+        exact, prefix = self.ticker_trie.lookup(q_ticker)
+        for i in exact:
+            hit(i, SCORE_TICKER_EXACT)
+        for i in prefix:
+            hit(i, SCORE_TICKER_PREFIX)
+
+        # 2. Word prefixes over names/aliases
+        # Completed words must match exactly, the last one may be a prefix
+        *complete, last = q_norm.split()
+        if complete:
+            # Intersect the full exact-word lists first; the last word's trie node is trimmed to
+            # TOP_PER_NODE, so its prefix is checked against the candidates' own words instead
+            candidates = None
+            for w in complete:
+                ids = set(self.word_trie.lookup(w)[0])
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+            candidates = {i for i in candidates or ()
+                          if any(word.startswith(last) for text in self.names[i] for word in text.split())}
+        else:
+            w_exact, w_prefix = self.word_trie.lookup(last)
+            candidates = set(w_exact) | set(w_prefix)
+        for i in candidates:
+            hit(i, SCORE_NAME_EXACT if q_norm in self.names[i] else SCORE_WORD_PREFIX)
+
+        # 3. Trigram fuzzy fallback, only if the cheap paths did not fill the list
+        if len(scores) < limit and len(q_norm) >= 3:
+            q_grams = _trigrams(q_norm)
+            counts = {}
+            for g in q_grams:
+                for i in self.grams.get(g, ()):
+                    counts[i] = counts.get(i, 0) + 1
+            min_overlap = max(1, len(q_grams) // 2)
+            for i, c in counts.items():
+                if c >= min_overlap:
+                    hit(i, SCORE_FUZZY * c / len(q_grams))
+
+        ranked = sorted(scores, key=lambda i: (scores[i] + self.popularity[i], self.entries[i]["ticker"]), reverse=True)
+        return ranked[:limit]
+
+
+def load_stock_db(path=STOCK_DB_PATH):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not load {path}: {e}")
+        return []
+
+
+def load_universe(path=UNIVERSE_FILE):
+    """
+    Reads the SEC ticker list. Supports both company_tickers_exchange.json
+    ({"fields": [...], "data": [[...], ...]}) and company_tickers.json ({"0": {...}, ...}).
+    Rows are returned in file order (SEC orders roughly by market cap).
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r") as f:
+            raw = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not load universe file {path}: {e}")
+        return []
+
+    rows = []
+    if isinstance(raw, dict) and "fields" in raw and "data" in raw:
+        fields = raw["fields"]
+        for rec in raw["data"]:
+            item = dict(zip(fields, rec))
+            rows.append({"ticker": item.get("ticker"), "name": item.get("name"), "exchange": item.get("exchange") or ""})
+    elif isinstance(raw, dict):
+        for item in raw.values():
+            rows.append({"ticker": item.get("ticker"), "name": item.get("title"), "exchange": ""})
+    return [r for r in rows if r["ticker"]]
+
+
+def build_search_index(stock_db=None, universe=None):
+    index = TickerSearchIndex()
+
+    stock_db = load_stock_db() if stock_db is None else stock_db
+    universe = load_universe() if universe is None else universe
+
+    # Curated entries rank above everything from the bulk list
+    for item in stock_db:
+        index.add(item["ticker"], item["name"], item.get("exchange", ""), item.get("type", "Equity"),
+                  item.get("aliases", []), popularity=1.0)
+
+    n = max(len(universe), 1)
+    for rank, item in enumerate(universe):
+        index.add(item["ticker"], item["name"], item.get("exchange", ""), "Equity",
+                  popularity=0.9 * (1 - rank / n))
+
+    return index.build()
+
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_search_index():
+    """Returns the process-wide index, building it on first use."""
+    global _INDEX
+    if _INDEX is None:
+        with _INDEX_LOCK:
+            if _INDEX is None:
+                _INDEX = build_search_index()
+                print(f"SUCCESS: Built ticker search index with {len(_INDEX)} symbols")
+    return _INDEX
+
+
+@functools.lru_cache(maxsize=4096)
+def _search_ids(q, limit):
+    return tuple(get_search_index().search_ids(q, limit=limit))
+
+
+def search_symbols(q, limit=10):
+    """Cached search; returns copies of the matching entries."""
+    index = get_search_index()
+    return [index.entry(i) for i in _search_ids(q, limit)]
+
+
+def refresh_universe(path=UNIVERSE_FILE):
+    """Downloads the SEC ticker list to the local universe file."""
+    headers = {"User-Agent": SEC_USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+    r = requests.get(SEC_TICKERS_URL, headers=headers, timeout=30)
+    r.raise_for_status()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(r.text)
+    os.replace(tmp_path, path)
+    print(f"Saved {len(load_universe(path))} symbols to {path}")
+
+
+if __name__ == "__main__":
+    refresh_universe()
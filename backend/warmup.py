@@ -0,0 +1,133 @@
+import os
+import time
+import importlib
+import threading
+import concurrent.futures
+
+# Configuration (env)
+WARMUP_ENABLED = os.environ.get("WARMUP_ENABLED", "1") == "1"
+WARMUP_COT = os.environ.get("WARMUP_COT", "1") == "1"
+WARMUP_PREFETCH_ASSETS = os.environ.get("WARMUP_PREFETCH_ASSETS", "1") == "1"
+WARMUP_SCREENER_POOL = os.environ.get("WARMUP_SCREENER_POOL", "1") == "1"
+# Extra tickers to prefetch, comma separated (e.g. "AAPL,MSFT,^GSPC")
+WARMUP_WATCHLIST = [t.strip() for t in os.environ.get("WARMUP_WATCHLIST", "").split(",") if t.strip()]
+WARMUP_FETCH_WORKERS = int(os.environ.get("WARMUP_FETCH_WORKERS", "8"))
+
+HEAVY_MODULES = ["analysis", "cot_service", "institutional_service", "calculators", "term_structure", "ticker_search"]
+
+WARMUP_STATE = {
+    "status": "pending",   # pending -> warming -> ready
+    "started_at": None,
+    "finished_at": None,
+    "steps": {}
+}
+_LOCK = threading.Lock()
+
+
+def _run_step(name, fn):
+    t0 = time.time()
+    with _LOCK:
+        WARMUP_STATE["steps"][name] = {"status": "running"}
+    try:
+        detail = fn()
+        step = {"status": "ok"}
+        if detail is not None:
+            step["detail"] = detail
+    except Exception as e:
+        print(f"Warm-up step {name} failed: {e}")
+        step = {"status": "error", "error": str(e)}
+    step["seconds"] = round(time.time() - t0, 2)
+    with _LOCK:
+        WARMUP_STATE["steps"][name] = step
+
+
+def _import_modules():
+    for mod in HEAVY_MODULES:
+        importlib.import_module(mod)
+    return {"modules": len(HEAVY_MODULES)}
+
+
+def _load_cot():
+    from cot_service import get_cot_store, REPORTS
+    rows = {}
+    for name in REPORTS:
+        rows[name] = get_cot_store(name).index["rows"]
+    return rows
+
+
+def _start_screener_pool():
+    from screener import get_screener_pool, SCREENER_WORKERS
+    get_screener_pool()
+    return {"workers": SCREENER_WORKERS}
+
+
+def _build_search_index():
+    from ticker_search import get_search_index
+    return {"symbols": len(get_search_index())}
+
+
+def _prefetch_histories(tickers):
+    from analysis import fetch_ticker_data
+
+    def fetch(ticker):
+        df = fetch_ticker_data(ticker)
+        return df is not None and not df.empty
+
+    ok, failed = 0, []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=WARMUP_FETCH_WORKERS) as executor:
+        for ticker, success in zip(tickers, executor.map(fetch, tickers)):
+            if success:
+                ok += 1
+            else:
+                failed.append(ticker)
+    return {"fetched": ok, "failed": failed}
+
+
+def run_warmup(tickers=None):
+    """
+    Preloads heavy modules, COT frames, the search index and price histories.
+    Failures of single steps are recorded but do not keep the instance cold forever.
+    """
+    with _LOCK:
+        WARMUP_STATE["status"] = "warming"
+        WARMUP_STATE["started_at"] = time.time()
+
+    print("Warm-up: starting...")
+    _run_step("imports", _import_modules)
+    _run_step("search_index", _build_search_index)
+    if WARMUP_COT:
+        _run_step("cot", _load_cot)
+    if WARMUP_SCREENER_POOL:
+        _run_step("screener_pool", _start_screener_pool)
+
+    prefetch = list(tickers or []) if WARMUP_PREFETCH_ASSETS else []
+    prefetch += [t for t in WARMUP_WATCHLIST if t not in prefetch]
+    if prefetch:
+        _run_step("histories", lambda: _prefetch_histories(prefetch))
+
+    with _LOCK:
+        WARMUP_STATE["status"] = "ready"
+        WARMUP_STATE["finished_at"] = time.time()
+    print(f"Warm-up: ready after {WARMUP_STATE['finished_at'] - WARMUP_STATE['started_at']:.1f}s")
+
+
+def start_warmup(tickers=None):
+    """Runs the warm-up in a background thread so the server can answer health checks meanwhile."""
+    if not WARMUP_ENABLED:
+        with _LOCK:
+            WARMUP_STATE["status"] = "ready"
+        return None
+    thread = threading.Thread(target=run_warmup, args=(tickers,), name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    return WARMUP_STATE["status"] == "ready"
+
+
+def get_warmup_state():
+    with _LOCK:
+        state = dict(WARMUP_STATE)
+        state["steps"] = {k: dict(v) for k, v in WARMUP_STATE["steps"].items()}
+    return state
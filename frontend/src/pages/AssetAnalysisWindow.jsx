@@ -71,7 +71,7 @@ const AssetCotView = ({ ticker, category, onSignalsChange }) => {
             setLoading(true);
             try {
                 const response = await axios.get(apiUrl(`/cot/${ticker}`), {
-                    params: { report_type: reportType, lookback: lookback }
+                    params: { report_type: reportType, lookback: lookback, format: 'rows' }
                 });
                 setCotData(response.data.data);
             } catch (err) {
@@ -146,7 +146,7 @@ const AssetCotView = ({ asset }) => {
             setLoading(true);
             try {
                 const response = await axios.get(apiUrl(`/cot/${asset.ticker}`), {
-                    params: { report_type: reportType, lookback: lookback }
+                    params: { report_type: reportType, lookback: lookback, format: 'rows' }
                 });
                 setCotData(response.data.data);
             } catch (err) {
@@ -139,7 +139,8 @@ const CotAnalysis = () => {
                 const response = await axios.get(apiUrl(`/cot/${selectedAsset.ticker}`), {
                     params: {
                         report_type: reportType,
-                        lookback: lookback
+                        lookback: lookback,
+                        format: 'rows'
                     }
                 });
                 setCotData(response.data.data);